@@ -4,23 +4,30 @@ class ClientAPI:
     The client must send specific requests defined in this class to get data or send data.
     """
 
-    # Get the name of the current user
-    GET_MY_NAME = "get_my_name"
+    # Get the name of the current user, and choose the encoding of the responses
+    GET_MY_NAME = "get_my_name" # + encodings supported by the client, the preferred one first
 
     # Create a new server with name "name". At the client, check name
-    NEW_SERVER = "new_server" # + server_name
+    NEW_SERVER = "new_server" # + server_name, optionally /board size/win length
 
-    # Get the list of the servers (multiple requests)
-    GET_SERVERS_LIST = "get_server_list"
+    # Get a page of the list of the servers, with the version of the list
+    # or the servers added, updated and removed since a version of the list
+    GET_SERVERS_LIST = "get_server_list" # + page/limit or since/version
 
     # Get the infos of a server
-    GET_SERVER = "get_server" # + server_name
+    GET_SERVER = "get_server" # + server_name, optionally /last_seq
 
     # Join the server named "named". No verification needed.
     JOIN_SERVER = "join_server" # + server_name
 
     # Make a move. Check if the player can play
-    MAKE_MOVE = "make_move" # + server_name/x/y
+    MAKE_MOVE = "make_move" # + server_name/x/y, optionally /last_seq
+
+    # Add a computer player to the server of the player, before the game starts
+    ADD_BOT = "add_bot" # + server_name
+
+    # Take back the place of a player in his game after a restart of the server, with the token of the handshake
+    RESUME = "resume" # + name/token
 
     # Start a game
     START_GAME = "start" # + server_name
@@ -28,5 +35,36 @@ class ClientAPI:
     # Exit the server during of before starting
     EXIT_SERVER = "exit_server"
 
+    # Receive every change of a server as soon as it happens, instead of polling GET_SERVER
+    SUBSCRIBE = "subscribe" # + server_name
+
+    # Stop receiving the changes of a server
+    UNSUBSCRIBE = "unsubscribe" # + server_name
+
+    # Watch a game without playing: the moves are pushed as deltas and the other changes as snapshots
+    WATCH = "watch" # + server_name
+
+    # Stop watching a game
+    UNWATCH = "unwatch" # + server_name
+
+    # Wait for a game of a number of players: it is created and started once enough players wait, and its state is
+    # pushed to them with the event "match"
+    QUICK_MATCH = "quick_match" # + optionally number of players (2 by default)
+
+    # Stop waiting for a game
+    CANCEL_MATCH = "cancel_match"
+
+    # Get a page of the list of the games archived, the newest first
+    LIST_REPLAYS = "list_replays" # + page/limit
+
+    # Get a game archived and its moves, a part of them at a time
+    GET_REPLAY = "get_replay" # + game id, optionally /first move/number of moves
+
+    # Get the metrics of the server: connections, games, and count and latencies of each request
+    GET_STATS = "get_stats"
+
+    # Answer the ping pushed by the server to a silent connection: a connection silent for too long is closed
+    PING = "ping"
+
     # Disconnect from the server
     QUIT = "quit"
\ No newline at end of file
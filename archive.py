@@ -0,0 +1,303 @@
+"""
+Archive of the games played on the server, to list them and replay them move by move.
+
+When the last player leaves a started game, the game is appended to the archive file as one record:
+
+    length      4 bytes, bytes of the record after this field
+    started_at  8 bytes, time of the start (seconds since the epoch, float)
+    size        1 byte, rows of the board
+    win_length  1 byte, aligned symbols needed to win
+    winner      1 byte, symbol of the winner, 0 if nobody won
+    moves       2 bytes, number of moves
+    name        1 byte of length, then the name in UTF-8
+    players     1 byte of count, then 1 byte of length and the name in UTF-8 of each player, by symbol
+    moves       7 bytes per move (game.MOVE_RECORD): symbol, cell index and milliseconds since the previous move
+
+A game of 3x3 cells takes about 100 bytes, so a million games fit in about 100 MB. The games are numbered in the
+order of the file. The server only keeps the offset of each game in memory (8 bytes per game), and the headers and
+the moves are read from the file when they are asked for, so a replay never loads the whole archive.
+"""
+
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+from typing import Iterator
+
+from game import MOVE_RECORD, Game
+
+# Name of the archive file in its directory
+ARCHIVE_NAME = "games.arc"
+
+# Seconds between two writes of the games archived to the file
+FLUSH_INTERVAL = 0.1
+
+# Fixed part of a record: length, started_at, size, win_length, winner and number of moves
+RECORD_HEADER = struct.Struct(">IdBBBH")
+
+# Bytes of moves read at once during a replay
+READ_SIZE = MOVE_RECORD.size * 512
+
+def pack_string(text: str) -> bytes:
+    """
+    Encode a string of the archive: its length on 1 byte, then its first 255 bytes in UTF-8
+    :param text: string to encode
+    :return: the encoded string
+    """
+    encoded = text.encode()[:255]
+    return bytes([len(encoded)]) + encoded
+
+def encode_game(game: Game) -> bytes:
+    """
+    Encode a started game as a record of the archive. The lock of the game must be held.
+    :param game: Game object
+    :return: the record
+    """
+    winner = game.bitboard.get(*game.winner[1][0]) if game.winner[0] != 0 else 0
+    players = [game.players_by_symbol[symbol].name for symbol in sorted(game.players_by_symbol)]
+
+    strings = pack_string(game.name) + bytes([len(players)]) + b"".join(pack_string(player) for player in players)
+
+    body_length = RECORD_HEADER.size - 4 + len(strings) + len(game.history)
+    return RECORD_HEADER.pack(body_length, game.started_at or 0.0, game.bitboard.size, game.win_length, winner,
+                              len(game.history) // MOVE_RECORD.size) + strings + game.history
+
+def read_header(file, offset: int, file_size: int) -> dict | None:
+    """
+    Read the description of the game recorded at an offset of the archive
+    :param file: archive file opened in binary mode
+    :param offset: Offset of the record
+    :param file_size: Bytes of the file
+    :return: dict of the name, the players, the size, the win length, the winner symbol, the number of moves and the
+    start time of the game, with the offset of its moves and of the next record, or None if the record is incomplete
+    """
+    file.seek(offset)
+    fixed = file.read(RECORD_HEADER.size)
+    if len(fixed) < RECORD_HEADER.size:
+        return None
+    length, started_at, size, win_length, winner, moves = RECORD_HEADER.unpack(fixed)
+
+    variable = file.read(length - (RECORD_HEADER.size - 4) - moves * MOVE_RECORD.size)
+    position = 0
+
+    def next_string() -> str:
+        nonlocal position
+        string_length = variable[position]
+        position += 1 + string_length
+        return variable[position - string_length:position].decode(errors="replace")
+
+    try:
+        name = next_string()
+        count = variable[position]
+        position += 1
+        players = [next_string() for _ in range(count)]
+    except IndexError:
+        return None
+
+    end = offset + 4 + length
+    if file_size < end:
+        return None
+
+    return {"name": name,
+            "players": players,
+            "size": size,
+            "win_length": win_length,
+            "winner": winner,
+            "moves": moves,
+            "started_at": started_at,
+            "moves_offset": end - moves * MOVE_RECORD.size,
+            "end": end}
+
+def iter_games(path: str) -> Iterator[tuple[int, int, dict]]:
+    """
+    Read the descriptions of the games of an archive file one by one, until its end or an incomplete record
+    :param path: Path of the archive file
+    :return: an iterator of (number of the game, offset of its record, description as read_header)
+    """
+    with open(path, "rb") as file:
+        file_size = os.fstat(file.fileno()).st_size
+        offset, game_id = 0, 0
+        while True:
+            header = read_header(file, offset, file_size)
+            if header is None:
+                return
+            yield game_id, offset, header
+            offset, game_id = header["end"], game_id + 1
+
+def read_moves(file, header: dict, first: int = 0,
+               count: int | None = None) -> Iterator[tuple[int, int, int, int]]:
+    """
+    Read the moves of a game one by one, a few hundred moves at a time
+    :param file: archive file opened in binary mode
+    :param header: Description of the game, as read_header
+    :param first: Index of the first move read
+    :param count: Maximum number of moves read, None to read them until the end of the game
+    :return: an iterator of (symbol, x, y, milliseconds since the previous move)
+    """
+    last = header["moves"] if count is None else min(header["moves"], first + count)
+    size = header["size"]
+
+    file.seek(header["moves_offset"] + first * MOVE_RECORD.size)
+    remaining = (last - first) * MOVE_RECORD.size
+    while remaining > 0:
+        chunk = file.read(min(READ_SIZE, remaining))
+        if not chunk:
+            return
+        remaining -= len(chunk)
+        for symbol, cell, elapsed in MOVE_RECORD.iter_unpack(chunk):
+            yield symbol, cell // size, cell % size, elapsed
+
+def iter_moves(path: str, header: dict, first: int = 0,
+               count: int | None = None) -> Iterator[tuple[int, int, int, int]]:
+    """
+    Read the moves of a game one by one, opening the archive file
+    :param path: Path of the archive file
+    :param header: Description of the game, as read_header
+    :param first: Index of the first move read
+    :param count: Maximum number of moves read, None to read them until the end of the game
+    :return: an iterator of (symbol, x, y, milliseconds since the previous move)
+    """
+    with open(path, "rb") as file:
+        yield from read_moves(file, header, first, count)
+
+class Archive:
+    """
+    Append-only archive of the games of the server.
+    The games are appended in memory while the lock of the game is held, and written to the file by a background
+    thread every flush interval.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = FLUSH_INTERVAL):
+        """
+        :param directory: Directory of the archive file, created if needed
+        :param flush_interval: Seconds between two writes of the games archived to the file
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.path: str = os.path.join(directory, ARCHIVE_NAME)
+        self.flush_interval: float = flush_interval
+
+        # Offset of the record of each game, by number of the game
+        self.offsets: array = array("Q")
+        self.end: int = 0
+        if os.path.exists(self.path):
+            for _, offset, header in iter_games(self.path):
+                self.offsets.append(offset)
+                self.end = header["end"]
+
+            # A record torn by a crash is cut, so the next ones are readable
+            if os.path.getsize(self.path) > self.end:
+                logging.warning(f"The archive {self.path} is cut after {len(self.offsets)} games")
+                os.truncate(self.path, self.end)
+
+        # Records appended and not written yet, and bytes written to the file
+        self.pending: list[bytes] = list()
+        self.written: int = self.end
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.file = open(self.path, "ab")
+
+        threading.Thread(target=self._flush_loop, name="archive", daemon=True).start()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def on_game_event(self, game: Game, event: str):
+        """
+        Observer of the games, archiving a started game when its last player leaves it
+        :param game: Game object that changed, with its lock held
+        :param event: Name of the change
+        :return: None
+        """
+        if event == "exit" and not game.players and game.has_started:
+            # Called while the game is removed: a game that cannot be archived must not stop its removal
+            try:
+                record = encode_game(game)
+            except struct.error:
+                logging.exception(f"Cannot archive the game {game.name}")
+                return
+            self.append(record)
+
+    def append(self, record: bytes) -> int:
+        """
+        Add a game to the archive
+        :param record: Record of the game, from encode_game
+        :return: the number of the game
+        """
+        with self.lock:
+            self.offsets.append(self.end)
+            self.end += len(record)
+            self.pending.append(record)
+            return len(self.offsets) - 1
+
+    def flush(self):
+        """
+        Write the games appended since the last call to the file
+        :return: None
+        """
+        with self.write_lock:
+            with self.lock:
+                records, self.pending = self.pending, list()
+            if records:
+                self.file.write(b"".join(records))
+                self.file.flush()
+                self.written += sum(len(record) for record in records)
+
+    def header(self, game_id: int) -> dict | None:
+        """
+        Read the description of a game
+        :param game_id: Number of the game
+        :return: dict as read_header with the number of the game in "id", or None if there is no such game
+        """
+        headers = self.headers([game_id])
+        return headers[0] if headers else None
+
+    def headers(self, game_ids: list[int]) -> list[dict]:
+        """
+        Read the descriptions of several games
+        :param game_ids: Numbers of the games
+        :return: list of dicts as read_header with the number of the game in "id", without the unknown games
+        """
+        game_ids = [game_id for game_id in game_ids if 0 <= game_id < len(self.offsets)]
+
+        # The games may not be written yet
+        if any(self.offsets[game_id] >= self.written for game_id in game_ids):
+            self.flush()
+
+        headers = list()
+        with open(self.path, "rb") as file:
+            for game_id in game_ids:
+                header = read_header(file, self.offsets[game_id], self.written)
+                if header is not None:
+                    header["id"] = game_id
+                    headers.append(header)
+        return headers
+
+    def moves(self, header: dict, first: int = 0, count: int | None = None) -> Iterator[tuple[int, int, int, int]]:
+        """
+        Read the moves of a game one by one
+        :param header: Description of the game, from header
+        :param first: Index of the first move read
+        :param count: Maximum number of moves read, None to read them until the end of the game
+        :return: an iterator of (symbol, x, y, milliseconds since the previous move)
+        """
+        return iter_moves(self.path, header, first, count)
+
+    def list_games(self, offset: int = 0, limit: int = 50) -> list[dict]:
+        """
+        Describe the last games archived, the newest first
+        :param offset: Number of games to skip
+        :param limit: Maximum number of games to describe
+        :return: list of dicts as header
+        """
+        last = len(self.offsets) - 1 - offset
+        return self.headers(list(range(last, max(last - limit, -1), -1)))
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                logging.exception("Cannot write the archive")
@@ -0,0 +1,145 @@
+"""
+Check the batched simulator against Game, then compare the games per second of both.
+
+Differential check: --check-games games of each variant are played move by move both in a BatchSimulator and in Game
+objects, with random moves including moves outside of the board and on taken cells, until every board is full (so
+moves are also made after a winner). After every move, the result of the move, the board, the player to move and the
+winner with his cells must be the same.
+
+Throughput: random games are played until a winner or a full board, one Game object at a time (with a move order
+drawn in advance, so only Game is timed) and in batches of --batch games.
+
+Run from the root of the repository (NumPy is needed):
+    python -m benchmark.batch_simulator --games 100000
+"""
+import argparse
+import random
+import time
+
+import numpy
+
+from game import Game
+from player import Player
+from simulator import BatchSimulator
+
+# Variants checked and timed: (players, size of the board or None for players + 1, win length)
+VARIANTS = ((2, None, 3), (3, None, 3), (2, 8, 4), (2, 15, 5), (4, 19, 5))
+
+def new_game(players: int, size: int | None, win_length: int) -> Game:
+    """
+    Create and start a game
+    :param players: Number of players
+    :param size: Size of the board, None for players + 1
+    :param win_length: Number of aligned symbols needed to win
+    :return: Game object
+    """
+    game = Game("simulated", size, win_length)
+    for i in range(players):
+        game.add_player(Player(("simulator", i), f"Player{i}"))
+    game.start()
+    return game
+
+def check_variant(players: int, size: int | None, win_length: int, games: int, rng: random.Random) -> int:
+    """
+    Play the same random moves in a batch and in Game objects, and compare them after every move
+    :param players: Number of players
+    :param size: Size of the board, None for players + 1
+    :param win_length: Number of aligned symbols needed to win
+    :param games: Number of games played
+    :param rng: Random generator
+    :return: the number of moves compared
+    """
+    batch = BatchSimulator(games, players, size, win_length)
+    references = [new_game(players, size, win_length) for _ in range(games)]
+    size = batch.size
+    compared = 0
+
+    while not all(game.bitboard.is_full() for game in references):
+        # Moves of every game: a free cell most of the time, sometimes a taken cell or a cell outside of the board
+        playing = [index for index, game in enumerate(references) if not game.bitboard.is_full()]
+        moves = list()
+        for index in playing:
+            board = references[index].board
+            choice = rng.random()
+            if choice < 0.05:
+                moves.append((rng.choice((-1, size)), rng.randrange(size)))
+            elif choice < 0.15:
+                moves.append((rng.randrange(size), rng.randrange(size)))
+            else:
+                moves.append(rng.choice([(x, y) for x in range(size) for y in range(size) if not board[x][y]]))
+
+        made = batch.make_moves([x for x, _ in moves], [y for _, y in moves], playing)
+        for index, (x, y), batch_made in zip(playing, moves, made):
+            game = references[index]
+            assert game.make_move(game.current_player, x, y) == batch_made, (index, x, y)
+            assert game.board == batch.board(index)
+            assert game.symbols[game.current_player] == batch.current[index]
+
+            name, cells = game.winner
+            assert (game.players_by_symbol[int(batch.winner[index])].name if batch.winner[index] else 0) == name
+            assert cells == batch.winner_cells(index), (cells, batch.winner_cells(index))
+            compared += 1
+
+    return compared
+
+def play_games(players: int, size: int | None, win_length: int, games: int, rng: random.Random) -> int:
+    """
+    Play random games one Game object at a time, until a winner or a full board
+    :param players: Number of players
+    :param size: Size of the board, None for players + 1
+    :param win_length: Number of aligned symbols needed to win
+    :param games: Number of games played
+    :param rng: Random generator
+    :return: the number of moves made
+    """
+    moves = 0
+    board_size = size if size is not None else max(players + 1, win_length)
+    cells = [(x, y) for x in range(board_size) for y in range(board_size)]
+    for _ in range(games):
+        order = rng.sample(cells, len(cells))
+        game = new_game(players, size, win_length)
+        for x, y in order:
+            game.make_move(game.current_player, x, y)
+            moves += 1
+            if game.winner[0] != 0:
+                break
+    return moves
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark the batched simulator")
+    parser.add_argument("--games", type=int, default=100000, help="games played in batches for each variant")
+    parser.add_argument("--batch", type=int, default=10000, help="games of a batch")
+    parser.add_argument("--game-objects", type=int, default=2000, help="games played with Game for each variant")
+    parser.add_argument("--check-games", type=int, default=200, help="games of the differential check of a variant")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    generator = numpy.random.default_rng(args.seed)
+
+    for players, size, win_length in VARIANTS:
+        compared = check_variant(players, size, win_length, args.check_games, rng)
+        print(f"{players} players, size {size or players + 1}, {win_length} in a row: {compared} moves identical "
+              f"to Game")
+
+    print(f"{'players':>7} {'size':>4} {'length':>6} {'Game (games/s)':>15} {'batch (games/s)':>16} "
+          f"{'batch (moves/s)':>16} {'speedup':>8} {'won':>5}")
+    for players, size, win_length in VARIANTS:
+        start = time.perf_counter()
+        play_games(players, size, win_length, args.game_objects, rng)
+        game_rate = args.game_objects / (time.perf_counter() - start)
+
+        moves, won, played = 0, 0, 0
+        start = time.perf_counter()
+        while played < args.games:
+            batch = BatchSimulator(min(args.batch, args.games - played), players, size, win_length)
+            moves += batch.play_random(generator)
+            won += int((batch.winner != 0).sum())
+            played += len(batch)
+        elapsed = time.perf_counter() - start
+
+        print(f"{players:>7} {size or players + 1:>4} {win_length:>6} {game_rate:>15.0f} {played / elapsed:>16.0f} "
+              f"{moves / elapsed:>16.0f} {played / elapsed / game_rate:>7.1f}x {won / played:>5.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Compare the memory and the move cost of a board stored as nested lists with the bitboard used by Game.
+
+For each size, random moves are played until the board is half full. The nested lists board uses the
+incremental winner check on lists, the bitboard uses BitBoard.winning_line_at.
+
+Run from the root of the repository:
+    python -m benchmark.board_representation --games 200
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from bitboard import BitBoard
+from game import WIN_LENGTH
+
+# Directions of the lines going through a cell: row, column, diagonal and anti-diagonal
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+def list_move(board: list[list[int]], x: int, y: int, symbol: int) -> bool:
+    """
+    Play a move on a nested lists board and check the lines going through the cell
+    :param board: matrix of symbols
+    :param x: The x-position of the move
+    :param y: The y-position of the move
+    :param symbol: The symbol of the player
+    :return: True if the move makes a line
+    """
+    if board[x][y] != 0:
+        return False
+    board[x][y] = symbol
+
+    size = len(board)
+    for dx, dy in DIRECTIONS:
+        count = 1
+        for sign in (1, -1):
+            i, j = x + sign * dx, y + sign * dy
+            while 0 <= i < size and 0 <= j < size and board[i][j] == symbol:
+                count += 1
+                i, j = i + sign * dx, j + sign * dy
+        if count >= WIN_LENGTH:
+            return True
+    return False
+
+def bitboard_move(board: BitBoard, x: int, y: int, symbol: int) -> bool:
+    """
+    Play a move on a bitboard and check the lines going through the cell
+    :param board: BitBoard object
+    :param x: The x-position of the move
+    :param y: The y-position of the move
+    :param symbol: The symbol of the player
+    :return: True if the move makes a line
+    """
+    if not board.is_free(x, y):
+        return False
+    board.place(x, y, symbol)
+    return board.winning_line_at(x, y, WIN_LENGTH, symbol)[0] != 0
+
+def measure_memory(build) -> int:
+    """
+    Measure the memory allocated by a function
+    :param build: function building a board
+    :return: number of bytes allocated and still used
+    """
+    tracemalloc.start()
+    board = build()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del board
+    return size
+
+def half_filled(size: int, rng: random.Random) -> list[tuple[int, int, int]]:
+    """
+    Random moves filling half of a board
+    :param size: Size of the board
+    :param rng: Random generator
+    :return: list of (x, y, symbol)
+    """
+    players = size - 1
+    cells = [(x, y) for x in range(size) for y in range(size)]
+    rng.shuffle(cells)
+    return [(x, y, i % players + 1) for i, (x, y) in enumerate(cells[:size * size // 2])]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the board representations")
+    parser.add_argument("--games", type=int, default=200, help="random boards for each size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    print(f"{'size':>4} {'list (B)':>9} {'bitboard (B)':>13} {'list (us/move)':>15} {'bitboard (us/move)':>19}")
+    for size in range(3, 19):
+        games = [half_filled(size, rng) for _ in range(args.games)]
+
+        def build_list():
+            board = [[0 for _ in range(size)] for _ in range(size)]
+            for x, y, symbol in games[0]:
+                board[x][y] = symbol
+            return board
+
+        def build_bitboard():
+            board = BitBoard(size)
+            for x, y, symbol in games[0]:
+                board.place(x, y, symbol)
+            return board
+
+        list_memory = measure_memory(build_list)
+        bitboard_memory = measure_memory(build_bitboard)
+
+        total_moves = sum(len(moves) for moves in games)
+
+        start = time.perf_counter()
+        for moves in games:
+            board = [[0 for _ in range(size)] for _ in range(size)]
+            for x, y, symbol in moves:
+                list_move(board, x, y, symbol)
+        list_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for moves in games:
+            board = BitBoard(size)
+            for x, y, symbol in moves:
+                bitboard_move(board, x, y, symbol)
+        bitboard_time = time.perf_counter() - start
+
+        print(f"{size:>4} {list_memory:>9} {bitboard_memory:>13} "
+              f"{list_time / total_moves * 1e6:>15.2f} {bitboard_time / total_moves * 1e6:>19.2f}")
+
+if __name__ == '__main__':
+    main()
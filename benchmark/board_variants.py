@@ -0,0 +1,114 @@
+"""
+Compare the winner checks of the boards of every size and win length: the full scan with the shifts of the bitmasks,
+the full scan with the sliding windows of NumPy, and the incremental check of the cell of the last move. The sizes
+chosen at NEW_SERVER go up to 32 rows, the default boards have one more row than the players (up to 255), so the
+boards are also filled by one less player than their rows, as a default board.
+
+For each size, win length and number of players, random positions without any winning line are built by filling
+--fill of the cells, then each check is timed on them (--players 0 for one less player than the rows). Both full
+scans must find the same line (or none) on every position, including positions with a winner.
+
+Run from the root of the repository (NumPy is needed for its column):
+    python -m benchmark.board_variants --positions 20
+"""
+import argparse
+import random
+import time
+
+from bitboard import NUMPY_MIN_LENGTH, NUMPY_MIN_SIZE, BitBoard, numpy
+
+def random_position(size: int, length: int, symbols: int, fill: float, rng: random.Random,
+                    winner: bool = False) -> tuple[BitBoard, list[tuple[int, int, int]]]:
+    """
+    Fill a board at random
+    :param size: Number of rows and columns of the board
+    :param length: Number of aligned symbols needed to win
+    :param symbols: Number of players
+    :param fill: Part of the cells filled
+    :param rng: Random generator
+    :param winner: False to skip the moves making a winning line
+    :return: the board and the (x, y, symbol) of its moves
+    """
+    board = BitBoard(size)
+    moves = list()
+    cells = [(x, y) for x in range(size) for y in range(size)]
+    rng.shuffle(cells)
+    for x, y in cells[:int(len(cells) * fill)]:
+        symbol = rng.randint(1, symbols)
+        board.place(x, y, symbol)
+        if not winner and board.winning_line_at(x, y, length, symbol)[0]:
+            # The cell is emptied again
+            bit = 1 << board.index(x, y)
+            board.masks[symbol] &= ~bit
+            board.occupied &= ~bit
+            continue
+        moves.append((x, y, symbol))
+    return board, moves
+
+def time_check(check, arguments: list[tuple], repeat: int) -> float:
+    """
+    Time a check
+    :param check: Function checked
+    :param arguments: Arguments of each call
+    :param repeat: Calls for each arguments
+    :return: the mean time of a call, in microseconds
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for argument in arguments:
+            check(*argument)
+    return (time.perf_counter() - start) / (repeat * len(arguments)) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the winner checks of the board variants")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[3, 5, 8, 10, 15, 19, 24, 32, 48, 64, 96, 128, 192, 255])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[3, 4, 5])
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 16, 0],
+                        help="players filling the boards, 0 for one less than the rows as a default board")
+    parser.add_argument("--positions", type=int, default=20, help="random positions of each variant")
+    parser.add_argument("--repeat", type=int, default=5, help="checks of each position")
+    parser.add_argument("--fill", type=float, default=0.5, help="part of the cells filled")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if numpy is None:
+        print("NumPy is not installed: only the bitmasks are timed")
+    print(f"find_winning_line uses NumPy from {NUMPY_MIN_SIZE}x{NUMPY_MIN_SIZE} cells and {NUMPY_MIN_LENGTH} aligned "
+          f"symbols when it is installed")
+    print(f"{'size':>4} {'length':>6} {'players':>7} {'bitmasks (us)':>14} {'numpy (us)':>11} {'faster':>12} "
+          f"{'last move (us)':>15}")
+
+    for size in args.sizes:
+        for length in args.lengths:
+            if length > size:
+                continue
+            for players in args.players:
+                players = players or size - 1
+                positions = [random_position(size, length, players, args.fill, rng) for _ in range(args.positions)]
+                boards = [(board, length) for board, _ in positions]
+
+                # The lines found by both scans are compared on positions with winners too
+                if numpy is not None:
+                    for board, _ in positions + [random_position(size, length, players, args.fill, rng, True)
+                                                 for _ in range(args.positions)]:
+                        assert board.find_winning_line_bits(length) == board.find_winning_line_numpy(length)
+
+                bits_us = time_check(BitBoard.find_winning_line_bits, boards, args.repeat)
+                last_moves = [(board, x, y, length, symbol) for board, moves in positions
+                              for x, y, symbol in moves[-1:]]
+                incremental_us = time_check(BitBoard.winning_line_at, last_moves, args.repeat)
+
+                if numpy is not None:
+                    numpy_us = time_check(BitBoard.find_winning_line_numpy, boards, args.repeat)
+                    faster = f"{'numpy' if numpy_us < bits_us else 'bitmasks'} " \
+                             f"{max(bits_us, numpy_us) / min(bits_us, numpy_us):.1f}x"
+                    print(f"{size:>4} {length:>6} {players:>7} {bits_us:>14.1f} {numpy_us:>11.1f} {faster:>12} "
+                          f"{incremental_us:>15.2f}")
+                else:
+                    print(f"{size:>4} {length:>6} {players:>7} {bits_us:>14.1f} {'-':>11} {'-':>12} "
+                          f"{incremental_us:>15.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Measure the search of the bots: depth reached, positions searched per second and time used for a move.
+
+For boards of 3x3 to 17x17 cells (2 to 16 players), a few random moves are played, then the bot of the player to
+move chooses its move several times with the same time budget. The transposition table is kept between the moves,
+as on the server.
+
+Run from the root of the repository:
+    python -m benchmark.bot_search --time-budget 0.5
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmark.game_deltas import played_game
+from bot import Position, Searcher
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search of the bots")
+    parser.add_argument("--time-budget", type=float, default=0.5, help="maximum thinking time of a move in seconds")
+    parser.add_argument("--node-limit", type=int, default=200_000, help="maximum positions searched for a move")
+    parser.add_argument("--moves", type=int, default=5, help="moves searched for each board")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    print(f"{'board':>6} {'depth':>6} {'nodes/move':>11} {'nodes/s':>9} {'ms/move':>8} {'max ms':>7}")
+    for players in (2, 4, 8, 16):
+        game = played_game(players, rng, filled=0.1)
+        searcher = Searcher(args.seed)
+
+        depths, nodes, times = list(), list(), list()
+        for _ in range(args.moves):
+            position = Position.from_game(game)
+            start = time.perf_counter()
+            (x, y), result = searcher.choose_move(position, args.time_budget, args.node_limit)
+            times.append(time.perf_counter() - start)
+            depths.append(result["depth"])
+            nodes.append(result["nodes"])
+            game.make_move(game.current_player, x, y)
+
+        size = game.bitboard.size
+        print(f"{size:>3}x{size:<2} {statistics.mean(depths):>6.1f} {statistics.mean(nodes):>11,.0f} "
+              f"{sum(nodes) / sum(times):>9,.0f} {statistics.mean(times) * 1e3:>8.1f} {max(times) * 1e3:>7.1f}")
+
+if __name__ == '__main__':
+    main()
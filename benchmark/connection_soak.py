@@ -0,0 +1,195 @@
+"""
+Soak test of the lifecycle of the connections: clients killed at random must not leak anything on the server.
+
+A server is started in a subprocess with short heartbeat and idle timeout, then --threads threads open sessions in a
+loop until --duration seconds: each session takes a name, creates or joins one of a few games, may start it and play
+random moves, then ends in one of three ways:
+- quit: the client sends QUIT and closes its socket;
+- reset: the client closes its socket at once with a TCP reset, as a killed process;
+- silent: the client keeps its socket open and never sends or reads anything again, as a crashed host or a lost
+  network (a half-open connection). The server must close it after --idle-timeout seconds.
+Every --sample seconds the connections, games, players and threads of the server, its open files and its memory are
+printed. At the end every client is gone, and the counts of the server must be back to the ones of the start.
+
+Run from the root of the repository, for 24 hours:
+    python -m benchmark.connection_soak --duration 86400 --sample 600
+"""
+import argparse
+import os
+import random
+import socket
+import struct
+import threading
+import time
+
+from benchmark.server_engines import HOST, raise_file_limit, server_resources, start_server
+from game_client import GameClient
+from protocol import PUSH_ID, pack_frame, recv_frame
+
+# Names of the games used by the sessions, so they meet in the same games
+GAMES = 20
+
+def open_files(pid: int) -> int:
+    """
+    Count the files and sockets opened by a process (Linux only)
+    :param pid: id of the process
+    :return: the number of file descriptors, 0 if not available
+    """
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return 0
+
+def call(connection: socket.socket, request_id: int, msg: str) -> bytes:
+    """
+    Send a request on a raw socket and wait for its response, skipping the pushed messages
+    :param connection: socket connected to the server
+    :param request_id: id of the request
+    :param msg: request to send
+    :return: payload of the response
+    """
+    connection.sendall(pack_frame(request_id, msg.encode()))
+    while True:
+        response_id, payload = recv_frame(connection)
+        if response_id != PUSH_ID:
+            return payload
+
+def run_session(port: int, rng: random.Random, silent: list[tuple[float, socket.socket]], counts: dict[str, int]):
+    """
+    Play a short session, then end it with a quit, a reset or silence
+    :param port: Port of the server
+    :param rng: Random generator of the thread
+    :param silent: list where the silent sockets are appended with the time they became silent
+    :param counts: number of sessions by way they ended
+    :return: None
+    """
+    connection = socket.create_connection((HOST, port), timeout=10)
+    try:
+        call(connection, 1, "get_my_name/json")
+        game = f"Soak{rng.randrange(GAMES)}"
+        if b'"failed"' in call(connection, 2, f"new_server/{game}"):
+            call(connection, 3, f"join_server/{game}")
+        if rng.random() < 0.5:
+            call(connection, 4, f"start/{game}")
+        for request_id in range(5, 5 + rng.randrange(6)):
+            call(connection, request_id, f"make_move/{game}/{rng.randrange(4)}/{rng.randrange(4)}")
+        if rng.random() < 0.3:
+            call(connection, 20, f"subscribe/{game}")
+    except OSError:
+        connection.close()
+        counts["errors"] += 1
+        return
+
+    end = rng.choice(("quit", "reset", "silent"))
+    counts[end] += 1
+    if end == "quit":
+        try:
+            connection.sendall(pack_frame(30, b"quit"))
+        except OSError:
+            pass
+        connection.close()
+    elif end == "reset":
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        connection.close()
+    else:
+        silent.append((time.monotonic(), connection))
+
+def run_sessions(port: int, seed: int, deadline: float, delay: float, idle_timeout: float, counts: dict[str, int]):
+    """
+    Open sessions until the deadline
+    :param port: Port of the server
+    :param seed: Seed of the random generator of the thread
+    :param deadline: time.monotonic at which the thread stops
+    :param delay: Seconds between two sessions
+    :param idle_timeout: Idle timeout of the server, the silent sockets are closed on the client side after twice it
+    :param counts: number of sessions by way they ended
+    :return: None
+    """
+    rng = random.Random(seed)
+    silent: list[tuple[float, socket.socket]] = list()
+    while time.monotonic() < deadline:
+        run_session(port, rng, silent, counts)
+
+        # The server closed the silent connections long ago, the client can release its sockets
+        while silent and time.monotonic() - silent[0][0] > 2 * idle_timeout:
+            silent.pop(0)[1].close()
+        time.sleep(delay)
+
+    for _, connection in silent:
+        connection.close()
+
+def sample(monitor: GameClient, pid: int) -> dict:
+    """
+    Read the counts of the server
+    :param monitor: client connected to the server during the whole test
+    :param pid: id of the server process
+    :return: dict of the counts
+    """
+    stats = monitor.call("get_stats")
+    threads, rss = server_resources(pid)
+    return {"connections": stats["connections"], "games": stats["games"], "players": stats["players"],
+            "threads": threads, "files": open_files(pid), "rss_kb": rss, "timeouts": stats["idle_timeouts"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test of the lifecycle of the connections")
+    parser.add_argument("--engine", default="threaded", help="engine of the server")
+    parser.add_argument("--port", type=int, default=5112, help="port of the server started")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of sessions")
+    parser.add_argument("--threads", type=int, default=8, help="threads opening sessions")
+    parser.add_argument("--delay", type=float, default=0.01, help="seconds between two sessions of a thread")
+    parser.add_argument("--sample", type=float, default=10.0, help="seconds between two samples of the server")
+    parser.add_argument("--heartbeat-interval", type=float, default=1.0, help="heartbeat interval of the server")
+    parser.add_argument("--idle-timeout", type=float, default=3.0, help="idle timeout of the server")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    raise_file_limit()
+    server = start_server(args.engine, args.port, ["--heartbeat-interval", str(args.heartbeat_interval),
+                                                   "--idle-timeout", str(args.idle_timeout)])
+    try:
+        monitor = GameClient(HOST, args.port, reconnect=False)
+        monitor.connect().result(10)
+        start = sample(monitor, server.pid)
+
+        columns = ("connections", "games", "players", "threads", "files", "rss_kb", "timeouts")
+        print(f"{'seconds':>8} {'sessions':>9} " + " ".join(f"{column:>11}" for column in columns))
+
+        def report(elapsed: float, counts: dict[str, int], values: dict):
+            print(f"{elapsed:>8.0f} {sum(counts.values()):>9} " + " ".join(f"{values[column]:>11}"
+                                                                         for column in columns))
+
+        counts = {"quit": 0, "reset": 0, "silent": 0, "errors": 0}
+        began = time.monotonic()
+        deadline = began + args.duration
+        threads = [threading.Thread(target=run_sessions, args=(args.port, args.seed + index, deadline, args.delay,
+                                                               args.idle_timeout, counts))
+                   for index in range(args.threads)]
+        for thread in threads:
+            thread.start()
+
+        report(0, counts, start)
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(min(args.sample, max(0.0, deadline - time.monotonic()) + 0.1))
+            report(time.monotonic() - began, counts, sample(monitor, server.pid))
+        for thread in threads:
+            thread.join()
+
+        # Every silent connection left is closed by the server after the idle timeout
+        time.sleep(args.idle_timeout + 2 * args.heartbeat_interval + 1)
+        end = sample(monitor, server.pid)
+        report(time.monotonic() - began, counts, end)
+        monitor.close()
+    finally:
+        server.kill()
+        server.wait()
+
+    print(f"Sessions: {counts['quit']} quit, {counts['reset']} reset, {counts['silent']} silent, "
+          f"{counts['errors']} failed")
+    leaks = [f"{column} {start[column]} -> {end[column]}" for column in ("connections", "games", "players",
+                                                                          "threads", "files")
+             if end[column] > start[column]]
+    print("Leaks: " + ", ".join(leaks) if leaks else "No leak: the counts of the server are back to the start")
+    print(f"Memory: {start['rss_kb']} KB -> {end['rss_kb']} KB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Compare the size and the CPU cost of the JSON and binary encodings of the responses.
+
+The messages measured are the ones the server sends the most: the state of a game (sent after every move and
+pushed to the subscribers) for boards of 3x3 to 18x18 cells half filled, and a page of the list of servers.
+
+Run from the root of the repository:
+    python -m benchmark.encoding --repeat 2000
+"""
+import argparse
+import random
+import time
+
+from game import Game
+from game_registry import GameRegistry
+from player import Player
+from serialization import ENCODINGS, JSON, decode, encode
+from server import game_state, lobby_summary
+
+def played_game(size: int, rng: random.Random) -> Game:
+    """
+    Build a started game whose board is half full
+    :param size: Size of the board
+    :param rng: Random generator
+    :return: Game object
+    """
+    game = Game(f"Game{size}")
+    for i in range(size - 1):
+        game.add_player(Player(("benchmark", i), f"Player{i}"))
+    game.start()
+
+    cells = [(x, y) for x in range(size) for y in range(size)]
+    rng.shuffle(cells)
+    for i, (x, y) in enumerate(cells[:size * size // 2]):
+        game.bitboard.place(x, y, i % (size - 1) + 1)
+    return game
+
+def lobby_page(games: int, rng: random.Random) -> dict:
+    """
+    Build a page of the list of servers
+    :param games: Number of games of the page
+    :param rng: Random generator
+    :return: the response to get_server_list
+    """
+    registry = GameRegistry()
+    for i in range(games):
+        game = registry.create(f"Server{i}")
+        for j in range(rng.randint(1, 4)):
+            registry.add_player(game, Player(("benchmark", i, j), f"Player{i}-{j}"))
+    return {"status": "success", "version": registry.version, "page": 0, "limit": games, "total": games,
+            "games": [lobby_summary(game) for game in registry.list_games(0, games)]}
+
+def measure(response: dict, encoding: str, repeat: int) -> tuple[int, float, float]:
+    """
+    Encode and decode a response several times
+    :param response: dict describing the response
+    :param encoding: JSON or BINARY
+    :param repeat: Number of encodings and decodings
+    :return: (bytes of the payload, microseconds per encoding, microseconds per decoding)
+    """
+    payload = encode(response, encoding)
+    assert decode(payload, encoding) == decode(encode(response, JSON), JSON)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encode(response, encoding)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode(payload, encoding)
+    decode_time = time.perf_counter() - start
+
+    return len(payload), encode_time / repeat * 1e6, decode_time / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the encodings of the responses")
+    parser.add_argument("--repeat", type=int, default=2000, help="encodings and decodings of each message")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    messages = list()
+    for size in range(3, 19):
+        response = {"status": "success", **game_state(played_game(size, rng))}
+        messages.append((f"move {size}x{size}", response))
+    for games in (10, 50, 500):
+        messages.append((f"lobby {games}", lobby_page(games, rng)))
+
+    print(f"{'message':>12} {'encoding':>8} {'bytes':>7} {'encode (us)':>12} {'decode (us)':>12}")
+    for label, response in messages:
+        for encoding in ENCODINGS:
+            size, encode_us, decode_us = measure(response, encoding, args.repeat)
+            print(f"{label:>12} {encoding:>8} {size:>7} {encode_us:>12.2f} {decode_us:>12.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Compare the size and the CPU cost of the replies to GET_SERVER and MAKE_MOVE with and without a sequence number.
+
+For boards of 3x3 to 17x17 cells (2 to 16 players), half of the board is played with real moves, then the reply
+is built and encoded for a client that knows:
+- nothing (snapshot: the whole board, the players and the winner, as before the sequence numbers),
+- the state before the last move, or before the last round of moves (delta: the moves since then),
+- the current state (not modified).
+
+Run from the root of the repository:
+    python -m benchmark.game_deltas --repeat 2000
+"""
+import argparse
+import random
+import time
+
+from game import Game
+from player import Player
+from serialization import ENCODINGS, encode
+from server import game_update
+
+def played_game(players: int, rng: random.Random, filled: float = 0.5) -> Game:
+    """
+    Build a started game and play random moves until a part of the board is full
+    :param players: Number of players, the board has players + 1 rows
+    :param rng: Random generator
+    :param filled: Part of the cells played
+    :return: Game object
+    """
+    game = Game(f"Game{players}")
+    for i in range(players):
+        game.add_player(Player(("benchmark", i), f"Player{i}"))
+    game.start()
+
+    size = game.bitboard.size
+    cells = [(x, y) for x in range(size) for y in range(size)]
+    rng.shuffle(cells)
+    for x, y in cells[:int(size * size * filled)]:
+        game.make_move(game.current_player, x, y)
+    return game
+
+def measure(game: Game, last_seq: int | None, encoding: str, repeat: int) -> tuple[str, int, float]:
+    """
+    Build and encode the reply of a game several times
+    :param game: Game object
+    :param last_seq: Sequence number known by the client, None for a snapshot
+    :param encoding: JSON or BINARY
+    :param repeat: Number of replies built
+    :return: (kind of update, bytes of the payload, microseconds per reply)
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response = {"status": "success"}
+        response.update(game_update(game, last_seq))
+        payload = encode(response, encoding)
+    elapsed = time.perf_counter() - start
+    return response["update"], len(payload), elapsed / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the replies with and without a sequence number")
+    parser.add_argument("--repeat", type=int, default=2000, help="replies built for each measure")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    print(f"{'board':>6} {'encoding':>8} {'known state':>12} {'update':>13} {'bytes':>7} {'us/reply':>9}")
+    for players in (2, 4, 8, 16):
+        game = played_game(players, rng)
+        size = game.bitboard.size
+        known_states = (("none", None), ("last move", game.seq - 1), ("last round", game.seq - players),
+                        ("current", game.seq))
+
+        for encoding in ENCODINGS:
+            for label, last_seq in known_states:
+                update, size_bytes, micros = measure(game, last_seq, encoding, args.repeat)
+                print(f"{size:>3}x{size:<2} {encoding:>8} {label:>12} {update:>13} {size_bytes:>7} {micros:>9.1f}")
+
+if __name__ == '__main__':
+    main()
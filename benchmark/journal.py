@@ -0,0 +1,207 @@
+"""
+Measure the cost of the journal on the moves, and the recovery time of the games with and without snapshots.
+
+1. Move latency: a server is started in a subprocess with and without --journal-dir, then 16 players play full games
+   on a 17x17 board, each one sending MAKE_MOVE on his turn. The p50/p95/p99 latencies of the moves are compared,
+   with the cost of a move in the process (GameRegistry.make_move with and without Journal.record).
+2. Recovery: histories of finished games are written to a journal, with a few games still running at the end, then
+   the games are rebuilt from the journal alone (one segment) and from a snapshot and the last segment.
+
+Run from the root of the repository:
+    python -m benchmark.journal --games 20 --history 10000 100000
+"""
+import argparse
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmark.server_engines import HOST, start_server
+from game_client import GameClient
+from game_registry import GameRegistry
+from journal import Journal
+from player import Player
+
+def percentile(values: list[float], fraction: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+def play_games(port: int, games: int, players: int, rng: random.Random) -> list[float]:
+    """
+    Play full games on a running server, each player moving on his turn
+    :param port: Port of the server
+    :param games: Number of games played
+    :param players: Number of players of each game
+    :param rng: Random generator
+    :return: the latencies of the moves in seconds
+    """
+    clients = [GameClient(HOST, port, reconnect=False) for _ in range(players)]
+    by_name = {client.connect().result(10)["name"]: client for client in clients}
+
+    latencies = list()
+    for number in range(games):
+        name = f"Journal{number}"
+        clients[0].call(f"new_server/{name}")
+        for client in clients[1:]:
+            client.call(f"join_server/{name}")
+        state = clients[0].call(f"start/{name}") and clients[0].call(f"get_server/{name}")
+
+        cells = [(x, y) for x in range(players + 1) for y in range(players + 1)]
+        rng.shuffle(cells)
+        current = state["current_player"]
+        for x, y in cells:
+            start = time.perf_counter()
+            state = by_name[current].call(f"make_move/{name}/{x}/{y}/{state['seq']}")
+            latencies.append(time.perf_counter() - start)
+            current = state["current_player"]
+            if state["winner"][0] != 0:
+                break
+
+        for client in clients:
+            client.call("exit_server")
+
+    for client in clients:
+        client.close()
+    return latencies
+
+def measure_in_process(moves: int, directory: str | None) -> float:
+    """
+    Measure GameRegistry.make_move in the process
+    :param moves: Number of moves made
+    :param directory: Directory of the journal, None to measure without journal
+    :return: microseconds per move
+    """
+    registry = GameRegistry()
+    journal = None
+    if directory is not None:
+        journal = Journal(directory)
+        journal.start()
+        registry.on_change = journal.record
+
+    players = [Player(("benchmark", i), f"Player{i}") for i in range(16)]
+    elapsed, made, number = 0.0, 0, 0
+    while made < moves:
+        game = registry.create(f"Game{number}", players[0])
+        for player in players[1:]:
+            registry.add_player(game, player)
+        registry.start(game)
+
+        cells = [(x, y) for x in range(17) for y in range(17)]
+        start = time.perf_counter()
+        for x, y in cells:
+            registry.make_move(game, game.current_player, x, y)
+        elapsed += time.perf_counter() - start
+        made += len(cells)
+
+        for player in players:
+            registry.remove_player(player)
+        number += 1
+
+    if journal is not None:
+        journal.close()
+    return elapsed / made * 1e6
+
+def write_history(directory: str, changes: int, live_games: int, segment_records: int, rng: random.Random):
+    """
+    Write a journal of finished 2 players games, then of games left running
+    :param directory: Directory of the journal
+    :param changes: Number of changes of the finished games
+    :param live_games: Number of games running at the end
+    :param segment_records: Changes in a segment of the journal
+    :param rng: Random generator
+    :return: None
+    """
+    registry = GameRegistry()
+    journal = Journal(directory, segment_records=segment_records)
+    journal.start()
+    registry.on_change = journal.record
+
+    def play(number: int, finish: bool):
+        players = [Player(("benchmark", number), f"P{number}a"), Player(("benchmark", number), f"P{number}b")]
+        game = registry.create(f"Game{number}", players[0])
+        registry.add_player(game, players[1])
+        registry.start(game)
+
+        cells = [(x, y) for x in range(3) for y in range(3)]
+        rng.shuffle(cells)
+        for x, y in cells[:len(cells) if finish else 3]:
+            registry.make_move(game, game.current_player, x, y)
+            if game.winner[0] != 0:
+                break
+
+        if finish:
+            for player in players:
+                registry.remove_player(player)
+
+    number = 0
+    while journal.records + len(journal.pending) < changes:
+        play(number, finish=True)
+        number += 1
+        if number % 100 == 0:
+            journal.flush()
+    for live in range(live_games):
+        play(number + live, finish=False)
+
+    journal.close()
+    journal.compact()
+
+def measure_recovery(changes: int, live_games: int, segment_records: int, rng: random.Random) -> dict:
+    """
+    Write a history, then rebuild the games from it
+    :param changes: Number of changes of the finished games
+    :param live_games: Number of games running at the end
+    :param segment_records: Changes in a segment of the journal, more than changes to keep a single segment
+    :param rng: Random generator
+    :return: dict of the recovery of Journal.recover
+    """
+    directory = tempfile.mkdtemp(prefix="journal")
+    try:
+        write_history(directory, changes, live_games, segment_records, rng)
+        registry, players = GameRegistry(), dict()
+        recovery = Journal(directory).recover(registry, players)
+        assert recovery["games"] == live_games
+        return recovery
+    finally:
+        shutil.rmtree(directory)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the journal of the games")
+    parser.add_argument("--port", type=int, default=5070, help="port of the servers started")
+    parser.add_argument("--games", type=int, default=20, help="17x17 games played on each server")
+    parser.add_argument("--history", type=int, nargs="+", default=[10_000, 100_000],
+                        help="changes of the finished games before the recovery")
+    parser.add_argument("--live-games", type=int, default=100, help="games running at the recovery")
+    parser.add_argument("--segment", type=int, default=10_000, help="changes in a segment of the journal")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    print(f"{'journal':>8} {'moves':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'us/move in process':>19}")
+    for journaled in (False, True):
+        directory = tempfile.mkdtemp(prefix="journal") if journaled else None
+        extra_args = ["--journal-dir", directory] if journaled else []
+        server = start_server("threaded", args.port, extra_args)
+        try:
+            latencies = play_games(args.port, args.games, 16, rng)
+        finally:
+            server.kill()
+            server.wait()
+
+        in_process = measure_in_process(20_000, directory and tempfile.mkdtemp(dir=directory))
+        print(f"{'yes' if journaled else 'no':>8} {len(latencies):>6} {statistics.median(latencies) * 1e3:>7.2f} "
+              f"{percentile(latencies, 0.95) * 1e3:>7.2f} {percentile(latencies, 0.99) * 1e3:>7.2f} "
+              f"{in_process:>19.1f}")
+        if directory is not None:
+            shutil.rmtree(directory)
+
+    print()
+    print(f"{'history':>8} {'snapshot':>9} {'changes replayed':>17} {'games':>6} {'recovery ms':>12}")
+    for changes in args.history:
+        for segment_records, label in ((changes * 2, "no"), (args.segment, "yes")):
+            recovery = measure_recovery(changes, args.live_games, segment_records, rng)
+            print(f"{changes:>8} {label:>9} {recovery['records']:>17} {recovery['games']:>6} "
+                  f"{recovery['seconds'] * 1e3:>12.1f}")
+
+if __name__ == '__main__':
+    main()
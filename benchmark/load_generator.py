@@ -0,0 +1,450 @@
+"""
+Put a realistic load on server.py with many headless virtual players.
+
+Every virtual player behaves like client.py: it gets its name, browses the list of servers, creates or joins a
+server, waits for the other players, starts the game, plays random legal moves on its turn and exits the server
+at the end of the game, then plays again until the end of the run. The changes of the server are either pushed
+(--mode subscribe, like client.py) or polled with GET_SERVER (--mode poll). With --deltas, GET_SERVER and MAKE_MOVE
+carry the sequence number of the last state known, and the server only sends the moves played since then.
+
+The players are split in groups of --players-per-game: the first player of a group hosts the games of the group,
+the others look for them in the list of servers.
+
+At the end, the throughput and the p50/p95/p99 latencies of every request of the API are printed.
+
+Run from the root of the repository, against a running server:
+    python -m benchmark.load_generator --port 5000 --players 16 --duration 30
+or let the script start the server:
+    python -m benchmark.load_generator --spawn asyncio --players 16 --duration 30
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+
+from api_client import ClientAPI
+from benchmark.server_engines import raise_file_limit, start_server
+from game_client import GameClient, apply_update
+from serialization import BINARY, ENCODINGS
+
+HOST = '127.0.0.1'
+
+# Percentiles of the latencies printed in the report
+PERCENTILES = (50, 95, 99)
+
+class LatencyRecorder:
+    """
+    Collect the latency of every request, by operation of the API.
+    """
+
+    def __init__(self):
+        # Latencies in seconds of the successful requests, by operation
+        self.latencies: dict[str, list[float]] = dict()
+
+        # Number of failed requests (failed status, timeout or closed connection), by operation
+        self.errors: dict[str, int] = dict()
+
+    def record(self, operation: str, latency: float, success: bool = True):
+        """
+        Record a request
+        :param operation: Name of the operation of the API
+        :param latency: Time between the request and its response, in seconds
+        :param success: False if the request failed
+        :return: None
+        """
+        self.latencies.setdefault(operation, list())
+        self.errors.setdefault(operation, 0)
+        if success:
+            self.latencies[operation].append(latency)
+        else:
+            self.errors[operation] += 1
+
+    def report(self, elapsed: float) -> list[dict]:
+        """
+        Summarize the requests recorded
+        :param elapsed: Duration of the run in seconds
+        :return: one dict per operation with the count, the errors, the throughput and the percentiles in ms
+        """
+        rows = list()
+        for operation in sorted(self.latencies):
+            latencies = sorted(self.latencies[operation])
+            row = {"operation": operation,
+                   "count": len(latencies),
+                   "errors": self.errors[operation],
+                   "rps": len(latencies) / elapsed}
+            for percentile in PERCENTILES:
+                row[f"p{percentile}"] = percentile_of(latencies, percentile) * 1e3
+            rows.append(row)
+        return rows
+
+def percentile_of(values: list[float], percentile: float) -> float:
+    """
+    Nearest-rank percentile of sorted values
+    :param values: Sorted values
+    :param percentile: Percentile between 0 and 100
+    :return: the percentile, 0 if there is no value
+    """
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(percentile / 100 * len(values)))
+    return values[rank - 1]
+
+class VirtualConnection:
+    """
+    Connection of a virtual player to the server, on top of game_client.GameClient.
+    The responses are awaited from asyncio, and the messages pushed by the server are put in a queue.
+    """
+
+    def __init__(self, recorder: LatencyRecorder, timeout: float):
+        """
+        :param recorder: Recorder of the latencies
+        :param timeout: Maximum time to wait for a response
+        """
+        self.recorder = recorder
+        self.timeout = timeout
+        self.client: GameClient | None = None
+
+        # States of the server pushed after SUBSCRIBE
+        self.pushes: asyncio.Queue = asyncio.Queue()
+
+    @property
+    def encoding(self) -> str:
+        return self.client.encoding
+
+    async def open(self, host: str, port: int, encoding: str) -> dict:
+        """
+        Connect to the server and negotiate the encoding of the responses
+        :param host: Address of the server
+        :param port: Port of the server
+        :param encoding: Encoding of the responses asked to the server
+        :return: the response to the handshake
+        """
+        loop = asyncio.get_running_loop()
+
+        # The pushed messages are received by the network worker, and queued on the event loop
+        def on_push(response: dict):
+            loop.call_soon_threadsafe(self.pushes.put_nowait, response)
+
+        # A player disconnected must show up as errors in the report, it is not connected again
+        self.client = GameClient(host, port, (encoding,), on_push=on_push, reconnect=False)
+
+        # The connection and the handshake are recorded together
+        start = time.perf_counter()
+        response = await asyncio.wait_for(asyncio.wrap_future(self.client.connect()), self.timeout)
+        self.recorder.record("connect", time.perf_counter() - start, response["status"] == "success")
+        return response
+
+    async def request(self, msg: str) -> dict | None:
+        """
+        Send a request, wait for its response and record its latency
+        :param msg: request to send
+        :return: the decoded response, or None if there is no response
+        """
+        operation = msg.split('/')[0]
+
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(asyncio.wrap_future(self.client.request(msg)), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            self.recorder.record(operation, time.perf_counter() - start, success=False)
+            return None
+        latency = time.perf_counter() - start
+
+        self.recorder.record(operation, latency, response.get("status") == "success")
+        return response
+
+    async def close(self):
+        """
+        Disconnect from the server
+        :return: None
+        """
+        if self.client is not None:
+            self.client.close()
+
+class VirtualPlayer:
+    """
+    Headless player following the same steps as a user of client.py.
+    """
+
+    def __init__(self, index: int, args, recorder: LatencyRecorder, deadline: float, rng: random.Random):
+        """
+        :param index: Index of the player
+        :param args: parsed arguments
+        :param recorder: Recorder of the latencies
+        :param deadline: time.perf_counter() value at which the player stops
+        :param rng: Random generator
+        """
+        self.index = index
+        self.args = args
+        self.deadline = deadline
+        self.rng = rng
+        self.connection = VirtualConnection(recorder, args.timeout)
+
+        self.name: str | None = None
+
+        # The first player of each group hosts the games of the group
+        self.group: int = index // args.players_per_game
+        self.is_host: bool = index % args.players_per_game == 0
+
+        # Names of the servers whose game was played until the end by this player
+        self.games_played: set[str] = set()
+
+        # State of the current game, kept up to date with the deltas of the server (--deltas)
+        self.state: dict | None = None
+
+    def running(self) -> bool:
+        return time.perf_counter() < self.deadline
+
+    async def think(self):
+        """
+        Wait like a human before the next action
+        :return: None
+        """
+        if self.args.think_time > 0:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+
+    async def run(self):
+        """
+        Connect to the server and play games until the deadline
+        :return: None
+        """
+        try:
+            response = await self.connection.open(self.args.host, self.args.port, self.args.encoding)
+        except (OSError, asyncio.TimeoutError):
+            self.connection.recorder.record("connect", 0.0, success=False)
+            return
+
+        try:
+            self.name = response["name"]
+
+            round_number = 0
+            while self.running():
+                if self.is_host:
+                    server_name = await self.host_game(round_number)
+                else:
+                    server_name = await self.join_game()
+                round_number += 1
+
+                if server_name is not None:
+                    await self.play_game(server_name)
+                    await self.leave_game(server_name)
+        finally:
+            await self.connection.close()
+
+    async def host_game(self, round_number: int) -> str | None:
+        """
+        Create a server, wait for the other players of the group and start the game
+        :param round_number: Number of games hosted before
+        :return: the name of the server, or None if no game was started
+        """
+        await self.think()
+        server_name = f"Load{self.group}R{round_number}"
+        response = await self.connection.request(f"{ClientAPI.NEW_SERVER}/{server_name}")
+        if response is None or response["status"] != "success":
+            return None
+
+        if self.args.mode == "subscribe":
+            await self.connection.request(f"{ClientAPI.SUBSCRIBE}/{server_name}")
+
+        # Wait for the other players, or start with the players already there
+        wait_deadline = min(self.deadline, time.perf_counter() + self.args.lobby_timeout)
+        players = 1
+        while players < self.args.players_per_game and time.perf_counter() < wait_deadline:
+            state = await self.next_state(server_name)
+            if state is not None:
+                players = len(state["players"])
+
+        if players < 2:
+            await self.leave_game(server_name)
+            return None
+
+        await self.connection.request(f"{ClientAPI.START_GAME}/{server_name}")
+        return server_name
+
+    async def join_game(self) -> str | None:
+        """
+        Look for a server of the group in the list of servers and join it
+        :return: the name of the server joined, or None if there is none yet
+        """
+        await self.think()
+        response = await self.connection.request(f"{ClientAPI.GET_SERVERS_LIST}/0/{self.args.page_size}")
+        if response is None:
+            return None
+
+        prefix = f"Load{self.group}R"
+        for game in response.get("games", []):
+            if game["name"].startswith(prefix) and not game["has_started"] and \
+                    len(game["players"]) < self.args.players_per_game:
+                joined = await self.connection.request(f"{ClientAPI.JOIN_SERVER}/{game['name']}")
+                if joined is not None and joined["status"] == "success":
+                    if self.args.mode == "subscribe":
+                        await self.connection.request(f"{ClientAPI.SUBSCRIBE}/{game['name']}")
+                    return game["name"]
+
+        # No server yet, browse the list again later
+        await asyncio.sleep(self.args.poll_interval)
+        return None
+
+    async def next_state(self, server_name: str) -> dict | None:
+        """
+        Wait for the next state of the server, pushed or polled
+        :param server_name: Name of the server
+        :return: the state of the server, or None if nothing changed
+        """
+        if self.args.mode == "subscribe":
+            try:
+                self.state = await asyncio.wait_for(self.connection.pushes.get(), self.args.poll_interval)
+            except asyncio.TimeoutError:
+                return None
+            return self.state
+
+        await asyncio.sleep(self.args.poll_interval)
+        return await self.request_state(f"{ClientAPI.GET_SERVER}/{server_name}")
+
+    async def request_state(self, msg: str) -> dict | None:
+        """
+        Send GET_SERVER or MAKE_MOVE, with the sequence number of the last state known if --deltas is given
+        :param msg: request to send
+        :return: the state of the server, or None if the request failed
+        """
+        if not self.args.deltas:
+            return await self.connection.request(msg)
+
+        if self.state is not None and self.state.get("seq") is not None:
+            msg = f"{msg}/{self.state['seq']}"
+        response = await self.connection.request(msg)
+        if response is None:
+            return None
+        self.state = apply_update(self.state, response)
+        return self.state
+
+    async def play_game(self, server_name: str):
+        """
+        Play random legal moves on the turns of the player until the end of the game
+        :param server_name: Name of the server
+        :return: None
+        """
+        game_deadline = min(self.deadline, time.perf_counter() + self.args.game_timeout)
+
+        # In subscribe mode the state of the server is not known before the first push
+        state = None if self.args.mode == "subscribe" else \
+            await self.request_state(f"{ClientAPI.GET_SERVER}/{server_name}")
+
+        while time.perf_counter() < game_deadline:
+            if state is not None and state.get("board") is not None:
+                free_cells = [(x, y) for x, row in enumerate(state["board"]) for y, cell in enumerate(row) if cell == 0]
+                if state["winner"][0] != 0 or not free_cells:
+                    self.games_played.add(server_name)
+                    return
+
+                if state["current_player"] == self.name and state["has_started"]:
+                    await self.think()
+                    x, y = self.rng.choice(free_cells)
+                    state = await self.request_state(f"{ClientAPI.MAKE_MOVE}/{server_name}/{x}/{y}")
+                    continue
+
+            state = await self.next_state(server_name)
+
+    async def leave_game(self, server_name: str):
+        """
+        Stop listening to the server and exit it
+        :param server_name: Name of the server
+        :return: None
+        """
+        if self.args.mode == "subscribe":
+            await self.connection.request(f"{ClientAPI.UNSUBSCRIBE}/{server_name}")
+
+            # Forget the states pushed before the end of the subscription
+            while not self.connection.pushes.empty():
+                self.connection.pushes.get_nowait()
+
+        await self.connection.request(ClientAPI.EXIT_SERVER)
+        self.state = None
+
+async def run_load(args, recorder: LatencyRecorder) -> tuple[int, int]:
+    """
+    Run every virtual player until the end of the run
+    :param args: parsed arguments
+    :param recorder: Recorder of the latencies
+    :return: (number of players connected, number of games played until the end, each one counted once)
+    """
+    deadline = time.perf_counter() + args.duration
+    rng = random.Random(args.seed)
+    players = [VirtualPlayer(index, args, recorder, deadline, random.Random(rng.random()))
+               for index in range(args.players)]
+
+    async def start_player(player: VirtualPlayer):
+        # Spread the connections over the ramp up
+        await asyncio.sleep(args.ramp_up * player.index / max(1, args.players))
+        await player.run()
+
+    await asyncio.gather(*(start_player(player) for player in players))
+
+    connected = sum(player.name is not None for player in players)
+    # Every player of a game sees its end: the games are counted by name, not by player
+    games_played = len(set().union(*(player.games_played for player in players)))
+    return connected, games_played
+
+def print_report(rows: list[dict], elapsed: float, connected: int, games_played: int):
+    """
+    Print the throughput and the latencies of every operation
+    :param rows: rows of LatencyRecorder.report
+    :param elapsed: Duration of the run in seconds
+    :param connected: Number of players connected
+    :param games_played: Number of games played until the end
+    :return: None
+    """
+    print(f"{connected} players connected, {games_played} games played in {elapsed:.1f}s")
+    print(f"{'operation':<16} {'count':>8} {'errors':>7} {'req/s':>9}"
+          + "".join(f" {f'p{percentile} (ms)':>10}" for percentile in PERCENTILES))
+    for row in rows:
+        print(f"{row['operation']:<16} {row['count']:>8} {row['errors']:>7} {row['rps']:>9.1f}"
+              + "".join(f" {row[f'p{percentile}']:>10.2f}" for percentile in PERCENTILES))
+
+    total = sum(row["count"] for row in rows)
+    print(f"{'total':<16} {total:>8} {sum(row['errors'] for row in rows):>7} {total / elapsed:>9.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many players on the server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--spawn", choices=("threaded", "asyncio"),
+                        help="start a server with this engine on --port instead of using a running one")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes of the server started by --spawn")
+    parser.add_argument("--players", type=int, default=16, help="virtual players connected at the same time")
+    parser.add_argument("--players-per-game", type=int, default=2, help="players of each game")
+    parser.add_argument("--duration", type=float, default=30.0, help="duration of the run in seconds")
+    parser.add_argument("--ramp-up", type=float, default=1.0, help="time to connect every player in seconds")
+    parser.add_argument("--think-time", type=float, default=0.05,
+                        help="mean time in seconds a player waits before each action")
+    parser.add_argument("--mode", choices=("subscribe", "poll"), default="subscribe",
+                        help="receive the changes of the server by push or by polling GET_SERVER")
+    parser.add_argument("--deltas", action="store_true",
+                        help="send the sequence number of the last state known with GET_SERVER and MAKE_MOVE")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="time between two polls in seconds")
+    parser.add_argument("--lobby-timeout", type=float, default=5.0, help="time a host waits for the players")
+    parser.add_argument("--game-timeout", type=float, default=30.0, help="maximum duration of a game")
+    parser.add_argument("--page-size", type=int, default=100, help="servers asked in each page of the list")
+    parser.add_argument("--encoding", choices=ENCODINGS, default=BINARY, help="encoding of the responses")
+    parser.add_argument("--timeout", type=float, default=10.0, help="maximum time to wait for a response")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    raise_file_limit()
+
+    process = start_server(args.spawn, args.port, ["--workers", str(args.workers)]) if args.spawn else None
+    try:
+        recorder = LatencyRecorder()
+        start = time.perf_counter()
+        connected, games_played = asyncio.run(run_load(args, recorder))
+        elapsed = time.perf_counter() - start
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print_report(recorder.report(elapsed), elapsed, connected, games_played)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Measure the move history of the games and the archive.
+
+0. Limit of the symbols: players join and leave a game until no symbol is left, then every symbol given must be
+   recorded and read back, and the joins beyond MAX_SYMBOLS must be refused without changing the game. A game of
+   MAX_SYMBOLS players on the largest default board must be archived and read back when they all leave it.
+1. Cost of the history on the hot path: a move of Game.make_move, and the packing of its history record alone.
+2. Archive: random games are played and archived, then the size per game, the writing rate, and the rate and the
+   memory of reading every header and every move back are measured.
+
+Run from the root of the repository:
+    python -m benchmark.move_history --games 100000
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from archive import Archive, encode_game, iter_games, read_moves
+from game import MAX_SYMBOLS, MOVE_RECORD, Game
+from game_registry import GameRegistry
+from player import Player
+
+def random_game(number: int, players: int, rng: random.Random) -> Game:
+    """
+    Play a random game until it has a winner or its board is full
+    :param number: Number of the game, in its name
+    :param players: Number of players, the board has players + 1 rows
+    :param rng: Random generator
+    :return: Game object
+    """
+    game = Game(f"Game{number}")
+    for i in range(players):
+        game.add_player(Player(("benchmark", i), f"Player{i}"))
+    game.start()
+
+    size = players + 1
+    cells = [(x, y) for x in range(size) for y in range(size)]
+    rng.shuffle(cells)
+    for x, y in cells:
+        game.make_move(game.current_player, x, y)
+        if game.winner[0] != 0:
+            break
+    return game
+
+def check_symbol_limit() -> int:
+    """
+    Join and leave a game until every symbol is given, then play a move with the last symbol and archive the game
+    :return: the number of joins refused
+    """
+    registry = GameRegistry()
+    first = Player(("benchmark", 0), "Player0")
+    game = registry.create("Crowded", first, size=3)
+    for i in range(1, MAX_SYMBOLS):
+        player = Player(("benchmark", i), f"Player{i}")
+        assert registry.add_player(game, player)
+        if i < MAX_SYMBOLS - 1:
+            registry.remove_player(player)
+
+    # Every symbol was given once, to a player inside the game or to one who left it
+    refused = 0
+    for i in range(MAX_SYMBOLS, MAX_SYMBOLS + 10):
+        refused += not registry.add_player(game, Player(("benchmark", i), f"Player{i}"))
+    assert refused == 10 and len(game.symbols) == MAX_SYMBOLS and len(game.players) == 2
+
+    registry.start(game)
+    last = game.players[1]
+    assert game.make_move(first, 0, 0) and game.make_move(last, 1, 1)
+    moves = list(MOVE_RECORD.iter_unpack(game.history))
+    assert [(symbol, cell) for symbol, cell, _ in moves] == [(1, 0), (MAX_SYMBOLS, 4)], moves
+    assert len(encode_game(game)) > len(game.history)
+    return refused
+
+def check_largest_archive() -> tuple[int, int]:
+    """
+    Play the first and the last cell of a game of MAX_SYMBOLS players on a default board, make every player leave
+    it, then read it back from the archive
+    :return: (size of the board, number of moves) read back
+    """
+    directory = tempfile.mkdtemp(prefix="archive")
+    try:
+        archive = Archive(directory)
+        registry = GameRegistry()
+        players = [Player(("benchmark", i), f"Player{i}") for i in range(MAX_SYMBOLS)]
+        game = registry.create("Largest", players[0], observers=[archive.on_game_event])
+        for player in players[1:]:
+            assert registry.add_player(game, player)
+        registry.start(game)
+
+        last = game.bitboard.size - 1
+        # The other players pass their turn
+        assert game.make_move(players[0], 0, 0)
+        game.current_player = players[-1]
+        assert game.make_move(players[-1], last, last)
+
+        # The game is archived and removed when its last player leaves it
+        for player in players:
+            registry.remove_player(player)
+        assert len(registry) == 0 and len(archive) == 1
+
+        header = archive.header(0)
+        moves = [move[:3] for move in archive.moves(header)]
+        assert header["size"] == MAX_SYMBOLS + 1 and len(header["players"]) == MAX_SYMBOLS, header
+        assert moves == [(1, 0, 0), (MAX_SYMBOLS, last, last)], moves
+        return header["size"], len(moves)
+    finally:
+        shutil.rmtree(directory)
+
+def measure_hot_path(rng: random.Random) -> tuple[float, float]:
+    """
+    Measure a move of a 17x17 game, and the packing of its history record
+    :param rng: Random generator
+    :return: (nanoseconds per move, nanoseconds per history record)
+    """
+    moves, elapsed = 0, 0.0
+    for number in range(50):
+        game = Game(f"Game{number}")
+        for i in range(16):
+            game.add_player(Player(("benchmark", i), f"Player{i}"))
+        game.start()
+        cells = [(x, y) for x in range(17) for y in range(17)]
+        rng.shuffle(cells)
+
+        start = time.perf_counter()
+        for x, y in cells:
+            game.make_move(game.current_player, x, y)
+        elapsed += time.perf_counter() - start
+        moves += len(cells)
+
+    history = bytearray()
+    start = time.perf_counter()
+    for index in range(moves):
+        history += MOVE_RECORD.pack(3, index % 289, 1500)
+    packing = time.perf_counter() - start
+
+    return elapsed / moves * 1e9, packing / moves * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the move history and the archive of the games")
+    parser.add_argument("--games", type=int, default=100_000, help="games archived")
+    parser.add_argument("--players", type=int, default=2, help="players of each game archived")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    refused = check_symbol_limit()
+    print(f"{MAX_SYMBOLS} symbols given and recorded, {refused} joins beyond them refused")
+    size, moves = check_largest_archive()
+    print(f"game of {MAX_SYMBOLS} players on a {size}x{size} board archived and read back with its {moves} moves")
+
+    move, packing = measure_hot_path(rng)
+    print(f"17x17 move: {move:.0f} ns, history record: {packing:.0f} ns ({packing / move:.1%} of the move)")
+
+    directory = tempfile.mkdtemp(prefix="archive")
+    try:
+        archive = Archive(directory)
+        games = [random_game(number, args.players, rng) for number in range(min(args.games, 1000))]
+
+        start = time.perf_counter()
+        for number in range(args.games):
+            archive.append(encode_game(games[number % len(games)]))
+        archive.flush()
+        writing = time.perf_counter() - start
+
+        size = archive.written
+        print(f"{args.games} games of {args.players + 1}x{args.players + 1} cells archived: {size:,} bytes, "
+              f"{size / args.games:.1f} bytes per game ({size / args.games * 1e6 / 2 ** 20:.0f} MiB per million), "
+              f"{args.games / writing:,.0f} games/s written")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        games_read = moves_read = 0
+        with open(archive.path, "rb") as file:
+            for _, _, header in iter_games(archive.path):
+                games_read += 1
+                for _ in read_moves(file, header):
+                    moves_read += 1
+        reading = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"read back {games_read} games and {moves_read} moves: {games_read / reading:,.0f} games/s, "
+              f"{moves_read / reading:,.0f} moves/s, peak memory {peak / 1024:.0f} KiB")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
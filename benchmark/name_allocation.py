@@ -0,0 +1,103 @@
+"""
+Measure the allocation and release rates of NameAllocator, and the memory it holds.
+
+For each number of concurrent players:
+1. Allocate the names of every player, then release them all.
+2. Churn: allocate them again from the free pool, then release and allocate a random player at a time.
+The previous allocator (a set difference over the 17 animal names on every connection) is measured too, up to
+its limit.
+
+Run from the root of the repository:
+    python -m benchmark.name_allocation --players 1000 100000 500000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from name_allocator import NameAllocator
+from server import animal_names
+
+def set_difference_allocate(picked_names: set[str]) -> str:
+    """
+    The allocation of names used before NameAllocator
+    :param picked_names: Names already given
+    :return: a name not given yet
+    """
+    remaining_names = set(animal_names) - picked_names
+    chosen_name = random.choice(list(remaining_names))
+    picked_names.add(chosen_name)
+    return chosen_name
+
+def measure_allocator(players: int, churn: int, rng: random.Random) -> dict:
+    """
+    Measure NameAllocator with a number of concurrent players
+    :param players: Number of names held at the same time
+    :param churn: Number of release and allocation pairs
+    :param rng: Random generator
+    :return: dict of rates (operations per second) and memory (bytes)
+    """
+    tracemalloc.start()
+    allocator = NameAllocator(animal_names, rng=rng)
+
+    start = time.perf_counter()
+    held = [allocator.allocate() for _ in range(players)]
+    allocate_time = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for name in held:
+        allocator.release(name)
+    release_time = time.perf_counter() - start
+
+    # Every name now comes from the free pool
+    held = [allocator.allocate() for _ in range(players)]
+
+    start = time.perf_counter()
+    for _ in range(churn):
+        index = rng.randrange(players)
+        allocator.release(held[index])
+        held[index] = allocator.allocate()
+    churn_time = time.perf_counter() - start
+
+    assert len(set(held)) == players == len(allocator)
+
+    return {"allocate": players / allocate_time,
+            "release": players / release_time,
+            "churn": churn / churn_time,
+            "memory": memory}
+
+def measure_set_difference(players: int) -> float:
+    """
+    Measure the previous allocator
+    :param players: Number of names held at the same time, at most the number of animal names
+    :return: allocations per second
+    """
+    start = time.perf_counter()
+    picked_names = set()
+    for _ in range(players):
+        set_difference_allocate(picked_names)
+    return players / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the allocation of the names of the players")
+    parser.add_argument("--players", type=int, nargs="+", default=[17, 1000, 100000, 500000],
+                        help="numbers of players connected at the same time")
+    parser.add_argument("--churn", type=int, default=100000, help="release and allocation pairs of the churn")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    previous = measure_set_difference(len(animal_names))
+    print(f"previous allocator, {len(animal_names)} players: {previous:,.0f} allocations/s")
+
+    print(f"{'players':>8} {'allocate/s':>12} {'release/s':>12} {'churn/s':>12} {'memory (B)':>12} {'B/player':>9}")
+    for players in args.players:
+        result = measure_allocator(players, args.churn, rng)
+        print(f"{players:>8} {result['allocate']:>12,.0f} {result['release']:>12,.0f} {result['churn']:>12,.0f} "
+              f"{result['memory']:>12,} {result['memory'] / players:>9.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Measure the matchmaking queue of QUICK_MATCH under load.
+
+A server is started in a subprocess, then --players clients ask for quick matches in a loop until --duration seconds:
+each client asks for a game of a number of players taken at random among --sizes, waits for the match pushed by the
+server, leaves the game at once and asks again. The clients are driven by the callbacks of their network threads, so
+thousands of them fit in one process.
+The matches per second, the waiting times seen by the clients (from the request to the match) and measured by the
+server, and the players waiting in the queue are printed.
+
+Run from the root of the repository:
+    python -m benchmark.quick_match --players 200 --sizes 2 3 4 --duration 10
+"""
+import argparse
+import random
+import statistics
+import time
+
+from api_client import ClientAPI
+from benchmark.journal import percentile
+from benchmark.server_engines import HOST, raise_file_limit, start_server
+from game_client import GameClient, NetworkWorker
+
+class MatchSeeker:
+    """
+    Client asking for quick matches in a loop, from the callbacks of its network thread.
+    """
+
+    def __init__(self, port: int, worker: NetworkWorker, sizes: list[int], rng: random.Random,
+                 deadline: float, waits: list[float]):
+        """
+        :param port: Port of the server
+        :param worker: Network thread of the client
+        :param sizes: Numbers of players asked for
+        :param rng: Random generator
+        :param deadline: time.monotonic after which the client stops asking
+        :param waits: list where the seconds waited for each match are appended
+        """
+        self.client = GameClient(HOST, port, on_push=self.on_push, reconnect=False, worker=worker)
+        self.sizes = sizes
+        self.rng = rng
+        self.deadline = deadline
+        self.waits = waits
+        self.asked_at: float = 0.0
+        self.errors: int = 0
+
+    def ask(self):
+        """
+        Ask for a match, unless the test is over
+        :return: None
+        """
+        if time.monotonic() >= self.deadline:
+            return
+        self.asked_at = time.monotonic()
+        future = self.client.request(f"{ClientAPI.QUICK_MATCH}/{self.rng.choice(self.sizes)}")
+        future.add_done_callback(self.on_queued)
+
+    def on_queued(self, future):
+        if future.exception() is not None or future.result()["status"] != "success":
+            self.errors += 1
+
+    def on_push(self, response: dict):
+        if response.get("event") != "match":
+            return
+        self.waits.append(time.monotonic() - self.asked_at)
+
+        # The game is left at once, then the client asks again
+        futures = self.client.pipeline([f"{ClientAPI.UNSUBSCRIBE}/{response['name']}", ClientAPI.EXIT_SERVER])
+        futures[1].add_done_callback(lambda future: self.ask())
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the matchmaking queue of QUICK_MATCH")
+    parser.add_argument("--engine", default="threaded", help="engine of the server")
+    parser.add_argument("--port", type=int, default=5135, help="port of the server started")
+    parser.add_argument("--players", type=int, default=200, help="clients asking for matches")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 3, 4], help="numbers of players asked for")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of matchmaking")
+    parser.add_argument("--sample", type=float, default=0.5, help="seconds between two samples of the queue")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    raise_file_limit()
+    server = start_server(args.engine, args.port)
+    try:
+        workers = [NetworkWorker() for _ in range(2)]
+        rng = random.Random(args.seed)
+        waits: list[float] = list()
+        deadline = time.monotonic() + 3600
+        seekers = [MatchSeeker(args.port, workers[index % len(workers)], args.sizes, random.Random(rng.random()),
+                               deadline, waits) for index in range(args.players)]
+
+        # The connections are opened in batches, under the backlog of the server
+        for batch in range(0, len(seekers), 100):
+            for seeker in seekers[batch:batch + 100]:
+                seeker.client.connect()
+            for seeker in seekers[batch:batch + 100]:
+                seeker.client.connected.result(30)
+
+        monitor = GameClient(HOST, args.port, reconnect=False)
+        monitor.connect().result(10)
+
+        start = time.monotonic()
+        for seeker in seekers:
+            seeker.deadline = start + args.duration
+            seeker.ask()
+
+        depths = list()
+        while time.monotonic() < start + args.duration:
+            time.sleep(args.sample)
+            depths.append(monitor.call("get_stats")["quick_match_waiting"])
+        elapsed = time.monotonic() - start
+
+        # The matches made after the deadline are not counted
+        matched = len(waits)
+        time.sleep(0.5)
+        stats = monitor.call("get_stats")
+        for seeker in seekers:
+            seeker.client.close()
+        monitor.close()
+    finally:
+        server.kill()
+        server.wait()
+
+    waits = waits[:matched]
+    matches = stats["quick_matches"]
+    print(f"{args.players} players asking for games of {', '.join(map(str, args.sizes))} players during {elapsed:.1f}s")
+    print(f"matches: {matches} ({matches / elapsed:.0f}/s), players matched: {matched} ({matched / elapsed:.0f}/s), "
+          f"failed requests: {sum(seeker.errors for seeker in seekers)}")
+    if waits:
+        print(f"wait seen by the clients: p50 {statistics.median(waits) * 1e3:.1f}ms, "
+              f"p95 {percentile(waits, 0.95) * 1e3:.1f}ms, p99 {percentile(waits, 0.99) * 1e3:.1f}ms")
+    print(f"wait measured by the server: p50 {stats['quick_match_wait_p50_ms']}ms, "
+          f"p95 {stats['quick_match_wait_p95_ms']}ms, p99 {stats['quick_match_wait_p99_ms']}ms")
+    if depths:
+        print(f"players waiting in the queue: mean {statistics.mean(depths):.1f}, max {max(depths)}")
+    quick_match = stats["requests"].get(ClientAPI.QUICK_MATCH)
+    if quick_match:
+        print(f"quick_match request on the server: p50 {quick_match['p50_us']}us, p99 {quick_match['p99_us']}us")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Measure the cache of the encoded responses with many idle pollers.
+
+A server is started in a subprocess with and without --no-response-cache. A 17x17 game of 16 players gets a move every
+--move-interval seconds, a few other games wait in the lobby, and --pollers clients poll the whole state of the game
+(GET_SERVER without sequence number) and the first page of the list of games as fast as they can. The requests per
+second, the CPU time of the server per request (Linux only) and the responses encoded by the server are compared.
+
+Run from the root of the repository:
+    python -m benchmark.response_cache --pollers 32 --duration 5
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+from benchmark.server_engines import HOST, start_server
+from game_client import GameClient
+
+def cpu_seconds(pid: int) -> float:
+    """
+    Read the CPU time used by a process (Linux only)
+    :param pid: id of the process
+    :return: user and system time in seconds, 0 if not available
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+def poll(port: int, server_name: str, stop: threading.Event, counts: list[int]):
+    """
+    Poll the state of a game and the list of games until stop is set
+    :param port: Port of the server
+    :param server_name: Name of the game polled
+    :param stop: Event stopping the poller
+    :param counts: list where the number of requests sent is appended
+    :return: None
+    """
+    client = GameClient(HOST, port, reconnect=False)
+    client.connect().result(10)
+    requests = 0
+    while not stop.is_set():
+        client.pipeline([f"get_server/{server_name}", "get_server_list/0/50"])[1].result(10)
+        requests += 2
+    client.close()
+    counts.append(requests)
+
+def measure(port: int, cached: bool, pollers: int, duration: float, move_interval: float,
+            rng: random.Random) -> dict:
+    """
+    Run the pollers against a server while a game is played
+    :param port: Port of the server
+    :param cached: False to start the server with --no-response-cache
+    :param pollers: Number of clients polling
+    :param duration: Seconds of polling
+    :param move_interval: Seconds between two moves of the game
+    :param rng: Random generator
+    :return: dict of the requests, the moves, the CPU time of the server and its cache metrics
+    """
+    server = start_server("threaded", port, [] if cached else ["--no-response-cache"])
+    try:
+        players = [GameClient(HOST, port, reconnect=False) for _ in range(16)]
+        by_name = {client.connect().result(10)["name"]: client for client in players}
+        players[0].call("new_server/Polled")
+        for client in players[1:]:
+            client.call("join_server/Polled")
+
+        # Games waiting in the lobby, listed with the polled one
+        lobby = [GameClient(HOST, port, reconnect=False) for _ in range(20)]
+        for number, client in enumerate(lobby):
+            client.connect().result(10)
+            client.call(f"new_server/Lobby{number}")
+
+        state = players[0].call("start/Polled") and players[0].call("get_server/Polled")
+        cells = [(x, y) for x in range(17) for y in range(17)]
+        rng.shuffle(cells)
+
+        stop, counts = threading.Event(), list()
+        threads = [threading.Thread(target=poll, args=(port, "Polled", stop, counts)) for _ in range(pollers)]
+        for thread in threads:
+            thread.start()
+
+        start_cpu, start = cpu_seconds(server.pid), time.perf_counter()
+        moves = 0
+        while time.perf_counter() - start < duration and moves < len(cells):
+            x, y = cells[moves]
+            state = by_name[state["current_player"]].call(f"make_move/Polled/{x}/{y}/{state['seq']}")
+            moves += 1
+            time.sleep(move_interval)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed, cpu = time.perf_counter() - start, cpu_seconds(server.pid) - start_cpu
+
+        stats = players[0].call("get_stats")
+        for client in players + lobby:
+            client.close()
+    finally:
+        server.kill()
+        server.wait()
+
+    requests = sum(counts)
+    return {"requests": requests,
+            "rate": requests / elapsed,
+            "moves": moves,
+            "cpu_us": cpu / requests * 1e6 if requests else 0.0,
+            "encoded": stats["game_cache_misses"] + stats["list_cache_misses"] if cached else requests}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cache of the encoded responses")
+    parser.add_argument("--port", type=int, default=5095, help="port of the servers started")
+    parser.add_argument("--pollers", type=int, default=32, help="clients polling the game and the list")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of polling")
+    parser.add_argument("--move-interval", type=float, default=0.05, help="seconds between two moves of the game")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'cache':>6} {'requests':>9} {'req/s':>8} {'moves':>6} {'server CPU us/request':>22} {'encoded':>8}")
+    for cached in (False, True):
+        result = measure(args.port, cached, args.pollers, args.duration, args.move_interval,
+                         random.Random(args.seed))
+        print(f"{'yes' if cached else 'no':>6} {result['requests']:>9} {result['rate']:>8.0f} {result['moves']:>6} "
+              f"{result['cpu_us']:>22.1f} {result['encoded']:>8}")
+
+if __name__ == '__main__':
+    main()
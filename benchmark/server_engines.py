@@ -0,0 +1,211 @@
+"""
+Compare the threaded and asyncio engines of server.py.
+
+For each engine a server is started in a subprocess, then:
+1. Connections held: open many connections at once, ask each one for its name and count how many
+   connections are answered and still open.
+2. Requests per second: a fixed number of clients send GET_SERVERS_LIST in a loop for a few seconds.
+
+Run from the root of the repository:
+    python -m benchmark.server_engines --connections 2000 --clients 50 --duration 5
+"""
+import argparse
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+
+from api_client import ClientAPI
+from protocol import pack_frame, read_frame
+
+FORMAT = 'utf-8'
+HOST = '127.0.0.1'
+
+def start_server(engine: str, port: int, extra_args: list[str] = ()) -> subprocess.Popen:
+    """
+    Start server.py in a subprocess and wait until it accepts connections
+    :param engine: name of the engine
+    :param port: port to listen on
+    :param extra_args: other command line arguments of the server
+    :return: the server process
+    """
+    process = subprocess.Popen(
+        [sys.executable, "server.py", "--engine", engine, "--host", HOST, "--port", str(port), "--log-level", "WARNING",
+         *extra_args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError(f"The {engine} server did not start on port {port}")
+
+def server_resources(pid: int) -> tuple[int, int]:
+    """
+    Read the number of threads and the resident memory of a process (Linux only)
+    :param pid: id of the process
+    :return: (threads, resident memory in KB), or (0, 0) if not available
+    """
+    threads, rss = 0, 0
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("Threads:"):
+                    threads = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    rss = int(line.split()[1])
+    except OSError:
+        pass
+    return threads, rss
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, msg: str) -> bytes:
+    """
+    Send a request and wait for its response
+    :param reader: stream reading from the server
+    :param writer: stream writing to the server
+    :param msg: request to send
+    :return: the response
+    """
+    writer.write(pack_frame(1, msg.encode(FORMAT)))
+    await writer.drain()
+    request_id, payload = await read_frame(reader)
+    return payload
+
+async def hold_connections(port: int, count: int, timeout: float) -> tuple[int, list[asyncio.StreamWriter]]:
+    """
+    Open count connections at once and keep them open while asking for a name on each one
+    :param port: port of the server
+    :param count: number of connections to open
+    :param timeout: maximum time to wait for a connection and its response
+    :return: the number of connections answered by the server and the opened streams
+    """
+    connections = []
+
+    async def open_one():
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(HOST, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        connections.append(writer)
+        try:
+            name = await asyncio.wait_for(request(reader, writer, ClientAPI.GET_MY_NAME), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        return len(name) > 0
+
+    results = await asyncio.gather(*(open_one() for _ in range(count)))
+
+    held = sum(results)
+    return held, connections
+
+async def measure_throughput(port: int, clients: int, duration: float) -> int:
+    """
+    Send GET_SERVERS_LIST requests in a loop from several clients
+    :param port: port of the server
+    :param clients: number of concurrent clients
+    :param duration: duration of the measure in seconds
+    :return: number of responses received
+    """
+    deadline = time.perf_counter() + duration
+
+    async def client_loop():
+        done = 0
+        try:
+            reader, writer = await asyncio.open_connection(HOST, port)
+            await request(reader, writer, ClientAPI.GET_MY_NAME)
+            while time.perf_counter() < deadline:
+                if not await request(reader, writer, ClientAPI.GET_SERVERS_LIST):
+                    break
+                done += 1
+            writer.write(pack_frame(1, ClientAPI.QUIT.encode(FORMAT)))
+            writer.close()
+        except OSError:
+            pass
+        return done
+
+    return sum(await asyncio.gather(*(client_loop() for _ in range(clients))))
+
+def close_all(writers: list[asyncio.StreamWriter]):
+    """
+    Close every connection opened by hold_connections
+    :param writers: streams to close
+    :return: None
+    """
+    for writer in writers:
+        writer.close()
+
+def run_engine(engine: str, port: int, args) -> dict:
+    """
+    Run the complete benchmark on a single engine
+    :param engine: name of the engine
+    :param port: port used by the server
+    :param args: parsed arguments
+    :return: dict of results
+    """
+    process = start_server(engine, port)
+    try:
+        async def scenario():
+            held, writers = await hold_connections(port, args.connections, args.timeout)
+            threads, rss = server_resources(process.pid)
+            close_all(writers)
+
+            # Let the server release the closed connections
+            await asyncio.sleep(1)
+
+            start = time.perf_counter()
+            responses = await measure_throughput(port, args.clients, args.duration)
+            elapsed = time.perf_counter() - start
+
+            return {"engine": engine,
+                    "held": held,
+                    "threads": threads,
+                    "rss_kb": rss,
+                    "rps": responses / elapsed}
+
+        return asyncio.run(scenario())
+    finally:
+        process.terminate()
+        process.wait()
+
+def raise_file_limit():
+    """
+    Raise the limit of open files to hold many sockets (Unix only)
+    :return: None
+    """
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the server engines")
+    parser.add_argument("--engines", nargs="+", default=["threaded", "asyncio"])
+    parser.add_argument("--connections", type=int, default=1000, help="connections opened at once")
+    parser.add_argument("--clients", type=int, default=16, help="clients sending requests in a loop")
+    parser.add_argument("--duration", type=float, default=5.0, help="duration of the throughput measure")
+    parser.add_argument("--timeout", type=float, default=10.0, help="timeout of a single connection")
+    parser.add_argument("--port", type=int, default=5100, help="first port used by the servers")
+    args = parser.parse_args()
+
+    # The servers started by this script inherit the limit
+    raise_file_limit()
+
+    results = [run_engine(engine, args.port + i, args) for i, engine in enumerate(args.engines)]
+
+    print(f"{'engine':<10} {'held':>8} {'threads':>8} {'rss (KB)':>10} {'req/s':>10}")
+    for result in results:
+        print(f"{result['engine']:<10} {result['held']:>8} {result['threads']:>8} "
+              f"{result['rss_kb']:>10} {result['rps']:>10.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Measure the cost of the spectators on the moves of the players.
+
+For each number of spectators, a server is started in a subprocess, then 16 players play full games on a 17x17 board
+while the spectators watch the game:
+- most spectators read every message, and their board is checked against the final state of the game;
+- a few spectators never read anything, with a small receive buffer, so their queues fill up: they are sent
+  snapshots instead of the moves (resyncs), and stop watching after --spectator-timeout seconds.
+The p50/p95/p99 latencies of the moves seen by the players and measured by the server are compared, with the messages written to the spectators and the messages
+encoded by the server (once per change and per encoding, whatever the number of spectators).
+
+Run from the root of the repository:
+    python -m benchmark.spectators --spectators 0 100 500 --games 3
+"""
+import argparse
+import random
+import socket
+import statistics
+import time
+
+from benchmark.journal import percentile
+from benchmark.server_engines import HOST, start_server
+from game_client import GameClient, NetworkWorker
+from protocol import pack_frame
+
+class BoardWatcher:
+    """
+    Board of a spectator, rebuilt from the messages pushed by the server.
+    """
+
+    def __init__(self):
+        self.board: list[list[int]] | None = None
+        self.seq: int = -1
+        self.messages: int = 0
+        self.gaps: int = 0
+
+    def on_push(self, response: dict):
+        """
+        Apply a message pushed by the server, from the network thread
+        :param response: snapshot or delta of the game
+        :return: None
+        """
+        self.messages += 1
+        if response["update"] == "snapshot":
+            self.board = [list(row) for row in response["board"]] if response["board"] else None
+        else:
+            # The moves of a spectator reading every message are never dropped
+            if response["seq"] != self.seq + 1:
+                self.gaps += 1
+            for x, y, symbol in response["moves"]:
+                self.board[x][y] = symbol
+        self.seq = response["seq"]
+
+def open_slow_spectator(port: int, server_name: str) -> socket.socket:
+    """
+    Watch a game from a connection that never reads
+    :param port: Port of the server
+    :param server_name: Name of the game
+    :return: the socket
+    """
+    connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    connection.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    connection.connect((HOST, port))
+    connection.sendall(pack_frame(1, b"get_my_name/json") + pack_frame(2, f"watch/{server_name}".encode()))
+    return connection
+
+def play_watched_games(port: int, games: int, spectators: int, slow_spectators: int,
+                       rng: random.Random) -> tuple[list[float], int, int]:
+    """
+    Play full 17x17 games watched by spectators
+    :param port: Port of the server
+    :param games: Number of games played
+    :param spectators: Number of spectators reading every message
+    :param slow_spectators: Number of spectators never reading
+    :param rng: Random generator
+    :return: (latencies of the moves in seconds, spectators whose final board is wrong, gaps in the moves received)
+    """
+    players = [GameClient(HOST, port, reconnect=False) for _ in range(16)]
+    by_name = {client.connect().result(10)["name"]: client for client in players}
+
+    # The spectators share a few network threads, apart from the one of the players
+    workers = [NetworkWorker() for _ in range(2)]
+    latencies, wrong, gaps = list(), 0, 0
+
+    for number in range(games):
+        name = f"Watched{number}"
+        players[0].call(f"new_server/{name}")
+        for client in players[1:]:
+            client.call(f"join_server/{name}")
+
+        watchers = [BoardWatcher() for _ in range(spectators)]
+        clients = [GameClient(HOST, port, on_push=watcher.on_push, reconnect=False, worker=workers[i % len(workers)])
+                   for i, watcher in enumerate(watchers)]
+        # The connections are opened in batches, under the backlog of the server
+        for batch in range(0, len(clients), 100):
+            for client in clients[batch:batch + 100]:
+                client.connect()
+            for client in clients[batch:batch + 100]:
+                client.request(f"watch/{name}").result(30)
+        slow = [open_slow_spectator(port, name) for _ in range(slow_spectators)]
+
+        state = players[0].call(f"start/{name}") and players[0].call(f"get_server/{name}")
+        cells = [(x, y) for x in range(17) for y in range(17)]
+        rng.shuffle(cells)
+        for x, y in cells:
+            start = time.perf_counter()
+            state = by_name[state["current_player"]].call(f"make_move/{name}/{x}/{y}/{state['seq']}")
+            latencies.append(time.perf_counter() - start)
+
+        # Every spectator reading its messages ends with the final board
+        final = players[0].call(f"get_server/{name}")
+        deadline = time.time() + 10
+        while time.time() < deadline and any(watcher.seq < final["seq"] for watcher in watchers):
+            time.sleep(0.05)
+        wrong += sum(watcher.board != final["board"] for watcher in watchers)
+        gaps += sum(watcher.gaps for watcher in watchers)
+
+        for client in players:
+            client.call("exit_server")
+        for client in clients:
+            client.close()
+        for connection in slow:
+            connection.close()
+
+    for client in players:
+        client.close()
+    return latencies, wrong, gaps
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the spectators of the games")
+    parser.add_argument("--engine", default="threaded", help="engine of the server")
+    parser.add_argument("--port", type=int, default=5080, help="first port of the servers started")
+    parser.add_argument("--spectators", type=int, nargs="+", default=[0, 100, 500],
+                        help="spectators reading every message")
+    parser.add_argument("--slow", type=int, default=10, help="spectators never reading, when there are spectators")
+    parser.add_argument("--games", type=int, default=3, help="17x17 games played for each number of spectators")
+    parser.add_argument("--spectator-timeout", type=float, default=2.0,
+                        help="seconds after which the server drops a spectator that does not read anything")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    print(f"{'spectators':>10} {'slow':>5} {'moves':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'server p50 us':>14} "
+          f"{'server p99 us':>14} {'messages':>9} {'encoded':>8} {'resyncs':>8} {'dropped':>8} {'wrong':>6}")
+    for index, spectators in enumerate(args.spectators):
+        port = args.port + index
+        slow = args.slow if spectators else 0
+        server = start_server(args.engine, port, ["--spectator-timeout", str(args.spectator_timeout)])
+        try:
+            latencies, wrong, gaps = play_watched_games(port, args.games, spectators, slow, rng)
+
+            stats_client = GameClient(HOST, port, reconnect=False)
+            stats_client.connect().result(10)
+            stats = stats_client.call("get_stats")
+            stats_client.close()
+
+            # Time spent by the server on the moves, without the clients decoding the messages on the same machine
+            moves = stats["requests"]["make_move"]
+        finally:
+            server.kill()
+            server.wait()
+
+        print(f"{spectators:>10} {slow:>5} {len(latencies):>6} {statistics.median(latencies) * 1e3:>7.2f} "
+              f"{percentile(latencies, 0.95) * 1e3:>7.2f} {percentile(latencies, 0.99) * 1e3:>7.2f} "
+              f"{moves['p50_us']:>14} {moves['p99_us']:>14} {stats['spectator_messages']:>9} {stats['spectator_encodings']:>8} {stats['spectator_resyncs']:>8} "
+              f"{stats['spectators_dropped']:>8} {wrong + gaps:>6}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Hammer a single game from many connections at once and check that its state stays consistent.
+
+A server is started in a subprocess, then:
+1. Every connection tries to create a server with the same name at the same time: exactly one must succeed.
+2. Every player joins the same game at the same time, and every player sends START at the same time:
+   every join and exactly one start must succeed.
+3. Every player sends MAKE_MOVE on random cells as fast as possible, whether it is his turn or not, until the
+   board is full. A watcher subscribed to the game records every pushed state.
+
+The pushed states must show one new cell per move, played by the current player, in the order of the turns,
+and no cell may ever change. The number of successful moves of each player must match his cells on the board.
+
+Run from the root of the repository:
+    python -m benchmark.stress_game --players 12 --engine threaded
+"""
+import argparse
+import random
+import threading
+import time
+
+from api_client import ClientAPI
+from benchmark.server_engines import HOST, start_server
+from game_client import GameClient
+from serialization import BINARY
+
+class StressClient:
+    """
+    Connection of a player of the stress test, recording the states pushed by the server.
+    """
+
+    def __init__(self, port: int):
+        """
+        :param port: Port of the server
+        """
+        self.pushes: list[dict] = list()
+        self.client = GameClient(HOST, port, (BINARY,), on_push=self.pushes.append, reconnect=False, timeout=30)
+        self.name: str = self.client.connect().result(30)["name"]
+
+    def request(self, msg: str) -> dict:
+        """
+        Send a request and wait for its response
+        :param msg: request to send
+        :return: the decoded response
+        """
+        return self.client.call(msg)
+
+def run_together(clients: list[StressClient], action) -> list:
+    """
+    Run an action on every client at the same time, each one in its own thread
+    :param clients: StressClient objects
+    :param action: function called with a client, after every thread is ready
+    :return: the results of the action, in the order of the clients
+    """
+    barrier = threading.Barrier(len(clients))
+    results = [None] * len(clients)
+
+    def run(index: int):
+        barrier.wait()
+        results[index] = action(clients[index])
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(len(clients))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def check_pushes(pushes: list[dict], players: list[str]) -> int:
+    """
+    Check that the pushed moves follow the rules of the game
+    :param pushes: states pushed to the watcher, in order
+    :param players: names of the players, in the order of their symbols
+    :return: the number of moves checked
+    """
+    moves = [push for push in pushes if push["event"] == "move"]
+    start = next(push for push in pushes if push["event"] == "start")
+
+    previous = start
+    for move in moves:
+        changed = [(x, y) for x, row in enumerate(move["board"]) for y, cell in enumerate(row)
+                   if cell != previous["board"][x][y]]
+        assert len(changed) == 1, f"{len(changed)} cells changed in a single move"
+
+        x, y = changed[0]
+        assert previous["board"][x][y] == 0, f"The cell ({x}, {y}) was overwritten"
+
+        # The symbol of a player is his position in the list of players, plus one
+        mover = previous["current_player"]
+        assert move["board"][x][y] == players.index(mover) + 1, f"({x}, {y}) was not played by {mover}"
+
+        expected_next = players[(players.index(mover) + 1) % len(players)]
+        assert move["current_player"] == expected_next, f"{move['current_player']} plays after {mover}"
+
+        previous = move
+
+    return len(moves)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress a single game from many connections")
+    parser.add_argument("--engine", choices=("threaded", "asyncio"), default="threaded")
+    parser.add_argument("--players", type=int, default=12, help="players of the game (at most 16)")
+    parser.add_argument("--port", type=int, default=5200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    process = start_server(args.engine, args.port)
+    try:
+        players = [StressClient(args.port) for _ in range(args.players)]
+        watcher = StressClient(args.port)
+
+        # 1. Every player creates the same server at the same time
+        created = run_together(players, lambda client: client.request(f"{ClientAPI.NEW_SERVER}/Race"))
+        successes = sum(response["status"] == "success" for response in created)
+        assert successes == 1, f"{successes} servers created with the same name"
+        run_together(players, lambda client: client.request(ClientAPI.EXIT_SERVER))
+        print(f"create: 1 of {args.players} simultaneous creations succeeded")
+
+        # 2. Every player joins the game of the host at the same time, then everyone starts it
+        host, guests = players[0], players[1:]
+        host.request(f"{ClientAPI.NEW_SERVER}/Stress")
+        watcher.request(f"{ClientAPI.SUBSCRIBE}/Stress")
+
+        joined = run_together(guests, lambda client: client.request(f"{ClientAPI.JOIN_SERVER}/Stress"))
+        assert all(response["status"] == "success" for response in joined), "A join failed"
+
+        state = watcher.request(f"{ClientAPI.GET_SERVER}/Stress")
+        names = state["players"]
+        assert sorted(names) == sorted(client.name for client in players), "The players of the game differ"
+        assert len(set(names)) == len(names), "A player joined twice"
+
+        started = run_together(players, lambda client: client.request(f"{ClientAPI.START_GAME}/Stress"))
+        successes = sum(response["status"] == "success" for response in started)
+        assert successes == 1, f"The game was started {successes} times"
+        print(f"join: {len(guests)} simultaneous joins succeeded, 1 of {args.players} starts succeeded")
+
+        # 3. Every player plays random cells as fast as possible until the board is full
+        size = len(watcher.request(f"{ClientAPI.GET_SERVER}/Stress")["board"])
+        rng = random.Random(args.seed)
+        seeds = [rng.random() for _ in players]
+
+        def hammer(client: StressClient) -> tuple[int, int]:
+            player_rng = random.Random(seeds[players.index(client)])
+            done, sent = 0, 0
+            while True:
+                x, y = player_rng.randrange(size), player_rng.randrange(size)
+                response = client.request(f"{ClientAPI.MAKE_MOVE}/Stress/{x}/{y}")
+                sent += 1
+                done += response["status"] == "success"
+                if all(cell != 0 for row in response["board"] for cell in row):
+                    return done, sent
+
+        start = time.perf_counter()
+        results = run_together(players, hammer)
+        elapsed = time.perf_counter() - start
+
+        # Wait for the last pushes
+        time.sleep(0.5)
+
+        final = watcher.request(f"{ClientAPI.GET_SERVER}/Stress")
+        assert final["board"] == watcher.pushes[-1]["board"], "The last push differs from the final state"
+
+        for client, (done, sent) in zip(players, results):
+            cells = sum(cell == names.index(client.name) + 1 for row in final["board"] for cell in row)
+            assert done == cells, f"{client.name} made {done} moves but owns {cells} cells"
+
+        moves = check_pushes(watcher.pushes, names)
+        assert moves == size * size, f"{moves} moves pushed for {size * size} cells"
+
+        sent = sum(sent for done, sent in results)
+        print(f"moves: {moves} moves out of {sent} requests in {elapsed:.2f}s ({sent / elapsed:.0f} req/s), "
+              f"turn order and board consistent")
+
+        for client in players + [watcher]:
+            client.client.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+if __name__ == '__main__':
+    main()
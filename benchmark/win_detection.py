@@ -0,0 +1,76 @@
+"""
+Compare the full scan of Game.check_winner with the incremental Game.check_winner_at.
+
+Random games are played on boards of 3x3 to 18x18 cells. After each move, both checks are timed on the same
+board, until the first winner.
+
+Run from the root of the repository:
+    python -m benchmark.win_detection --games 200
+"""
+import argparse
+import random
+import time
+
+from game import Game
+from player import Player
+
+def play_random_game(size: int, rng: random.Random) -> tuple[float, float, int]:
+    """
+    Play a random game and time both winner checks after every move
+    :param size: Size of the board
+    :param rng: Random generator
+    :return: (time of the full checks, time of the incremental checks, number of moves)
+    """
+    game = Game("benchmark")
+    for i in range(size - 1):
+        game.add_player(Player(("benchmark", i), f"Player{i}"))
+    game.start()
+
+    cells = [(x, y) for x in range(size) for y in range(size)]
+    rng.shuffle(cells)
+
+    full_time, incremental_time, moves = 0.0, 0.0, 0
+    for x, y in cells:
+        game.bitboard.place(x, y, game.symbols[game.current_player])
+        game.current_player = game._get_next_player(game.current_player)
+        moves += 1
+
+        start = time.perf_counter()
+        full_winner = game.check_winner()
+        full_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        incremental_winner = game.check_winner_at(x, y)
+        incremental_time += time.perf_counter() - start
+
+        # The first winner is always found by both checks
+        assert full_winner[0] == incremental_winner[0]
+
+        if incremental_winner[0] != 0:
+            break
+
+    return full_time, incremental_time, moves
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the winner checks")
+    parser.add_argument("--games", type=int, default=200, help="random games played for each board size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    print(f"{'size':>4} {'full (us/move)':>15} {'incremental (us/move)':>22} {'speedup':>8}")
+    for size in range(3, 19):
+        full_time, incremental_time, moves = 0.0, 0.0, 0
+        for _ in range(args.games):
+            game_full, game_incremental, game_moves = play_random_game(size, rng)
+            full_time += game_full
+            incremental_time += game_incremental
+            moves += game_moves
+
+        full_us = full_time / moves * 1e6
+        incremental_us = incremental_time / moves * 1e6
+        print(f"{size:>4} {full_us:>15.2f} {incremental_us:>22.2f} {full_us / incremental_us:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
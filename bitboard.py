@@ -0,0 +1,261 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Smallest board and win length scanned with NumPy by find_winning_line when it is installed. The shifts of the
+# bitmasks already compare a whole board at once, once per symbol: NumPy is only faster for the lines of 4 cells or
+# more on the boards of 96 rows or more, which are the default boards of 95 players or more (see
+# benchmark/board_variants.py).
+NUMPY_MIN_SIZE = 96
+NUMPY_MIN_LENGTH = 4
+
+class BitBoard:
+    """
+    Define a compact game board, stored as one integer bitmask per symbol.
+    The cell (x, y) is the bit x * stride + y, where stride = size + 1. The extra column of each row is always empty,
+    so a line of bits can never wrap from the end of a row to the beginning of the next one.
+    """
+
+    __slots__ = ("size", "stride", "masks", "occupied", "shifts")
+
+    def __init__(self, size: int):
+        """
+        :param size: Number of rows and columns of the board
+        """
+        self.size: int = size
+        self.stride: int = size + 1
+
+        # Bitmask of the cells of each symbol, indexed by symbol (the index 0 is unused)
+        self.masks: list[int] = [0]
+
+        # Bitmask of all the cells taken
+        self.occupied: int = 0
+
+        # Shift between two consecutive cells of a row, a column, a diagonal and an anti-diagonal
+        self.shifts: tuple[int, int, int, int] = (1, self.stride, self.stride + 1, self.stride - 1)
+
+    def index(self, x: int, y: int) -> int:
+        """
+        Get the bit of a cell
+        :param x: The x-position of the cell
+        :param y: The y-position of the cell
+        :return: the index of the bit
+        """
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise IndexError(f"Cell ({x}, {y}) is outside of the board")
+        return x * self.stride + y
+
+    def is_free(self, x: int, y: int) -> bool:
+        """
+        Check if a cell is empty
+        :param x: The x-position of the cell
+        :param y: The y-position of the cell
+        :return: True if no symbol is in the cell
+        """
+        return not self.occupied >> self.index(x, y) & 1
+
+    def is_full(self) -> bool:
+        """
+        Check if every cell is taken
+        :return: True if the board is full
+        """
+        return self.occupied.bit_count() == self.size * self.size
+
+    def get(self, x: int, y: int) -> int:
+        """
+        Get the symbol of a cell
+        :param x: The x-position of the cell
+        :param y: The y-position of the cell
+        :return: the symbol, 0 if the cell is empty
+        """
+        bit = 1 << self.index(x, y)
+        if not self.occupied & bit:
+            return 0
+        for symbol, mask in enumerate(self.masks):
+            if mask & bit:
+                return symbol
+        return 0
+
+    def place(self, x: int, y: int, symbol: int):
+        """
+        Put a symbol in an empty cell
+        :param x: The x-position of the cell
+        :param y: The y-position of the cell
+        :param symbol: The symbol of the player
+        :return: None
+        """
+        bit = 1 << self.index(x, y)
+        if symbol >= len(self.masks):
+            self.masks.extend([0] * (symbol + 1 - len(self.masks)))
+        self.masks[symbol] |= bit
+        self.occupied |= bit
+
+    def _runs(self, mask: int, shift: int, length: int) -> int:
+        """
+        Find the lines of a bitmask
+        :param mask: Bitmask of the cells of a symbol
+        :param shift: Shift between two consecutive cells of the line
+        :param length: Number of cells of a line
+        :return: a bitmask of the first cell of every line of length cells
+        """
+        runs = mask
+        for k in range(1, length):
+            runs &= mask >> (k * shift)
+        return runs
+
+    def _cells(self, start: int, shift: int, length: int) -> list[tuple[int, int]]:
+        return [divmod(start + k * shift, self.stride) for k in range(length)]
+
+    def winning_line_at(self, x: int, y: int, length: int, symbol: int = 0) -> tuple[int, list[tuple[int, int]]]:
+        """
+        Find a line of length cells of the same symbol going through a cell.
+        The row, the column, the diagonal and the anti-diagonal of the cell are checked in this order.
+        :param x: The x-position of the cell
+        :param y: The y-position of the cell
+        :param length: Number of aligned symbols needed
+        :param symbol: The symbol of the cell if it is already known, to avoid looking for it
+        :return: A tuple containing the symbol and the cells of the line, (0, []) if there is no line
+        """
+        if symbol == 0:
+            symbol = self.get(x, y)
+            if symbol == 0:
+                return 0, []
+
+        cell = x * self.stride + y
+        mask = self.masks[symbol]
+
+        for shift in self.shifts:
+            # Count the same symbols before the cell. The empty extra column stops the lines at the border.
+            before = 0
+            bit = cell - shift
+            while before < length - 1 and bit >= 0 and mask >> bit & 1:
+                before += 1
+                bit -= shift
+
+            # Count the same symbols after the cell
+            after = 0
+            bit = cell + shift
+            while before + after < length - 1 and mask >> bit & 1:
+                after += 1
+                bit += shift
+
+            if before + after + 1 >= length:
+                return symbol, self._cells(cell - before * shift, shift, length)
+
+        return 0, []
+
+    def find_winning_line(self, length: int) -> tuple[int, list[tuple[int, int]]]:
+        """
+        Find a line of length cells of the same symbol anywhere on the board.
+        Rows are checked first, then columns, diagonals and anti-diagonals. Rows and diagonals are scanned row by row,
+        columns are scanned column by column.
+        The large boards are scanned for the long lines with NumPy when it is installed, the others with the
+        bitmasks: both find the same line.
+        :param length: Number of aligned symbols needed
+        :return: A tuple containing the symbol and the cells of the line, (0, []) if there is no line
+        """
+        if numpy is not None and self.size >= NUMPY_MIN_SIZE and length >= NUMPY_MIN_LENGTH:
+            return self.find_winning_line_numpy(length)
+        return self.find_winning_line_bits(length)
+
+    def find_winning_line_bits(self, length: int) -> tuple[int, list[tuple[int, int]]]:
+        """
+        Find a line of length cells of the same symbol anywhere on the board, with shifts of the bitmasks
+        :param length: Number of aligned symbols needed
+        :return: A tuple containing the symbol and the cells of the line, (0, []) if there is no line
+        """
+        for shift in self.shifts:
+            best = None
+            for symbol, mask in enumerate(self.masks):
+                runs = self._runs(mask, shift, length)
+                while runs:
+                    start = (runs & -runs).bit_length() - 1
+                    runs &= runs - 1
+
+                    x, y = divmod(start, self.stride)
+                    key = (y, x) if shift == self.stride else (x, y)
+                    if best is None or key < best[0]:
+                        best = key, symbol, start
+
+                    # The lowest bit is the first cell in the order of the rows
+                    if shift != self.stride:
+                        break
+
+            if best is not None:
+                key, symbol, start = best
+                return symbol, self._cells(start, shift, length)
+
+        return 0, []
+
+    def to_list(self) -> list[list[int]]:
+        """
+        Export the board as a matrix of symbols
+        :return: list of rows, each row being a list of symbols (0 for an empty cell)
+        """
+        board = [[0] * self.size for _ in range(self.size)]
+        for symbol, mask in enumerate(self.masks):
+            while mask:
+                cell = (mask & -mask).bit_length() - 1
+                mask &= mask - 1
+                x, y = divmod(cell, self.stride)
+                board[x][y] = symbol
+        return board
+
+    def _flat_array(self):
+        cells = self.size * self.stride
+        board = numpy.zeros(cells, dtype=numpy.uint8)
+
+        # The cells of the symbols never overlap, so each one is added with a bitwise or
+        for symbol, mask in enumerate(self.masks):
+            if mask:
+                packed = numpy.frombuffer(mask.to_bytes((cells + 7) // 8, "little"), dtype=numpy.uint8)
+                bits = numpy.unpackbits(packed, count=cells, bitorder="little")
+                if symbol != 1:
+                    bits *= symbol
+                board |= bits
+        return board
+
+    def to_array(self):
+        """
+        Export the board as a NumPy matrix of symbols (NumPy must be installed)
+        :return: array of shape (size, size) and type uint8, 0 for an empty cell
+        """
+        return self._flat_array().reshape(self.size, self.stride)[:, :self.size]
+
+    def find_winning_line_numpy(self, length: int) -> tuple[int, list[tuple[int, int]]]:
+        """
+        Find a line of length cells of the same symbol anywhere on the board, with sliding windows over a NumPy array
+        of the cells laid out as the bits of the bitmasks (the empty extra column stops the lines at the border).
+        For each shift, the cells equal to the next one are compared at once, then the windows of length - 1 such
+        pairs are joined by doubling: about log2(length) operations on the whole board instead of a loop over the
+        cells or the symbols.
+        Finds the same line as find_winning_line_bits (NumPy must be installed).
+        :param length: Number of aligned symbols needed
+        :return: A tuple containing the symbol and the cells of the line, (0, []) if there is no line
+        """
+        board = self._flat_array()
+
+        for shift in self.shifts:
+            # First cells of the windows of 1, then 2, 4... consecutive equal pairs
+            runs = board != 0
+            if length > 1:
+                runs = runs[:-shift] & (board[:-shift] == board[shift:])
+            pairs = 1
+            while pairs < length - 1:
+                step = min(pairs, length - 1 - pairs) * shift
+                runs = runs[:len(runs) - step] & runs[step:]
+                pairs += step // shift
+
+            starts = numpy.flatnonzero(runs)
+            if not len(starts):
+                continue
+
+            # The lowest index is the first cell in the order of the rows, the columns are scanned column by column
+            if shift == self.stride:
+                start = int(starts[numpy.argmin(starts % self.stride * self.stride + starts // self.stride)])
+            else:
+                start = int(starts[0])
+            return int(board[start]), self._cells(start, shift, length)
+
+        return 0, []
@@ -0,0 +1,571 @@
+"""
+Computer players of the server.
+
+A bot is a player added to a lobby with ADD_BOT. When its turn comes, it chooses its move with an iterative
+deepening alpha-beta search, bounded by a time budget and a number of nodes, and stores the positions it has searched
+in a transposition table indexed by Zobrist hashes.
+With more than 2 players the search is paranoid: every other player is assumed to play against the bot, so the
+bot maximizes its score and all the other players minimize it.
+
+The search never runs on the threads handling the requests: the bots think on their own threads, and can search in
+separate processes so they do not hold the GIL of the server either.
+"""
+
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from game import WIN_LENGTH, Game
+from game_registry import GameRegistry
+from name_allocator import NameAllocationError, NameAllocator
+from player import Player
+
+# Score of a won position, before the bonus of the remaining depth (faster wins score more)
+WIN_SCORE = 1_000_000
+
+# Score of a line of the win length holding only the symbols of one player, by number of symbols
+LINE_WEIGHTS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+# Number of positions kept in the transposition table before it is cleared
+TABLE_SIZE = 1 << 18
+
+# The time is checked every CHECK_INTERVAL nodes
+CHECK_INTERVAL = 32
+
+# Bounds stored in the transposition table
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class SearchAborted(Exception):
+    """
+    Raised when the time budget or the node limit of a search is exhausted.
+    """
+
+class Position:
+    """
+    Define a position of a game, copied from its bitboard so the search does not need the lock of the game.
+    """
+
+    __slots__ = ("size", "stride", "masks", "occupied", "order", "turn", "win_length")
+
+    def __init__(self, size: int, masks: list[int], occupied: int, order: list[int], turn: int,
+                 win_length: int = WIN_LENGTH):
+        """
+        :param size: Number of rows and columns of the board
+        :param masks: Bitmask of the cells of each symbol, indexed by symbol (see bitboard.BitBoard)
+        :param occupied: Bitmask of all the cells taken
+        :param order: Symbols of the players in the order of their turns
+        :param turn: Index in order of the player to move
+        :param win_length: Number of aligned symbols needed to win
+        """
+        self.size: int = size
+        self.stride: int = size + 1
+        self.masks: list[int] = list(masks) + [0] * (max(order) + 1 - len(masks))
+        self.occupied: int = occupied
+        self.order: list[int] = order
+        self.turn: int = turn
+        self.win_length: int = win_length
+
+    @classmethod
+    def from_game(cls, game: Game) -> "Position":
+        """
+        Copy the position of a started game. The lock of the game must be held.
+        :param game: Game object
+        :return: Position object
+        """
+        board = game.bitboard
+        order = [game.symbols[player] for player in game.players]
+        return cls(board.size, board.masks, board.occupied, order, game.players.index(game.current_player),
+                   game.win_length)
+
+class Geometry:
+    """
+    Define the lines and the neighbours of the cells of a board size, shared by the searches on this size.
+    """
+
+    def __init__(self, size: int, win_length: int):
+        """
+        :param size: Number of rows and columns of the board
+        :param win_length: Number of aligned symbols needed to win
+        """
+        self.size: int = size
+        self.stride: int = size + 1
+        self.win_length: int = win_length
+
+        # Bitmask of the cells of the board, without the extra column
+        self.cells: int = sum(1 << (x * self.stride + y) for x in range(size) for y in range(size))
+
+        # Shift between two consecutive cells of a row, a column, a diagonal and an anti-diagonal
+        self.shifts: tuple[int, ...] = (1, self.stride, self.stride + 1, self.stride - 1)
+
+        # Bitmask of the first cell of every line of the win length, for each shift
+        self.starts: list[int] = list()
+        for shift in self.shifts:
+            starts = self.cells
+            for k in range(1, win_length):
+                starts &= self.cells >> (k * shift)
+            self.starts.append(starts)
+
+        # Lines of the win length going through each cell, as bitmasks
+        self.lines: dict[int, list[int]] = {bit: list() for bit in self.bits(self.cells)}
+        for shift, starts in zip(self.shifts, self.starts):
+            for start in self.bits(starts):
+                line = sum(1 << (start + k * shift) for k in range(win_length))
+                for bit in self.bits(line):
+                    self.lines[bit].append(line)
+
+        # Cells around each cell
+        self.neighbours: dict[int, int] = {bit: self.around(1 << bit) & self.cells for bit in self.lines}
+
+        # Center of the board, the first move on an empty board
+        self.center: int = (size // 2) * self.stride + size // 2
+
+    @staticmethod
+    def bits(mask: int):
+        """
+        Iterate over the bits of a mask
+        :param mask: bitmask
+        :return: generator of the indexes of the bits set, lowest first
+        """
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def around(self, mask: int) -> int:
+        """
+        Get the cells next to the cells of a mask, in the 8 directions
+        :param mask: bitmask of cells
+        :return: bitmask of the cells around, outside of the extra column
+        """
+        result = 0
+        for shift in self.shifts:
+            result |= mask << shift | mask >> shift
+        return result & self.cells
+
+class Searcher:
+    """
+    Iterative deepening alpha-beta search with a Zobrist-hashed transposition table.
+    The table is kept between the searches, so the positions of the previous moves of a game are reused.
+    """
+
+    def __init__(self, seed: int = 0):
+        """
+        :param seed: Seed of the random Zobrist keys
+        """
+        self.rng = random.Random(seed)
+
+        # Random key of each (symbol, cell), extended when a bigger board or symbol is seen
+        self.keys: list[list[int]] = list()
+
+        # Random key of the index of the player to move
+        self.turn_keys: list[int] = list()
+
+        # Geometry of each (board size, win length)
+        self.geometries: dict[tuple[int, int], Geometry] = dict()
+
+        # Zobrist hash -> (depth, score, bound, best move)
+        self.table: dict[int, tuple[int, int, int, int]] = dict()
+
+        # State of the running search
+        self.nodes: int = 0
+        self.node_limit: int = 0
+        self.deadline: float = 0.0
+
+    def _key(self, symbol: int, bit: int) -> int:
+        while len(self.keys) <= symbol:
+            self.keys.append(list())
+        keys = self.keys[symbol]
+        while len(keys) <= bit:
+            keys.append(self.rng.getrandbits(64))
+        return keys[bit]
+
+    def _turn_key(self, turn: int) -> int:
+        while len(self.turn_keys) <= turn:
+            self.turn_keys.append(self.rng.getrandbits(64))
+        return self.turn_keys[turn]
+
+    def hash(self, position: Position, me: int) -> int:
+        """
+        Compute the Zobrist hash of a position, from the point of view of a player
+        :param position: Position object
+        :param me: Symbol of the player searching
+        :return: 64-bit hash
+        """
+        # The scores depend on the players and the searching player, not only on the cells
+        key = hash((position.size, position.win_length, tuple(position.order), me)) & ((1 << 64) - 1)
+        for symbol, mask in enumerate(position.masks):
+            for bit in Geometry.bits(mask):
+                key ^= self._key(symbol, bit)
+        return key ^ self._turn_key(position.turn)
+
+    def geometry(self, size: int, win_length: int) -> Geometry:
+        """
+        Get the geometry of a board, built once per size and win length
+        :param size: Number of rows of the board
+        :param win_length: Number of aligned symbols winning the game
+        :return: Geometry object
+        """
+        geometry = self.geometries.get((size, win_length))
+        if geometry is None:
+            geometry = self.geometries[(size, win_length)] = Geometry(size, win_length)
+        return geometry
+
+    def choose_move(self, position: Position, time_budget: float, node_limit: int) -> tuple[tuple[int, int], dict]:
+        """
+        Find the best move of the player to move
+        :param position: Position object, with at least one free cell
+        :param time_budget: Maximum time of the search in seconds
+        :param node_limit: Maximum number of positions searched
+        :return: ((x, y) of the move, statistics of the search: depth, nodes, score)
+        """
+        geometry = self.geometry(position.size, position.win_length)
+        me = position.order[position.turn]
+
+        self.nodes = 0
+        self.node_limit = node_limit
+        self.deadline = time.perf_counter() + time_budget
+
+        if len(self.table) > TABLE_SIZE:
+            self.table.clear()
+
+        root_hash = self.hash(position, me)
+        free = (geometry.cells & ~position.occupied).bit_count()
+
+        # A move is always ready, even if the first depth cannot be searched completely
+        best_move = self._moves(position, geometry, root_hash)[0]
+        best_score, depth_done = 0, 0
+
+        for depth in range(1, free + 1):
+            try:
+                best_score, best_move = self._search_root(position, geometry, me, depth, root_hash)
+            except SearchAborted:
+                break
+            depth_done = depth
+
+            # A forced win or loss was found, a deeper search cannot change it
+            if abs(best_score) >= WIN_SCORE:
+                break
+
+        statistics = {"depth": depth_done, "nodes": self.nodes, "score": best_score}
+        return divmod(best_move, position.stride), statistics
+
+    def _search_root(self, position: Position, geometry: Geometry, me: int, depth: int,
+                     key: int) -> tuple[int, int]:
+        alpha, beta = -WIN_SCORE * 2, WIN_SCORE * 2
+        best_score, best_move = -WIN_SCORE * 2, None
+
+        for bit in self._moves(position, geometry, key):
+            score = self._play(position, geometry, me, depth, alpha, beta, key, bit)
+            if score > best_score:
+                best_score, best_move = score, bit
+            alpha = max(alpha, score)
+
+        self.table[key] = depth, best_score, EXACT, best_move
+        return best_score, best_move
+
+    def _play(self, position: Position, geometry: Geometry, me: int, depth: int, alpha: int, beta: int, key: int,
+              bit: int) -> int:
+        """
+        Play a move, score the position reached and undo the move
+        :return: the score of the move for me
+        """
+        symbol = position.order[position.turn]
+        cell = 1 << bit
+        position.masks[symbol] |= cell
+        position.occupied |= cell
+        previous_turn = position.turn
+        position.turn = (position.turn + 1) % len(position.order)
+        child_key = key ^ self._key(symbol, bit) ^ self._turn_key(previous_turn) ^ self._turn_key(position.turn)
+
+        try:
+            mask = position.masks[symbol]
+            if any(mask & line == line for line in geometry.lines[bit]):
+                # The sooner the win, the higher the score
+                score = WIN_SCORE + depth if symbol == me else -WIN_SCORE - depth
+            elif position.occupied & geometry.cells == geometry.cells:
+                score = 0
+            else:
+                score = self._alpha_beta(position, geometry, me, depth - 1, alpha, beta, child_key)
+        finally:
+            position.masks[symbol] &= ~cell
+            position.occupied &= ~cell
+            position.turn = previous_turn
+        return score
+
+    def _alpha_beta(self, position: Position, geometry: Geometry, me: int, depth: int, alpha: int, beta: int,
+                    key: int) -> int:
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0:
+            if self.nodes >= self.node_limit or time.perf_counter() >= self.deadline:
+                raise SearchAborted()
+
+        # Transposition table
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= depth:
+            _, score, bound, _ = entry
+            if bound == EXACT:
+                return score
+            if bound == LOWER and score >= beta:
+                return score
+            if bound == UPPER and score <= alpha:
+                return score
+
+        if depth == 0:
+            return self.evaluate(position, geometry, me)
+
+        original_alpha, original_beta = alpha, beta
+        maximizing = position.order[position.turn] == me
+        best_score = -WIN_SCORE * 2 if maximizing else WIN_SCORE * 2
+        best_move = None
+
+        for bit in self._moves(position, geometry, key):
+            score = self._play(position, geometry, me, depth, alpha, beta, key, bit)
+            if maximizing:
+                if score > best_score:
+                    best_score, best_move = score, bit
+                alpha = max(alpha, score)
+            else:
+                if score < best_score:
+                    best_score, best_move = score, bit
+                beta = min(beta, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= original_beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table[key] = depth, best_score, bound, best_move
+        return best_score
+
+    def _moves(self, position: Position, geometry: Geometry, key: int) -> list[int]:
+        """
+        List the moves worth searching: the free cells next to a taken cell, the most surrounded first, and the best
+        move of the transposition table before them
+        :return: the bits of the cells
+        """
+        free = geometry.cells & ~position.occupied
+        if position.occupied == 0:
+            return [geometry.center]
+
+        candidates = geometry.around(position.occupied) & free
+        moves = sorted(Geometry.bits(candidates),
+                       key=lambda bit: -(geometry.neighbours[bit] & position.occupied).bit_count())
+
+        entry = self.table.get(key)
+        if entry is not None and entry[3] is not None and candidates >> entry[3] & 1:
+            moves.remove(entry[3])
+            moves.insert(0, entry[3])
+        return moves
+
+    def evaluate(self, position: Position, geometry: Geometry, me: int) -> int:
+        """
+        Score a position without searching further: every line of the win length holding only the symbols of one
+        player counts for this player, more with more symbols
+        :param position: Position object
+        :param geometry: Geometry of the board
+        :param me: Symbol of the player searching
+        :return: the score for me, the lines of the other players counting against me
+        """
+        score = 0
+        length = geometry.win_length
+        for symbol in set(position.order):
+            mask = position.masks[symbol]
+            if not mask:
+                continue
+            others = position.occupied & ~mask
+            value = 0
+
+            for shift, starts in zip(geometry.shifts, geometry.starts):
+                # Lines without any symbol of another player
+                open_lines = starts
+                for k in range(length):
+                    open_lines &= ~(others >> (k * shift))
+                if not open_lines:
+                    continue
+
+                # Count the symbols of each open line, with one bitmask per bit of the count
+                planes: list[int] = list()
+                for k in range(length):
+                    carry = (mask >> (k * shift)) & open_lines
+                    for index in range(len(planes)):
+                        planes[index], carry = planes[index] ^ carry, planes[index] & carry
+                        if not carry:
+                            break
+                    if carry:
+                        planes.append(carry)
+
+                for count in range(1, length):
+                    lines = open_lines
+                    for index, plane in enumerate(planes):
+                        lines &= plane if count >> index & 1 else ~plane
+                    value += LINE_WEIGHTS[min(count, len(LINE_WEIGHTS) - 1)] * lines.bit_count()
+
+            score += value if symbol == me else -value
+        return score
+
+# Searcher of each thread or process running searches
+_searchers = threading.local()
+
+def choose_move(position: Position, time_budget: float, node_limit: int) -> tuple[tuple[int, int], dict]:
+    """
+    Find the best move of the player to move, with the searcher of the current thread.
+    The function and its arguments can be pickled, to run the search in another process.
+    :param position: Position object
+    :param time_budget: Maximum time of the search in seconds
+    :param node_limit: Maximum number of positions searched
+    :return: ((x, y) of the move, statistics of the search)
+    """
+    searcher = getattr(_searchers, "searcher", None)
+    if searcher is None:
+        searcher = _searchers.searcher = Searcher()
+    return searcher.choose_move(position, time_budget, node_limit)
+
+class Bot(Player):
+    """
+    Define a computer player.
+    """
+
+class BotManager:
+    """
+    Add the bots to the games and play their turns.
+    The bots of a game are notified of its changes: when the turn of a bot comes, its search is handed to the
+    threads of the bots, and its move is made like the move of a human player, if the game did not change meanwhile.
+    When only bots are left in a game, they leave it, and the game is removed.
+    """
+
+    def __init__(self, registry: GameRegistry, names: NameAllocator, time_budget: float = 0.5,
+                 node_limit: int = 200_000, threads: int = 1, search_executor: Executor | None = None):
+        """
+        :param registry: Registry of the games
+        :param names: Allocator of the names of the players, shared with the human players
+        :param time_budget: Maximum thinking time of a move in seconds
+        :param node_limit: Maximum number of positions searched for a move
+        :param threads: Number of threads playing the moves of the bots
+        :param search_executor: Executor running the searches (a ProcessPoolExecutor), None to search on the
+        threads of the bots
+        """
+        self.registry: GameRegistry = registry
+        self.names: NameAllocator = names
+        self.time_budget: float = time_budget
+        self.node_limit: int = node_limit
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="bot")
+        self.search_executor: Executor | None = search_executor
+
+        # Function running a function on the threads of the server that change the games
+        self.dispatch = lambda function: function()
+
+        # Bots playing, by name
+        self.bots: dict[str, Bot] = dict()
+        self.lock = threading.Lock()
+        self.counter = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self.bots)
+
+    def add_bot(self, game: Game) -> Bot | None:
+        """
+        Add a bot to a game waiting for players
+        :param game: A Game object of the registry
+        :return: the Bot object, or None if the game has started or has been removed
+        """
+        try:
+            bot = Bot(("bot", next(self.counter)), self.names.allocate())
+        except NameAllocationError:
+            return None
+
+        with game.lock:
+            if self.on_game_event not in game.observers:
+                game.observers.append(self.on_game_event)
+            if not self.registry.add_player(game, bot):
+                self.names.release(bot.name)
+                return None
+
+        with self.lock:
+            self.bots[bot.name] = bot
+        return bot
+
+    def restore(self, game: Game, bot: Bot):
+        """
+        Take back a bot of a game rebuilt after a restart of the server. Its name must be reserved.
+        :param game: A Game object of the registry
+        :param bot: A Bot object inside the game
+        :return: None
+        """
+        with self.lock:
+            self.bots[bot.name] = bot
+
+        with game.lock:
+            if self.on_game_event not in game.observers:
+                game.observers.append(self.on_game_event)
+
+            # The turn of the bot may have come before the restart
+            self.on_game_event(game, "restore")
+
+    def on_game_event(self, game: Game, event: str):
+        """
+        Observer of the games with bots, called while the lock of the game is held: nothing is done on this thread
+        :param game: Game object that changed
+        :param event: Name of the change
+        :return: None
+        """
+        if not any(not isinstance(player, Bot) for player in game.players):
+            if any(isinstance(player, Bot) for player in game.players):
+                self.executor.submit(self._leave, game)
+            return
+
+        if not game.has_started or game.winner[0] != 0 or game.bitboard.is_full():
+            return
+
+        if isinstance(game.current_player, Bot):
+            self.executor.submit(self._think, game, game.seq, Position.from_game(game))
+
+    def _think(self, game: Game, seq: int, position: Position):
+        """
+        Search the move of a bot, then make it. Runs on a thread of the bots.
+        :param game: Game object
+        :param seq: Sequence number of the position
+        :param position: Position of the game when the turn of the bot came
+        :return: None
+        """
+        try:
+            if self.search_executor is not None:
+                (x, y), statistics = self.search_executor.submit(
+                    choose_move, position, self.time_budget, self.node_limit).result()
+            else:
+                (x, y), statistics = choose_move(position, self.time_budget, self.node_limit)
+        except Exception:
+            logging.exception(f"The search of a bot failed in {game.name}")
+            return
+
+        def make_move():
+            with game.lock:
+                # The game changed during the search (a player left): the bot is asked again if needed
+                if game.seq != seq or not isinstance(game.current_player, Bot):
+                    return
+                bot = game.current_player
+                self.registry.make_move(game, bot, x, y)
+            logging.debug(f"{bot.name} played ({x}, {y}) in {game.name}: {statistics}")
+
+        self.dispatch(make_move)
+
+    def _leave(self, game: Game):
+        """
+        Remove the bots of a game without human players. Runs on a thread of the bots.
+        :param game: Game object
+        :return: None
+        """
+        def leave():
+            for player in list(game.players):
+                if isinstance(player, Bot):
+                    if self.registry.remove_player(player) is not None:
+                        with self.lock:
+                            self.bots.pop(player.name, None)
+                        self.names.release(player.name)
+
+        self.dispatch(leave)
@@ -1,10 +1,11 @@
-import time
+import queue
 import tkinter as tk
 from tkinter import ttk
-import socket
-import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 
 from api_client import ClientAPI
+from game_client import GameClient
+from serialization import BINARY, JSON
 import json
 
 with open("config.json", "r") as file:
@@ -15,8 +16,85 @@ PORT = json_file['PORT']  # The port used by the server
 FORMAT = 'utf-8'
 ADDR = (HOST, PORT)  # Creating a tuple of IP+PORT
 
+# Number of servers asked in each request for the list of servers
+SERVERS_PAGE_SIZE = 100
+
+# Time between two checks of the changes pushed by the server, in milliseconds
+UPDATE_INTERVAL_MS = 20
+
+class BoardView:
+    """
+    Define the buttons of the board of a game.
+    The state of every button is remembered, so a new state of the game only reconfigures the buttons whose text or
+    enabled state changed.
+    """
+
+    def __init__(self, frame: tk.Frame, size: int, on_click):
+        """
+        :param frame: Frame holding the board
+        :param size: Number of rows and columns of the board
+        :param on_click: function called with (x, y) when a cell is clicked
+        """
+        # Board of the last state rendered, and its sequence number
+        self.board: list[list[int]] | None = None
+        self.seq: int = -1
+
+        # (text, state) of each button, as configured in Tk
+        self.cells: list[list[tuple[int, str] | None]] = [[None] * size for _ in range(size)]
+
+        self.buttons: list[list[ttk.Button]] = [[None] * size for _ in range(size)]
+        for i in range(size):
+            frame.rowconfigure(i, weight=1)
+            frame.columnconfigure(i, weight=1)
+            for j in range(size):
+                btn = ttk.Button(frame, command=lambda x=i, y=j: on_click(x, y), padding=5)
+                btn.grid(row=i, column=j, sticky="nsew", padx=5, pady=5)
+                self.buttons[i][j] = btn
+
+    def exists(self) -> bool:
+        """
+        :return: False if the page of the board has been destroyed
+        """
+        return self.buttons[0][0].winfo_exists()
+
+    def apply(self, response: dict) -> bool:
+        """
+        Update the board with a state of the game, or the moves played since the last state rendered
+        :param response: State pushed by the server, or reply to GET_SERVER and MAKE_MOVE
+        :return: False if the response is not newer than the last state rendered
+        """
+        if response['seq'] <= self.seq:
+            return False
+
+        # The pushed states have no "update" field, they always hold the whole board
+        update = response.get('update', "snapshot")
+        if update == "snapshot":
+            self.board = [list(row) for row in response['board']]
+        elif update == "delta":
+            for x, y, symbol in response['moves']:
+                self.board[x][y] = symbol
+
+        self.seq = response['seq']
+        return True
+
+    def render(self, playable: bool) -> int:
+        """
+        Reconfigure the buttons whose text or enabled state differ from the board
+        :param playable: True if the free cells can be clicked
+        :return: the number of buttons reconfigured
+        """
+        changed = 0
+        for i, row in enumerate(self.board):
+            for j, symbol in enumerate(row):
+                cell = symbol, "normal" if playable and symbol == 0 else "disabled"
+                if self.cells[i][j] != cell:
+                    self.buttons[i][j].config(text=cell[0], state=cell[1])
+                    self.cells[i][j] = cell
+                    changed += 1
+        return changed
+
 class TicTacToeApp:
-    def __init__(self, root: tk.Tk, client_socket: socket.socket, name: str, main_message: str):
+    def __init__(self, root: tk.Tk, client_socket: GameClient | None, main_message: str):
         self.root = root
         self.root.title("Tic Tac Toe")
         self.root.geometry("400x450")
@@ -24,11 +102,11 @@ class TicTacToeApp:
         self.style = ttk.Style()
 
         self.name: str | None = None
-        self.client_socket: socket.socket | None = None
+        self.client_socket: GameClient | None = None
         self.main_message: str | None = None
 
         self.client_socket = client_socket
-        self.name = name
+        self.name = client_socket.name if client_socket is not None else None
         self.main_message = main_message
 
         # Apply dark mode styles
@@ -44,6 +122,30 @@ class TicTacToeApp:
         self.current_server = None # Name of the current server
         self.is_my_turn = False
 
+        # True when the current server is watched as a spectator
+        self.spectating = False
+
+        # True while the player waits for a quick match
+        self.matching = False
+
+        # Function receiving the state of the current server pushed by the server
+        self.on_server_update = None
+
+        # Buttons of the board of the current game
+        self.board_view: BoardView | None = None
+
+        # States pushed by the server, received by the network worker and rendered by the Tk main loop
+        self.updates: queue.Queue[dict] = queue.Queue()
+
+        # Functions to run on the Tk main loop: the handlers of the responses, and of the reconnections
+        self.tasks: queue.Queue = queue.Queue()
+
+        if self.client_socket is not None:
+            self.client_socket.on_push = self.on_server_event
+            self.client_socket.on_reconnect = lambda response: self.tasks.put(lambda: self.on_reconnect(response))
+            self.client_socket.on_close = lambda: self.tasks.put(self.on_connection_lost)
+        self.root.after(UPDATE_INTERVAL_MS, self.process_updates)
+
         # Bind the on_close method to the window close event
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
@@ -72,6 +174,10 @@ class TicTacToeApp:
             foreground=[("active", "#000000")],
         )
 
+        # Styles of the cells of the winning line, for the winner and for the other players
+        for style_name, color in (("Won.TButton", "green"), ("Lost.TButton", "red")):
+            self.style.configure(style_name, foreground=color, background=color, font=("Arial", 12, "bold"))
+
     def setup_main_page(self):
         """
         Setup main page
@@ -99,7 +205,8 @@ class TicTacToeApp:
         self.main_frame.rowconfigure(1, weight=1)  # Buttons
         self.main_frame.rowconfigure(2, weight=1)  # Buttons
         self.main_frame.rowconfigure(3, weight=1)  # Buttons
-        self.main_frame.rowconfigure(4, weight=1)  # Server status row
+        self.main_frame.rowconfigure(4, weight=1)  # Buttons
+        self.main_frame.rowconfigure(5, weight=1)  # Server status row
         self.main_frame.columnconfigure(0, weight=1)
 
         # Title Label
@@ -110,15 +217,18 @@ class TicTacToeApp:
         # Buttons
         self.btn_new = ttk.Button(self.main_frame, text="New server", command=self.setup_new_server_page)
         self.btn_join = ttk.Button(self.main_frame, text="Join server", command=self.setup_join_server_page)
+        self.btn_match = ttk.Button(self.main_frame, text="Quick match", command=self.setup_quick_match_page)
         self.btn_quit = ttk.Button(self.main_frame, text="Quit game", command=self.root.quit).grid
 
         self.btn_new.grid(row=2, column=0, pady=10, padx=10, sticky="ew")
         self.btn_join.grid(row=3, column=0, pady=10, padx=10, sticky="ew")
-        self.btn_quit(row=4, column=0, pady=10, padx=10, sticky="ew")
+        self.btn_match.grid(row=4, column=0, pady=10, padx=10, sticky="ew")
+        self.btn_quit(row=5, column=0, pady=10, padx=10, sticky="ew")
 
         if self.client_socket is None:
             self.btn_new['state'] = "disabled"
             self.btn_join['state'] = "disabled"
+            self.btn_match['state'] = "disabled"
 
         # Server Status Label
         server_status_label = ttk.Label(
@@ -127,7 +237,7 @@ class TicTacToeApp:
             font=("Arial", 10),
             foreground="green" if self.client_socket else "red",
         )
-        server_status_label.grid(row=5, column=0, pady=20, sticky="s")
+        server_status_label.grid(row=6, column=0, pady=20, sticky="s")
 
     def setup_new_server_page(self):
         """
@@ -154,8 +264,9 @@ class TicTacToeApp:
 
         self.new_server_frame.rowconfigure(0, weight=1)  # Title row
         self.new_server_frame.rowconfigure(1, weight=1)  # Input field row
-        self.new_server_frame.rowconfigure(2, weight=1)  # Ok button row
-        self.new_server_frame.rowconfigure(3, weight=1)  # Back button row
+        self.new_server_frame.rowconfigure(2, weight=1)  # Board row
+        self.new_server_frame.rowconfigure(3, weight=1)  # Ok button row
+        self.new_server_frame.rowconfigure(4, weight=1)  # Back button row
         self.new_server_frame.columnconfigure(0, weight=1)
 
         # Title Label
@@ -172,33 +283,123 @@ class TicTacToeApp:
         server_name_entry.focus_set()
         server_name_entry.grid(row=1, column=0, pady=(30, 10), padx=10, sticky="n")
 
+        # Size of the board (empty for one more row than the players) and aligned symbols needed to win
+        board_frame = tk.Frame(self.new_server_frame, bg="#2e2e2e")
+        board_frame.grid(row=2, column=0, pady=5, sticky="n")
+        ttk.Label(board_frame, text="Board size:").grid(row=0, column=0, padx=5)
+        size_box = ttk.Spinbox(board_frame, from_=3, to=32, width=5)
+        size_box.grid(row=0, column=1, padx=5)
+        ttk.Label(board_frame, text="In a row:").grid(row=0, column=2, padx=5)
+        win_length_box = ttk.Spinbox(board_frame, from_=3, to=32, width=5)
+        win_length_box.set(3)
+        win_length_box.grid(row=0, column=3, padx=5)
+
         # "Ok" Button
         def on_ok():
             server_name = server_name_entry.get()
 
             # Send request to create a new server
-            self.client_socket.send((ClientAPI.NEW_SERVER + '/' + server_name).encode(FORMAT))
-
-            # Get the response from the server
-            msg = self.client_socket.recv(1024).decode(FORMAT)
-
-            response = json.loads(msg)  # Assuming the server returns a JSON with server details and players
+            self.request(f"{ClientAPI.NEW_SERVER}/{server_name}/{size_box.get()}/{win_length_box.get()}", on_created)
 
+        def on_created(response: dict):
             if response['status'] == "success":
                 self.current_server = response['name']
-                self.setup_lobby_page(server_name, response['players'])
+                self.setup_lobby_page(response['name'], response['players'])
             else:
                 print(response['msg'])
 
         # Bind Enter key to the on_ok function
         server_name_entry.bind("<Return>", lambda event: on_ok())
 
-        ttk.Button(self.new_server_frame, text="Ok", command=on_ok).grid(row=2, column=0, pady=10, padx=10, sticky="ew")
+        ttk.Button(self.new_server_frame, text="Ok", command=on_ok).grid(row=3, column=0, pady=10, padx=10, sticky="ew")
 
         # "Back" Button
-        ttk.Button(self.new_server_frame, text="Back", command=self.setup_main_page).grid(row=3, column=0, pady=10,
+        ttk.Button(self.new_server_frame, text="Back", command=self.setup_main_page).grid(row=4, column=0, pady=10,
                                                                                           padx=10, sticky="ew")
 
+    def setup_quick_match_page(self):
+        """
+        Setup the page waiting for a quick match: the game starts as soon as the server finds the other players
+        :return: None
+        """
+        self.clear_frame()
+
+        # Outer frame for margins
+        outer_frame = tk.Frame(self.root, bg="#2e2e2e")
+        outer_frame.grid(row=0, column=0, sticky="nsew", padx=20, pady=20)  # Margin around the content
+
+        # Configure root weights for responsiveness
+        self.root.rowconfigure(0, weight=1)
+        self.root.columnconfigure(0, weight=1)
+
+        # Inner frame for main content
+        match_frame = tk.Frame(outer_frame, bg="#2e2e2e")
+        match_frame.grid(row=0, column=0, sticky="nsew")
+
+        # Configure grid weights for responsiveness
+        outer_frame.rowconfigure(0, weight=1)
+        outer_frame.columnconfigure(0, weight=1)
+
+        match_frame.rowconfigure(0, weight=1)  # Title row
+        match_frame.rowconfigure(1, weight=1)  # Players row
+        match_frame.rowconfigure(2, weight=1)  # Status row
+        match_frame.rowconfigure(3, weight=1)  # Cancel button row
+        match_frame.columnconfigure(0, weight=1)
+
+        # Title Label
+        ttk.Label(match_frame, text="Quick Match", font=("Arial", 16), anchor="center").grid(row=0, column=0, pady=10,
+                                                                                           sticky="n")
+
+        # Number of players of the game
+        ttk.Label(match_frame, text="Players:").grid(row=1, column=0, pady=5, sticky="n")
+        players_box = ttk.Spinbox(match_frame, from_=2, to=16, width=5)
+        players_box.set(2)
+        players_box.grid(row=1, column=0, pady=(30, 10), padx=10, sticky="n")
+
+        status_label = ttk.Label(match_frame, text="", font=("Arial", 10))
+        status_label.grid(row=2, column=0, pady=5, sticky="n")
+
+        # "Search" Button: waits in the queue of the number of players chosen
+        def on_search():
+            self.matching = True
+            self.request(f"{ClientAPI.QUICK_MATCH}/{players_box.get()}", on_queued)
+
+        def on_queued(response: dict):
+            if not status_label.winfo_exists():
+                return
+            if response['status'] == "success":
+                status_label['text'] = f"Waiting for a game of {response['players']} players..."
+            else:
+                self.matching = False
+                status_label['text'] = response['message']
+
+        ttk.Button(match_frame, text="Search", command=on_search).grid(row=2, column=0, pady=(30, 10), padx=10,
+                                                                        sticky="ew")
+
+        # "Back" Button: stops waiting
+        def on_back():
+            if self.matching:
+                self.matching = False
+                self.request(ClientAPI.CANCEL_MATCH)
+            self.setup_main_page()
+
+        ttk.Button(match_frame, text="Back", command=on_back).grid(row=3, column=0, pady=10, padx=10, sticky="ew")
+
+    def on_match(self, response: dict):
+        """
+        Open the game found for a quick match, from the Tk main loop
+        :param response: State of the game, pushed by the server
+        :return: None
+        """
+        # The search was cancelled while the server made the match: the game is left at once
+        if not self.matching:
+            self.client_socket.pipeline([ClientAPI.UNSUBSCRIBE + '/' + response['name'], ClientAPI.EXIT_SERVER])
+            return
+
+        self.matching = False
+        self.current_server = response['name']
+        self.setup_game_page(response['name'], response['players'], response)
+
     def setup_join_server_page(self):
         """
         Setup join server page
@@ -249,29 +450,44 @@ class TicTacToeApp:
         )
         servers_listbox.grid(row=1, column=0, pady=(10, 20), padx=10, sticky="nsew")
 
-        # Request server list from the server
-        self.client_socket.send(ClientAPI.GET_SERVERS_LIST.encode(FORMAT))
-        server_list_json = self.client_socket.recv(1024).decode(FORMAT)
+        # Request server list from the server, page by page, and add each page to the listbox
+        def request_page(page: int):
+            self.request(f"{ClientAPI.GET_SERVERS_LIST}/{page}/{SERVERS_PAGE_SIZE}",
+                         lambda response: on_page(page, response))
 
-        # Populate the listbox with server names
-        server_list = json.loads(server_list_json)
+        def on_page(page: int, response: dict):
+            # The page of the list may have been left meanwhile
+            if not servers_listbox.winfo_exists():
+                return
 
-        for server in server_list:
-            server_name = server['name']
-            player_count = len(server['players'])  # Assuming this field contains the number of players
-            has_started = server['has_started']  # Assuming this field indicates if the server has started
+            populate(response['games'])
+            if (page + 1) * SERVERS_PAGE_SIZE < response['total']:
+                request_page(page + 1)
 
-            # Format the display string
-            display_text = f"{server_name} - Players: {player_count} - {'Started' if has_started else 'Waiting'}"
+        # Populate the listbox with server names
+        def populate(server_list: list[dict]):
+            for server in server_list:
+                server_name = server['name']
+                player_count = len(server['players'])  # Assuming this field contains the number of players
+                has_started = server['has_started']  # Assuming this field indicates if the server has started
+
+                # Format the display string, with the board of the games that do not use the default one
+                display_text = f"{server_name} - Players: {player_count} - {'Started' if has_started else 'Waiting'}"
+                if server['size'] is not None:
+                    display_text += f" - {server['size']}x{server['size']}"
+                if server['win_length'] != 3:
+                    display_text += f" - {server['win_length']} in a row"
+
+                # Add to listbox
+                servers_listbox.insert(tk.END, display_text)
+
+                # Color coding based on server status
+                if has_started:
+                    servers_listbox.itemconfig(tk.END, {'fg': '#F06161'})  # Red for started servers
+                else:
+                    servers_listbox.itemconfig(tk.END, {'fg': '#6AF066'})  # Green for waiting servers
 
-            # Add to listbox
-            servers_listbox.insert(tk.END, display_text)
-
-            # Color coding based on server status
-            if has_started:
-                servers_listbox.itemconfig(tk.END, {'fg': '#F06161'})  # Red for started servers
-            else:
-                servers_listbox.itemconfig(tk.END, {'fg': '#6AF066'})  # Green for waiting servers
+        request_page(0)
 
         # "Join" Button
         def on_join():
@@ -286,23 +502,48 @@ class TicTacToeApp:
             selected_server_name = selected_server.split(' - ')[0]
 
             # Send request to join the server
-            self.client_socket.send((ClientAPI.JOIN_SERVER + '/' + selected_server_name).encode(FORMAT))
-            msg = self.client_socket.recv(1024).decode(FORMAT)
-            response = json.loads(msg)
+            self.request(ClientAPI.JOIN_SERVER + '/' + selected_server_name, on_joined)
 
+        def on_joined(response: dict):
             if response["status"] == "success":
                 self.current_server = response['name']
                 self.setup_lobby_page(response['name'], response['players'])
             else:
-                print(f"{msg}")
+                print(f"{response}")
 
         ttk.Button(self.join_server_frame, text="Join", command=on_join).grid(
             row=2, column=0, pady=(10, 5), padx=10, sticky="ew"
         )
 
+        # "Watch" Button
+        def on_watch():
+
+            if not servers_listbox.curselection():
+                return
+
+            # Send request to watch the selected server
+            selected_server_name = servers_listbox.get(servers_listbox.curselection()).split(' - ')[0]
+            self.request(ClientAPI.WATCH + '/' + selected_server_name, on_watched)
+
+        def on_watched(response: dict):
+            if response["status"] != "success":
+                print(f"{response}")
+            elif response['board'] is None:
+                # Only the started games have a board to show
+                self.request(ClientAPI.UNWATCH + '/' + response['name'])
+                print(f"The game {response['name']} has not started yet")
+            else:
+                self.current_server = response['name']
+                self.spectating = True
+                self.setup_game_page(response['name'], response['players'], response)
+
+        ttk.Button(self.join_server_frame, text="Watch", command=on_watch).grid(
+            row=3, column=0, pady=5, padx=10, sticky="ew"
+        )
+
         # "Back" Button
         ttk.Button(self.join_server_frame, text="Back", command=self.setup_main_page).grid(
-            row=3, column=0, pady=(5, 10), padx=10, sticky="ew"
+            row=4, column=0, pady=(5, 10), padx=10, sticky="ew"
         )
 
     def setup_lobby_page(self, server_name: str, users: list[str]):
@@ -365,11 +606,9 @@ class TicTacToeApp:
         # "Start" Button
         def on_start():
             # Notify the server to start the game
-            self.client_socket.send((ClientAPI.START_GAME + '/' + server_name).encode(FORMAT))
-
-            response = self.client_socket.recv(1024).decode(FORMAT)
-            response_json = json.loads(response)
+            self.request(ClientAPI.START_GAME + '/' + server_name, on_started)
 
+        def on_started(response_json: dict):
             print(response_json['message'])
 
             if response_json['status'] == 'error':
@@ -377,12 +616,17 @@ class TicTacToeApp:
             else:
                 print("Game started!")  # Replace with game logic or transition
 
-        def on_exit():
+        # "Add bot" Button
+        def on_add_bot():
+            # The new list of players is pushed to the lobby like a join
+            self.request(ClientAPI.ADD_BOT + '/' + server_name, on_bot_added)
 
-            self.client_socket.send(ClientAPI.EXIT_SERVER.encode(FORMAT))
-            response = self.client_socket.recv(1024).decode(FORMAT)
-            print(json.loads(response)['message'])
-            self.current_server = None
+        def on_bot_added(response: dict):
+            if response['status'] != "success":
+                print(response['message'])
+
+        def on_exit():
+            self.leave_server()
             self.setup_main_page()
 
         start_button = ttk.Button(self.lobby_frame, text="Start", command=on_start)
@@ -392,61 +636,60 @@ class TicTacToeApp:
         if users[0] != self.name:
             start_button['state'] = "disabled"
 
+        ttk.Button(self.lobby_frame, text="Add bot", command=on_add_bot).grid(
+            row=3, column=0, pady=5, padx=10, sticky="ew"
+        )
+
         # "Back to Main Menu" Button
         ttk.Button(self.lobby_frame, text="Back to Main Menu", command=on_exit).grid(
-            row=3, column=0, pady=(5, 10), padx=10, sticky="ew"
+            row=4, column=0, pady=(5, 10), padx=10, sticky="ew"
         )
 
-        thread = threading.Thread(target=self.automatic_update_lobby, args=[players_listbox, start_button], daemon=True)
-        thread.start()
+        # Receive the changes of the server as soon as they happen
+        self.on_server_update = lambda response: self.update_lobby(response, players_listbox, start_button)
+
+        def on_subscribed(response: dict):
+            # The lobby may have been left meanwhile
+            if response['status'] == "success" and response['name'] == self.current_server and \
+                    self.on_server_update is not None:
+                self.on_server_update(response)
 
+        self.request(ClientAPI.SUBSCRIBE + '/' + server_name, on_subscribed)
 
-    def automatic_update_lobby(self, players_listbox: tk.Listbox, start_button: ttk.Button):
+    def update_lobby(self, response: dict, players_listbox: tk.Listbox, start_button: ttk.Button):
         """
-        Send request to the server forever to get updates about the server
+        Update the lobby with the state of the server
+        :param response: State of the server
         :param players_listbox: Listbox of players
         :param start_button: Button for start
         :return: None
         """
-        while players_listbox.winfo_exists():
-
-            try:
-                self.client_socket.send((ClientAPI.GET_SERVER + '/' + self.current_server).encode(FORMAT))
-                msg = self.client_socket.recv(1024).decode(FORMAT)
-            except OSError:
-                break
+        if not players_listbox.winfo_exists():
+            return
 
-            response = json.loads(msg)
+        if response['has_started']:
+            self.setup_game_page(response['name'], response['players'], response)
+            return
 
-            if response['has_started']:
-                server_name = response['name']
-                players = response['players']
-                board_state = response['board']
-                current_player = response['current_player']
+        users = response['players']
 
-                self.is_my_turn = current_player == self.name
-                self.setup_game_page(server_name, players, board_state)
-                break
-            users = response['players']
-
-            # If the first player left the game, checks if the current player is now
-            # the first player
-            if users[0] == self.name and start_button['state'] == 'disabled':
-                start_button['state'] = "enabled"
+        # If the first player left the game, checks if the current player is now
+        # the first player
+        if users[0] == self.name and start_button['state'] == 'disabled':
+            start_button['state'] = "enabled"
 
-            players_listbox.delete(0, tk.END)  # Deletes all items from index 0 to the end
-            for user in users:
-                players_listbox.insert(tk.END, user)
+        players_listbox.delete(0, tk.END)  # Deletes all items from index 0 to the end
+        for user in users:
+            players_listbox.insert(tk.END, user)
 
-            print("Updated users list !")
-            time.sleep(0.5)
+        print("Updated users list !")
 
-    def setup_game_page(self, server_name, players, board_state):
+    def setup_game_page(self, server_name, players, state):
         """
         Setup the game page
         :param server_name: Server name
         :param players: List of players name
-        :param board_state: Matrix of the board
+        :param state: State of the server, with the board
         :return:
         """
         self.clear_frame()
@@ -476,31 +719,15 @@ class TicTacToeApp:
         # Title Label
         ttk.Label(
             game_frame,
-            text=f"Game: {server_name}",
+            text=f"Game: {server_name} - {state['win_length']} in a row",
             font=("Arial", 16),
             anchor="center",
         ).grid(row=0, column=0, pady=10, sticky="n")
 
-        # Game Board ((n+1)^2 Grid)
+        # Game Board, sized from the board sent by the server
         board_frame = tk.Frame(game_frame, bg="#2e2e2e")
         board_frame.grid(row=1, column=0, pady=(10, 20), padx=10, sticky="nsew")
-
-        n_players = len(players)
-        btn_list: list[list[None|ttk.Button]] = [[None for _ in range(n_players+1)] for _ in range(n_players+1)]
-
-        for i in range(n_players+1):
-            board_frame.rowconfigure(i, weight=1)
-            board_frame.columnconfigure(i, weight=1)
-            for j in range(n_players+1):
-                button_text = board_state[i][j] if board_state[i][j] != "" else " "
-                btn = ttk.Button(
-                    board_frame,
-                    text=button_text,
-                    command=lambda x=i, y=j: self.make_move(x, y, btn_list),
-                    padding=5,
-                )
-                btn.grid(row=i, column=j, sticky="nsew", padx=5, pady=5)
-                btn_list[i][j] = btn # Add the button to the list of buttons
+        self.board_view = BoardView(board_frame, len(state['board']), self.make_move)
 
         # Players List with Symbols
         players_frame = tk.Frame(game_frame, bg="#2e2e2e")
@@ -516,101 +743,71 @@ class TicTacToeApp:
 
         # Quit Game Button
         def on_quit_game():
-            self.client_socket.send(ClientAPI.EXIT_SERVER.encode(FORMAT))
-            response = self.client_socket.recv(1024).decode(FORMAT)
-            print(json.loads(response)['message'])
+            self.leave_server()
             self.setup_main_page()
 
         ttk.Button(
             game_frame,
-            text="Quit Game",
+            text="Stop watching" if self.spectating else "Quit Game",
             command=on_quit_game,
         ).grid(row=3, column=0, pady=(10, 20), padx=10, sticky="ew")
 
-        # Start the automatic update thread once
-        update_thread = threading.Thread(target=self.automatic_update_game, args=[btn_list], daemon=True)
-        update_thread.start()
+        # Receive the moves as soon as they are made
+        self.on_server_update = self.update_game
 
-    def automatic_update_game(self, btn_list: list[list[tk.Button]]):
+        # Enable the board only for the current player
+        self.update_game(state)
+
+    def update_game(self, response: dict):
         """
-        Send request to the server forever to get updates about the server
-        :param btn_list: The list of buttons of the board
+        Update the game page with the state of the server
+        :param response: State of the server, or the moves since the last state rendered
         :return: None
         """
-        # Loop forever while the first button (at least) is existing
-        while not self.is_my_turn and btn_list[0][0].winfo_exists():
-
-
-            try:
-                self.client_socket.send((ClientAPI.GET_SERVER + '/' + self.current_server).encode(FORMAT))
-                msg = self.client_socket.recv(1024).decode(FORMAT)
-            except OSError:
-                break
+        board_view = self.board_view
+        if board_view is None or not board_view.exists():
+            return
 
-            response = json.loads(msg)
+        # A state older than the one rendered (a push received after the reply to a move) is ignored
+        if not board_view.apply(response):
+            return
 
-            updated_board = response['board']
-            current_player = response['current_player']
-            winner_tuple = response['winner']
+        end_game = self.update_board(response['current_player'], board_view, response['winner'])
 
-            print("Update board")
-            end_game = self.update_board(current_player, btn_list, updated_board, winner_tuple)
+        # The game is over, stop listening to the server
+        if end_game:
+            self.on_server_update = None
 
-            if end_game:
-                break
-
-            time.sleep(0.5)
-
-    def update_board(self, current_player, btn_list, updated_board, winner_tuple):
+    def update_board(self, current_player, board_view: BoardView, winner_tuple):
         """
         Update the board game
-        :param current_player: Symbol of the current player
-        :param btn_list: List of buttons of the board
-        :param updated_board: Matrix of the board
+        :param current_player: Name of the current player
+        :param board_view: Buttons of the board
         :param winner_tuple: A tuple containing the winner along with his winning cells
-        :return: None
+        :return: True if the game is over
         """
         # Determine if it's the player's turn
         self.is_my_turn = current_player == self.name
 
-        # Update the game page with new board and players
-        for i in range(len(btn_list)):
-            for j in range(len(btn_list)):
-                btn_list[i][j].config(text=updated_board[i][j])
-                if self.is_my_turn:
-                    btn_list[i][j]["state"] = "normal"
-                else:
-                    btn_list[i][j]["state"] = "disabled"
-
-                if updated_board[i][j] != 0:
-                    btn_list[i][j]["state"] = "disabled"
+        # Only the cells whose symbol or enabled state changed are reconfigured
+        game_over = winner_tuple[0] != 0 or all(cell != 0 for row in board_view.board for cell in row)
+        board_view.render(self.is_my_turn and not game_over)
 
         # If there is a winner
         if winner_tuple[0] != 0:
-            winner: tuple[str, list[tuple[int, int]]] = winner_tuple
+            winner, cells = winner_tuple
 
-            for (x, y) in winner[1]:
-
-                if self.name == winner[0]:
-                    color_cells = 'green'
-                else:
-                    color_cells = 'red'
-
-                # Color the winner cells
-                style = ttk.Style()
-                style.configure(style='W.TButton',
-                                foreground=color_cells,
-                                background=color_cells,
-                                font=('Arial', 12, 'bold'))  # Set font to bold
-                btn_list[x][y].config(style='W.TButton')
-
-                # Display winning message overlay
-                self.display_winner_overlay(winner[0])
+            # Color the winner cells
+            style = 'Won.TButton' if self.name == winner else 'Lost.TButton'
+            for (x, y) in cells:
+                board_view.buttons[x][y].config(style=style)
 
+            # Display winning message overlay
+            self.display_winner_overlay(winner)
             return True
 
         # If the board is full
-        if all(cell != 0 for row in updated_board for cell in row):
+        if game_over:
             self.display_winner_overlay("")
             return True
         return False
@@ -625,6 +822,9 @@ class TicTacToeApp:
         if winner_name == "":
             message = "It's a tie."
             color = "gray"
+        elif self.spectating:
+            message = f"Player {winner_name} Won."
+            color = "green"
         elif winner_name == self.name:
             message = "You Won!"
             color = "green"
@@ -645,38 +845,168 @@ class TicTacToeApp:
         # Prevent interaction with underlying widgets
         overlay_label.bind("<Button-1>", lambda e: None)
 
-    def make_move(self, x, y, btn_list):
+    def make_move(self, x, y):
         """
         Function called when the player is making a move
         :param x: x-position of the board
         :param y: y-position of the board
-        :param btn_list: list of buttons of the board
         :return: None
         """
-        # Send the move to the server
-        move_message = f"{ClientAPI.MAKE_MOVE}/{self.current_server}/{x}/{y}"
-        self.client_socket.send(move_message.encode(FORMAT))
-
-        # Receive the updated board state and player turn
-        response = self.client_socket.recv(1024).decode(FORMAT)
-        response_data = json.loads(response)
+        # Send the move with the sequence number of the board, the server answers with the moves played since
+        move_message = f"{ClientAPI.MAKE_MOVE}/{self.current_server}/{x}/{y}/{self.board_view.seq}"
+        self.request(move_message, self.on_move)
 
+    def on_move(self, response_data: dict):
+        """
+        Function called with the reply to a move of the player
+        :param response_data: State of the server, or the moves since the board
+        :return: None
+        """
         if response_data['status'] == "success":
-            updated_board = response_data['board']
-            current_player = response_data['current_player']
-            winner_tuple = response_data['winner']
-
             # Update the game page with new board and players
-            self.update_board(current_player, btn_list, updated_board, winner_tuple)
-
-            # If it's no longer the player's turn, restart the thread
-            if not self.is_my_turn:
-                update_thread = threading.Thread(target=self.automatic_update_game, args=[btn_list], daemon=True)
-                update_thread.start()
-
+            self.update_game(response_data)
         else:
             print('failed to make move')  # Log error or invalid move
 
+    def request(self, msg: str, on_response=None):
+        """
+        Send a request to the server without waiting for the response
+        :param msg: Request to send
+        :param on_response: function called with the dict describing the response, from the Tk main loop
+        :return: None
+        """
+        future = self.client_socket.request(msg)
+        future.add_done_callback(lambda done: self.tasks.put(lambda: self.on_response(done, on_response)))
+
+    @staticmethod
+    def on_response(future: Future, on_response):
+        """
+        Give a response to its handler, from the Tk main loop
+        :param future: Future of the response
+        :param on_response: function called with the dict describing the response, or None
+        :return: None
+        """
+        if future.exception() is not None:
+            print(f"Request failed: {future.exception()}")
+        elif on_response is not None:
+            on_response(future.result())
+
+    def on_server_event(self, response: dict):
+        """
+        Function called by the network worker for each change pushed by the server.
+        Tk widgets can only be used from the main loop, so the state is queued for process_updates.
+        :param response: State of the server
+        :return: None
+        """
+        if response.get('event') == "match":
+            self.tasks.put(lambda: self.on_match(response))
+            return
+        self.updates.put(response)
+
+    def on_reconnect(self, response: dict):
+        """
+        Go back to the main page after the connection was lost and opened again: the server gave a new name,
+        and the player is no longer in a game, unless the server restarted and gave back his place
+        :param response: Response to the new handshake
+        :return: None
+        """
+        self.name = response['name']
+
+        # The game goes on from its state after the restart, its changes are pushed again (the client library
+        # watches again the game of a spectator)
+        if self.spectating or response['resumed'] is not None and response['resumed'] == self.current_server:
+            handler = self.on_server_update
+
+            # The last changes before a crash of the server may be lost: its state replaces the one rendered
+            if self.board_view is not None:
+                self.board_view.seq = -1
+
+            def on_state(state: dict):
+                # The page may have been left meanwhile
+                if state['status'] == "success" and handler is not None and handler is self.on_server_update:
+                    handler(state)
+
+            self.request(f"{ClientAPI.GET_SERVER}/{self.current_server}", on_state)
+            return
+
+        self.current_server = None
+        self.spectating = False
+        self.matching = False
+        self.on_server_update = None
+        self.board_view = None
+        self.main_message = f"Reconnected to host {HOST} at port {PORT}"
+        self.setup_main_page()
+
+    def on_connection_lost(self):
+        """
+        Go back to the main page after the connection was lost for good
+        :return: None
+        """
+        self.client_socket = None
+        self.current_server = None
+        self.spectating = False
+        self.matching = False
+        self.on_server_update = None
+        self.board_view = None
+        self.main_message = f"Error: connection to host {HOST} at port {PORT} lost"
+        self.setup_main_page()
+
+    def process_updates(self):
+        """
+        Handle the responses received and render the states pushed by the server since the last call, from the Tk
+        main loop
+        :return: None
+        """
+        while True:
+            try:
+                task = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            task()
+
+        # A whole state replaces the ones before it: only the last whole state of each server is rendered, with
+        # the moves pushed to a spectator after it
+        latest: dict[str, list[dict]] = dict()
+        while True:
+            try:
+                response = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            if response.get('update') == "delta":
+                latest.setdefault(response['name'], []).append(response)
+            else:
+                latest[response['name']] = [response]
+
+        for response in latest.get(self.current_server, ()):
+            # The handler changes when the page changes, or stops at the end of the game
+            handler = self.on_server_update
+            if handler is not None:
+                handler(response)
+
+        self.root.after(UPDATE_INTERVAL_MS, self.process_updates)
+
+    def leave_server(self):
+        """
+        Stop listening to the current server and exit it, or stop watching it
+        :return: None
+        """
+        self.on_server_update = None
+        self.board_view = None
+
+        # A spectator only stops watching
+        if self.spectating:
+            self.spectating = False
+            self.request(ClientAPI.UNWATCH + '/' + self.current_server, lambda response: print(response['message']))
+            self.current_server = None
+            return
+
+        unsubscribe_response, exit_response = self.client_socket.pipeline(
+            [ClientAPI.UNSUBSCRIBE + '/' + self.current_server, ClientAPI.EXIT_SERVER])
+        exit_response.add_done_callback(
+            lambda done: self.tasks.put(lambda: self.on_response(done, lambda response: print(response['message']))))
+
+        self.current_server = None
+
     def clear_frame(self):
         """
         Destroy all the children widgets
@@ -698,37 +1028,33 @@ class TicTacToeApp:
 def setup_socket():
     """
     Setup the client socket and connect to the server
-    :return: client_socket, name, main_message
+    :return: client_socket, main_message
     """
-    try:
-        # Set up the client socket
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-        # Set a timeout of 3 seconds for the requests
-        client_socket.settimeout(3.0)
+    # Ask for the compact binary encoding of the responses, or JSON if the server does not support it
+    client_socket = GameClient(HOST, PORT, (BINARY, JSON), timeout=3.0)
 
-        client_socket.connect(ADDR)
+    try:
+        # Wait 3 seconds at most for the connection and the handshake
+        client_socket.connect().result(3.0)
         main_message = f"Connected to host {HOST} at port {PORT}"
-        client_socket.send(ClientAPI.GET_MY_NAME.encode(FORMAT))
-        name = client_socket.recv(1024).decode(FORMAT)
 
-    except (ConnectionRefusedError, TimeoutError):
-        # If the connection is refused, tell it to the client
+    except (ConnectionError, TimeoutError, FutureTimeoutError):
+        # If the connection is refused or times out, tell it to the client (the timeout of a future is not the builtin
+        # TimeoutError before Python 3.11)
+        client_socket.close()
         client_socket = None
         main_message = f"Error: cannot connect to host {HOST} at port {PORT}"
-        name = None
 
-    return client_socket, name, main_message
+    return client_socket, main_message
 
 def main():
 
     # Setup client socket
-    client_socket, name, main_message = setup_socket()
+    client_socket, main_message = setup_socket()
 
     root = tk.Tk()
-    TicTacToeApp(root, client_socket, name, main_message)
+    TicTacToeApp(root, client_socket, main_message)
     root.mainloop()
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,184 @@
+"""
+Lifecycle of the client connections: heartbeats and idle timeouts.
+
+A client that crashes or loses its network without closing its socket leaves a half-open connection: the server never
+receives anything from it again, and without a timeout the connection would keep its handler, the name of its player
+and his place in his game forever. The connection manager closes such connections (FramedConnection.abort), and the
+handler of the connection then releases the player as for any other disconnection.
+
+Every message received from a client marks its connection as active (FramedConnection.last_received). A connection
+silent for HEARTBEAT_INTERVAL seconds is pushed a ping every HEARTBEAT_INTERVAL seconds, that the client library
+answers with a ping request, and a connection silent for IDLE_TIMEOUT seconds is closed. The deadlines are kept in a
+timing wheel checked by a single thread: scheduling a connection and finding the ones due cost the same whatever the
+number of connections, and a connection that stays active is only looked at once per heartbeat interval.
+"""
+
+import logging
+import threading
+import time
+
+from protocol import PUSH_ID, FramedConnection, pack_frame
+from serialization import encode
+
+# Seconds without any message from a client before it is pushed a ping
+HEARTBEAT_INTERVAL = 15.0
+
+# Seconds without any message from a client before its connection is closed
+IDLE_TIMEOUT = 45.0
+
+# Longest duration of a slot of the timing wheel, in seconds
+TICK = 1.0
+
+class TimingWheel:
+    """
+    Items scheduled at a deadline, in slots of a fixed duration arranged in a circle.
+    An item is put in the slot of its deadline, and the slots are checked in turn as the time goes: the items of a
+    slot whose deadline is not reached yet (one or more turns later) stay in it.
+    """
+
+    def __init__(self, tick: float, slots: int):
+        """
+        :param tick: Duration of a slot in seconds
+        :param slots: Number of slots, the wheel makes a turn in tick * slots seconds
+        """
+        self.tick: float = tick
+        self.slots: list[list[tuple[float, object]]] = [list() for _ in range(slots)]
+
+        # Number of the tick of the next slot to check, since the origin of time.monotonic
+        self.current: int = int(time.monotonic() / tick)
+
+    def __len__(self) -> int:
+        return sum(len(slot) for slot in self.slots)
+
+    def schedule(self, item, deadline: float):
+        """
+        Add an item
+        :param item: Item given back by advance once its deadline is reached
+        :param deadline: time.monotonic value
+        :return: None
+        """
+        # A deadline already passed is put in the next slot checked
+        tick = max(int(deadline / self.tick), self.current)
+        self.slots[tick % len(self.slots)].append((deadline, item))
+
+    def advance(self, now: float) -> list:
+        """
+        Take out the items whose deadline is reached
+        :param now: time.monotonic value
+        :return: the items, in no particular order
+        """
+        due = list()
+        last = int(now / self.tick)
+
+        # The slot of now is checked again by the next call, for the rest of its items
+        while True:
+            index = self.current % len(self.slots)
+            slot = self.slots[index]
+            if slot:
+                later = [entry for entry in slot if entry[0] > now]
+                if len(later) < len(slot):
+                    due += [item for deadline, item in slot if deadline <= now]
+                    self.slots[index] = later
+            if self.current >= last:
+                return due
+            self.current += 1
+
+class ConnectionManager:
+    """
+    Connections of the clients, pushed a ping when they are silent and closed when they stay silent.
+    """
+
+    def __init__(self, heartbeat_interval: float = HEARTBEAT_INTERVAL, idle_timeout: float = IDLE_TIMEOUT):
+        """
+        :param heartbeat_interval: Seconds without any message from a client before it is pushed a ping
+        :param idle_timeout: Seconds without any message from a client before its connection is closed
+        """
+        self.heartbeat_interval: float = heartbeat_interval
+        self.idle_timeout: float = idle_timeout
+
+        # Connections registered and not closed yet
+        self.connections: set[FramedConnection] = set()
+
+        # Next check of each connection, the wheel turns in more than the longest delay
+        tick = min(TICK, heartbeat_interval / 4, idle_timeout / 4)
+        self.wheel = TimingWheel(tick, int(max(heartbeat_interval, idle_timeout) / tick) + 2)
+        self.lock = threading.Lock()
+
+        # Message of the ping, by encoding
+        self.pings: dict[str, bytes] = dict()
+
+        # Counters of the metrics
+        self.heartbeats: int = 0
+        self.timeouts: int = 0
+
+        threading.Thread(target=self._check_loop, name="connections", daemon=True).start()
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def register(self, connection: FramedConnection):
+        """
+        Start watching a new connection
+        :param connection: connection to the client
+        :return: None
+        """
+        connection.last_received = time.monotonic()
+        with self.lock:
+            self.connections.add(connection)
+            self.wheel.schedule(connection, connection.last_received + self.heartbeat_interval)
+
+    def unregister(self, connection: FramedConnection):
+        """
+        Stop watching a closed connection. Its entry in the wheel is dropped when its deadline is reached.
+        :param connection: connection to the client
+        :return: None
+        """
+        with self.lock:
+            self.connections.discard(connection)
+
+    def _ping(self, encoding: str) -> bytes:
+        frame = self.pings.get(encoding)
+        if frame is None:
+            frame = self.pings[encoding] = pack_frame(PUSH_ID, encode({"status": "success", "event": "ping"},
+                                                                      encoding))
+        return frame
+
+    # The following methods run on the thread of the manager
+
+    def _check_loop(self):
+        while True:
+            time.sleep(self.wheel.tick)
+            try:
+                self._check(time.monotonic())
+            except Exception:
+                logging.exception("Cannot check the connections")
+
+    def _check(self, now: float):
+        with self.lock:
+            due = [connection for connection in self.wheel.advance(now) if connection in self.connections]
+
+        for connection in due:
+            silent = now - connection.last_received
+
+            if silent >= self.idle_timeout:
+                # The handler of the connection stops and releases the player
+                logging.info(f'Closing a connection silent for {silent:.0f}s')
+                self.timeouts += 1
+                self.unregister(connection)
+                connection.abort()
+                continue
+
+            if silent >= self.heartbeat_interval:
+                # Pinged again every interval until the client answers, or closed at the timeout
+                try:
+                    connection.push_nowait(self._ping(connection.encoding))
+                    self.heartbeats += 1
+                except OSError:
+                    pass
+                deadline = min(now + self.heartbeat_interval, connection.last_received + self.idle_timeout)
+            else:
+                deadline = connection.last_received + self.heartbeat_interval
+
+            with self.lock:
+                if connection in self.connections:
+                    self.wheel.schedule(connection, deadline)
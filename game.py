@@ -1,29 +1,73 @@
+import struct
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import Callable
+
+from bitboard import BitBoard
 from player import Player
+from response_cache import ResponseCache
+from serialization import ENCODINGS
+
+# Number of aligned symbols needed to win, by default
+WIN_LENGTH = 3
+
+# Sizes of the boards that can be chosen when a game is created, and smallest number of aligned symbols to win
+MIN_BOARD_SIZE = 3
+MAX_BOARD_SIZE = 32
+MIN_WIN_LENGTH = 3
+
+# Number of moves kept in the move log of a game, to send the moves since a sequence number instead of the board
+MOVE_LOG_SIZE = 128
+
+# Replies to GET_SERVER kept for a state, in each encoding: the delta from each sequence number of the move log
+# (MOVE_LOG_SIZE + 1, the current one included) and the snapshot
+MAX_CACHED_RESPONSES = (MOVE_LOG_SIZE + 2) * len(ENCODINGS)
+
+# A move of the history of a game: symbol, cell index (x * size + y) and milliseconds since the previous move
+MOVE_RECORD = struct.Struct(">BHI")
+
+# Players that can join a game: the symbols are never given again and a move record keeps the symbol in one byte,
+# and a board of one more row than the players must keep its size in one byte in the archive (and its cell index in
+# two bytes in a move record)
+MAX_SYMBOLS = 254
 
 class Game:
     """
     Define a single game.
-    A game is created by the server, by request from a client
+    A game is created by the server, by request from a client.
+    Every change of the game is done while holding its own lock, so the requests of different games never wait
+    for each other. The lock is reentrant: a handler can hold it while reading the game and calling its methods.
     """
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, size: int | None = None, win_length: int = WIN_LENGTH):
         """
         :param name: Name of the game
+        :param size: Number of rows and columns of the board, None for one more than the players at the start
+        :param win_length: Number of aligned symbols needed to win
         """
         # Name of the game
         self.name: str = name
 
+        # Size of the board chosen at the creation, and number of aligned symbols needed to win
+        self.size: int | None = size
+        self.win_length: int = win_length
+
         # List of players that are currently inside the game
         self.players: list[Player] = list()
 
         # Maps each player to a fixed symbol
         self.symbols: dict[Player, int] = dict()  # Maps each player to a fixed symbol
 
+        # Maps each symbol back to its player
+        self.players_by_symbol: dict[int, Player] = dict()
+
         # Flag if the game has started
         self.has_started: bool = False
 
-        # A matrix defining the game board. It is defined by lists of int.
-        self.board: list[list[int]] | None = None
+        # The game board, stored as one bitmask per symbol
+        self.bitboard: BitBoard | None = None
 
         # Track the actual Player object
         self.current_player: Player | None = None
@@ -31,21 +75,81 @@ class Game:
         # A tuple containing the symbol of the winner and the winner cells coordinates
         self.winner: tuple[int, list[tuple[int, int]]] = 0, []
 
+        # Sequence number of the state, increased by every change of the game
+        self.seq: int = 0
+
+        # Last moves of the game, as (seq, x, y, symbol) tuples
+        self.moves: deque[tuple[int, int, int, int]] = deque(maxlen=MOVE_LOG_SIZE)
+
+        # Every move of the game, packed as MOVE_RECORD, archived when the game is removed
+        self.history: bytearray = bytearray()
+
+        # Time of the start of the game (seconds since the epoch), and monotonic time of the last move or the start
+        self.started_at: float | None = None
+        self.last_move_at: float = 0.0
+
+        # Encoded descriptions of the state sent by the server, by sequence number: a change makes them stale
+        self.responses: ResponseCache = ResponseCache(MAX_CACHED_RESPONSES)
+
+        # Functions called with (game, event) after every change of the game, while the lock is held
+        self.observers: list[Callable[[Game, str], None]] = list()
+
+        # Lock of the state of the game. When the lock of the registry is also needed, this one is taken first.
+        self.lock = threading.RLock()
+
+    def notify(self, event: str, move: tuple[int, int, int] | None = None):
+        """
+        Increase the sequence number of the game and call its observers after a change
+        :param event: Name of the change ("join", "exit", "start" or "move")
+        :param move: (x, y, symbol) of the move, for a "move" change
+        :return: None
+        """
+        self.seq += 1
+        if move is not None:
+            self.moves.append((self.seq, *move))
+
+        for observer in self.observers:
+            observer(self, event)
+
+    @property
+    def board(self) -> list[list[int]] | None:
+        """
+        A matrix defining the game board, built from the bitboard. It is defined by lists of int.
+        :return: list of rows of symbols (0 for an empty cell), None if the game has not started
+        """
+        if self.bitboard is None:
+            return None
+        return self.bitboard.to_list()
+
     def add_player(self, player: Player):
         """
         Add a player to the game
         :param player: A Player object
         :return: None
         """
-        # Add the name of the server to the player game field
-        player.join_game(self.name)
+        with self.lock:
+            if self.is_full():
+                raise ValueError(f"{self.name} had {MAX_SYMBOLS} players already")
 
-        # Add the player to the list of players
-        self.players.append(player)
+            # Add the name of the server to the player game field
+            player.join_game(self.name)
 
-        self.symbols[player] = len(self.symbols) + 1
-        if len(self.players) == 1:
-            self.current_player = player
+            # Add the player to the list of players
+            self.players.append(player)
+
+            self.symbols[player] = len(self.symbols) + 1
+            self.players_by_symbol[self.symbols[player]] = player
+            if len(self.players) == 1:
+                self.current_player = player
+
+            self.notify("join")
+
+    def is_full(self) -> bool:
+        """
+        Check if every symbol has been given, to the players inside the game or to the ones who left it
+        :return: True if no other player can join the game
+        """
+        return len(self.symbols) >= MAX_SYMBOLS
 
     def _get_next_player(self, current_player: Player):
         if not self.players:
@@ -62,27 +166,61 @@ class Game:
         :return: None
         """
 
-        if self.current_player == player:
-            self.current_player = self._get_next_player(player)
+        with self.lock:
+            if self.current_player == player:
+                self.current_player = self._get_next_player(player)
+
+            player.quit_game()
+            self.players.remove(player)
 
-        player.quit_game()
-        self.players.remove(player)
+            self.notify("exit")
+
+    def replace_player(self, previous: Player, player: Player):
+        """
+        Give the place of a player to another Player object with the same name: his symbol and his turn are kept.
+        The state of the game does not change, so its observers are not called.
+        :param previous: A Player object of the game
+        :param player: The Player object taking his place
+        :return: None
+        """
+        with self.lock:
+            self.players[self.players.index(previous)] = player
+
+            symbol = self.symbols.pop(previous)
+            self.symbols[player] = symbol
+            for player_symbol, symbol_player in self.players_by_symbol.items():
+                if symbol_player is previous:
+                    self.players_by_symbol[player_symbol] = player
+
+            if self.current_player is previous:
+                self.current_player = player
+
+            previous.quit_game()
+            player.join_game(self.name)
 
     def start(self):
         """
         Start the game
         :return: None
         """
-        self.has_started = True
-        self.generate_board()
+        with self.lock:
+            self.has_started = True
+            self.generate_board()
+            self.started_at = time.time()
+            self.last_move_at = time.monotonic()
+
+            self.notify("start")
 
     def generate_board(self):
         """
-        Generate an empty board
+        Generate an empty board, of the size chosen at the creation or else one more than the players (at least the
+        win length)
         :return: None
         """
-        x = len(self.players)
-        self.board = [[0 for _ in range(x+1)] for _ in range(x+1)]
+        if self.size is not None:
+            self.bitboard = BitBoard(self.size)
+        else:
+            self.bitboard = BitBoard(max(len(self.players) + 1, self.win_length))
 
     def make_move(self, player: Player, x, y):
         """
@@ -92,77 +230,79 @@ class Game:
         :param y: The y-position of the player move
         :return: True if the operation succeed, false otherwise
         """
-        # If it's not your turn
-        if player != self.current_player:
-            return False
+        with self.lock:
+            # If the game has not started or it's not your turn
+            if not self.has_started or player != self.current_player:
+                return False
+
+            # If the cell is outside of the board
+            if not (0 <= x < self.bitboard.size and 0 <= y < self.bitboard.size):
+                return False
 
-        # If the cell is already taken
-        if self.board[x][y] != 0:
-            return False
+            # If the cell is already taken
+            if not self.bitboard.is_free(x, y):
+                return False
 
-        symbol = self.symbols[player]
-        self.board[x][y] = symbol
-        self.current_player = self._get_next_player(player)
+            # The record is packed before any change, so the board and the history never differ
+            symbol = self.symbols[player]
+            now = time.monotonic()
+            elapsed = min(int((now - self.last_move_at) * 1000), 0xFFFFFFFF)
+            record = MOVE_RECORD.pack(symbol, x * self.bitboard.size + y, elapsed)
 
-        self.winner = self.check_winner()
-        return True
+            self.bitboard.place(x, y, symbol)
+            self.current_player = self._get_next_player(player)
+            self.history += record
+            self.last_move_at = now
+
+            # Only the lines going through the new cell can make a new winner
+            if self.winner[0] == 0:
+                self.winner = self.check_winner_at(x, y, symbol)
+
+            self.notify("move", (x, y, symbol))
+            return True
+
+    def moves_since(self, seq: int) -> list[tuple[int, int, int]] | None:
+        """
+        Get the moves played since a sequence number
+        :param seq: Sequence number of a state of the game
+        :return: the (x, y, symbol) of the moves in order, or None if the changes since this state are not all in
+        the move log (another change than a move, or too many moves)
+        """
+        with self.lock:
+            count = self.seq - seq
+            if count == 0:
+                return []
+            if count < 0 or count > len(self.moves):
+                return None
+
+            # The sequence numbers of the log increase, so the last count moves are the changes since seq only if
+            # they span every sequence number from seq + 1 to the current one
+            if self.moves[-1][0] != self.seq or self.moves[-count][0] != seq + 1:
+                return None
+            return [move[1:] for move in islice(self.moves, len(self.moves) - count, None)]
 
     def check_winner(self) -> tuple[str, list[tuple[int, int]]]:
         """
         Determine if there is a winner
-        :return: A tuple containing the winner number and the winner cells
-        """
-        size = len(self.board)
-        win_length = 3
-
-        # Function to check a line (row, column, or diagonal)
-        def check_line(cells):
-            if len(set(cells)) == 1 and cells[0] != 0:
-                return cells[0]  # Winner is the player number (1, 2, etc.)
-            return 0
-
-        # Check rows
-        for row in range(size):
-            for col in range(size - win_length + 1):
-                winner = check_line(self.board[row][col:col + win_length])
-                if winner:
-                    winner_player: Player = next((k for k, v in self.symbols.items() if v == winner), None)
-                    return winner_player.name, [(row, col + i) for i in range(win_length)]
-
-        # Check columns
-        for col in range(size):
-            for row in range(size - win_length + 1):
-                winner = check_line([self.board[row + i][col] for i in range(win_length)])
-                if winner:
-                    winner_player: Player = next((k for k, v in self.symbols.items() if v == winner), None)
-                    return winner_player.name, [(row + i, col) for i in range(win_length)]
-
-        # Check diagonals (top-left to bottom-right)
-        for row in range(size - win_length + 1):
-            for col in range(size - win_length + 1):
-                winner = check_line([self.board[row + i][col + i] for i in range(win_length)])
-                if winner:
-                    winner_player: Player = next((k for k, v in self.symbols.items() if v == winner), None)
-                    return winner_player.name, [(row + i, col + i) for i in range(win_length)]
-
-        # Check diagonals (top-right to bottom-left)
-        for row in range(size - win_length + 1):
-            for col in range(win_length - 1, size):
-                winner = check_line([self.board[row + i][col - i] for i in range(win_length)])
-                if winner:
-                    winner_player: Player = next((k for k, v in self.symbols.items() if v == winner), None)
-                    return winner_player.name, [(row + i, col - i) for i in range(win_length)]
-
+        :return: A tuple containing the winner name and the winner cells
+        """
+        winner, cells = self.bitboard.find_winning_line(self.win_length)
+        if winner:
+            winner_player: Player = self.players_by_symbol[winner]
+            return winner_player.name, cells
         return 0, []  # No winner
 
-def get_game_object(games: list[Game], name: str):
-    """
-    Given a list of games and a name of a specific game, get the corresponding game object from the list
-    :param games: list of games
-    :param name: name of a game
-    :return: a Game object
-    """
-    for game in games:
-        if game.name == name:
-            return game
-    return None
+    def check_winner_at(self, x: int, y: int, symbol: int = 0) -> tuple[str, list[tuple[int, int]]]:
+        """
+        Determine if the symbol in a cell is part of a winning line.
+        Only the row, the column and the two diagonals going through the cell are checked.
+        :param x: The x-position of the cell
+        :param y: The y-position of the cell
+        :param symbol: The symbol in the cell, if it is already known
+        :return: A tuple containing the winner name and the winner cells
+        """
+        winner, cells = self.bitboard.winning_line_at(x, y, self.win_length, symbol)
+        if winner:
+            winner_player: Player = self.players_by_symbol[winner]
+            return winner_player.name, cells
+        return 0, []
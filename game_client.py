@@ -0,0 +1,531 @@
+"""
+Headless client of the game server, shared by the GUI, the bots and the load tests.
+
+Every connection is served by a NetworkWorker: a single thread multiplexing the sockets of many connections with a
+selector. Only this thread reads and writes the sockets, so the requests of several threads never interleave, and
+thousands of clients can run in one process.
+The requests return concurrent.futures.Future objects completed by the worker with the decoded response: they can be
+waited for (GameClient.call), chained with add_done_callback, or awaited from asyncio with asyncio.wrap_future.
+A lost connection is opened again after a growing delay, then the handshake and the subscriptions are sent again.
+"""
+
+import heapq
+import itertools
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from api_client import ClientAPI
+from protocol import HEADER, MAX_REQUEST_ID, PUSH_ID, ProtocolError, pack_frame, unpack_header
+from serialization import BINARY, JSON, decode
+
+FORMAT = 'utf-8'
+
+# Delays before each new attempt to open a lost connection, in seconds. The last one is repeated.
+RECONNECT_DELAYS = (0.1, 0.5, 1.0, 2.0, 5.0)
+
+# Bytes read from a socket at once
+READ_SIZE = 65536
+
+# States of a connection
+DISCONNECTED, CONNECTING, CONNECTED, CLOSED = "disconnected", "connecting", "connected", "closed"
+
+def apply_update(state: dict | None, response: dict) -> dict:
+    """
+    Apply a reply of GET_SERVER or MAKE_MOVE to the state of the game known by the client
+    :param state: state known by the client, None if there is none
+    :param response: decoded reply of the server
+    :return: the new state known by the client
+    """
+    update = response.get("update", "snapshot")
+    if update == "snapshot" or state is None:
+        return response
+
+    if update == "delta":
+        for x, y, symbol in response["moves"]:
+            state["board"][x][y] = symbol
+        state["current_player"] = response["current_player"]
+        state["winner"] = response["winner"]
+
+    state["status"] = response["status"]
+    state["seq"] = response["seq"]
+    return state
+
+class NetworkWorker:
+    """
+    Thread serving the sockets of many connections.
+    The other threads never touch the sockets: they hand functions to the worker with call_soon.
+    """
+
+    def __init__(self, name: str = "network-worker"):
+        """
+        :param name: Name of the thread
+        """
+        self.selector = selectors.DefaultSelector()
+
+        # Functions to run on the thread of the worker, and the lock of the list
+        self.calls: deque = deque()
+        self.calls_lock = threading.Lock()
+
+        # Functions to run later, as a heap of (time, order, function)
+        self.timers: list[tuple[float, int, object]] = list()
+        self.timer_order = itertools.count()
+
+        # Writing a byte on this pair of sockets wakes up the selector
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, None)
+
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def call_soon(self, function):
+        """
+        Run a function on the thread of the worker
+        :param function: function without arguments
+        :return: None
+        """
+        with self.calls_lock:
+            self.calls.append(function)
+        try:
+            self.wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            # The selector is already woken up
+            pass
+
+    def call_later(self, delay: float, function):
+        """
+        Run a function on the thread of the worker after a delay. Must be called from the thread of the worker.
+        :param delay: Delay in seconds
+        :param function: function without arguments
+        :return: None
+        """
+        heapq.heappush(self.timers, (time.monotonic() + delay, next(self.timer_order), function))
+
+    def _run(self):
+        while True:
+            timeout = max(0.0, self.timers[0][0] - time.monotonic()) if self.timers else None
+
+            for key, mask in self.selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self.wakeup_reader.recv(READ_SIZE):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+
+                try:
+                    key.data.handle_events(mask)
+                except Exception:
+                    logging.exception("Error in the network worker")
+
+            # Timers due
+            now = time.monotonic()
+            while self.timers and self.timers[0][0] <= now:
+                self._execute(heapq.heappop(self.timers)[2])
+
+            # Functions handed by the other threads
+            with self.calls_lock:
+                calls, self.calls = self.calls, deque()
+            for function in calls:
+                self._execute(function)
+
+    @staticmethod
+    def _execute(function):
+        try:
+            function()
+        except Exception:
+            logging.exception("Error in the network worker")
+
+# Worker shared by the clients created without their own worker
+_default_worker: NetworkWorker | None = None
+_default_worker_lock = threading.Lock()
+
+def default_worker() -> NetworkWorker:
+    """
+    Get the network worker shared by the clients of the process, and start it if needed
+    :return: NetworkWorker object
+    """
+    global _default_worker
+    with _default_worker_lock:
+        if _default_worker is None:
+            _default_worker = NetworkWorker()
+        return _default_worker
+
+class GameClient:
+    """
+    Connection of a client to the server.
+    Each request gets a new id, and its Future is completed with the decoded response carrying the same id.
+    The requests sent while the connection is being opened are kept and sent after the handshake. The requests
+    waiting for a response when the connection is lost fail with a ConnectionError.
+    """
+
+    def __init__(self, host: str, port: int, encodings: tuple[str, ...] = (BINARY, JSON), on_push=None,
+                 on_reconnect=None, on_close=None, reconnect: bool = True, max_attempts: int = 5,
+                 timeout: float | None = 10.0, worker: NetworkWorker | None = None):
+        """
+        :param host: Address of the server
+        :param port: Port of the server
+        :param encodings: Encodings of the responses supported by the client, the preferred one first
+        :param on_push: function called with every message pushed by the server, decoded, from the network worker
+        :param on_reconnect: function called with the response to the new handshake after a reconnection, with the
+        game whose place was taken back after a restart of the server in "resumed"
+        :param on_close: function called when the connection is closed for good
+        :param reconnect: Open the connection again when it is lost
+        :param max_attempts: Number of failed attempts to open the connection in a row before giving up
+        :param timeout: Maximum time to wait for a response in call, None to wait forever
+        :param worker: NetworkWorker serving the connection, the shared one by default
+        """
+        self.host: str = host
+        self.port: int = port
+        self.encodings: tuple[str, ...] = encodings
+        self.on_push = on_push
+        self.on_reconnect = on_reconnect
+        self.on_close = on_close
+        self.reconnect: bool = reconnect
+        self.max_attempts: int = max_attempts
+        self.timeout: float | None = timeout
+        self.worker: NetworkWorker = worker or default_worker()
+
+        # Name given by the server and encoding of its responses, known after the handshake
+        self.name: str | None = None
+        self.encoding: str = JSON
+
+        # Secret of the player given by a server keeping a journal, to take back his place after a restart
+        self.token: str | None = None
+
+        # Games whose changes are pushed, subscribed again after a reconnection
+        self.subscriptions: set[str] = set()
+
+        # Games watched as a spectator, watched again after a reconnection
+        self.watching: set[str] = set()
+
+        self.state: str = DISCONNECTED
+        self.socket: socket.socket | None = None
+
+        # Bytes received and not parsed yet, bytes to send
+        self.incoming = bytearray()
+        self.outgoing = bytearray()
+
+        # Responses expected: request id -> (future, encoding of the response, None for the negotiated one)
+        self.pending: dict[int, tuple[Future, str | None]] = dict()
+
+        # Requests waiting for the connection to be opened, as (request id, frame)
+        self.queued: list[tuple[int, bytes]] = list()
+
+        # Completed with the response to the first handshake
+        self.connected: Future = Future()
+
+        # Failed attempts to open the connection in a row
+        self.attempts: int = 0
+
+        # Id of the last request, taken by the threads of the callers
+        self.last_id: int = 0
+        self.id_lock = threading.Lock()
+
+    @property
+    def closed(self) -> bool:
+        return self.state == CLOSED
+
+    def connect(self) -> Future:
+        """
+        Open the connection and negotiate the encoding of the responses
+        :return: a Future completed with the response to the handshake
+        """
+        self.worker.call_soon(self._open)
+        return self.connected
+
+    def request(self, msg: str, encoding: str | None = None) -> Future:
+        """
+        Send a request
+        :param msg: request to send
+        :param encoding: encoding of the response, the negotiated one by default
+        :return: a Future completed with the decoded response
+        """
+        return self.pipeline([msg], encoding)[0]
+
+    def pipeline(self, messages: list[str], encoding: str | None = None) -> list[Future]:
+        """
+        Send several requests at once
+        :param messages: requests to send
+        :param encoding: encoding of the responses, the negotiated one by default
+        :return: a Future for each request, completed with its decoded response
+        """
+        requests = [self._new_request(msg, encoding) for msg in messages]
+        self.worker.call_soon(lambda: self._send(requests))
+        return [future for _, _, future, _ in requests]
+
+    def call(self, msg: str, timeout: float | None = None) -> dict:
+        """
+        Send a request and wait for its response
+        :param msg: request to send
+        :param timeout: Maximum time to wait, the timeout of the client by default
+        :return: the decoded response
+        """
+        return self.request(msg).result(timeout if timeout is not None else self.timeout)
+
+    def close(self):
+        """
+        Close the connection for good
+        :return: None
+        """
+        self.worker.call_soon(self._close)
+
+    def _new_request(self, msg: str, encoding: str | None) -> tuple[int, bytes, Future, str | None]:
+        """
+        Build a request, from any thread
+        :param msg: request to send
+        :param encoding: encoding of the response, None for the negotiated one
+        :return: (request id, frame, future of the response, encoding of the response)
+        """
+        with self.id_lock:
+            self.last_id = self.last_id % MAX_REQUEST_ID + 1
+            request_id = self.last_id
+
+        future = Future()
+        # The future can no longer be cancelled, only the worker completes it
+        future.set_running_or_notify_cancel()
+
+        self._track_subscription(msg)
+        return request_id, pack_frame(request_id, msg.encode(FORMAT)), future, encoding
+
+    def _track_subscription(self, msg: str):
+        operation, _, server_name = msg.partition('/')
+        if operation == ClientAPI.SUBSCRIBE:
+            self.subscriptions.add(server_name)
+        elif operation == ClientAPI.UNSUBSCRIBE:
+            self.subscriptions.discard(server_name)
+        elif operation == ClientAPI.WATCH:
+            self.watching.add(server_name)
+        elif operation == ClientAPI.UNWATCH:
+            self.watching.discard(server_name)
+
+    # The following methods run on the thread of the worker
+
+    def _open(self):
+        if self.state != DISCONNECTED:
+            return
+
+        self.state = CONNECTING
+        try:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setblocking(False)
+            self.socket.connect_ex((self.host, self.port))
+            self.worker.selector.register(self.socket, selectors.EVENT_WRITE, self)
+        except OSError as error:
+            self._lost(error)
+
+    def _on_connected(self):
+        self.state = CONNECTED
+        self.attempts = 0
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # The handshake is sent before any other request, its response is always in JSON
+        handshake = self._new_request(f"{ClientAPI.GET_MY_NAME}/{'/'.join(self.encodings)}", JSON)
+        requests = [handshake]
+
+        # After a reconnection, the player asks for his previous place, in case the server restarted
+        resume = None
+        if self.connected.done() and self.token is not None:
+            resume = self._new_request(f"{ClientAPI.RESUME}/{self.name}/{self.token}", None)
+            requests.append(resume)
+        handshake[2].add_done_callback(lambda future: self._on_handshake(future, resume and resume[2]))
+
+        # Then the subscriptions and the games watched are restored
+        if self.connected.done():
+            requests += [self._new_request(f"{ClientAPI.SUBSCRIBE}/{server_name}", None)
+                         for server_name in self.subscriptions]
+            requests += [self._new_request(f"{ClientAPI.WATCH}/{server_name}", None)
+                         for server_name in self.watching]
+        self._send(requests)
+
+        # Then the requests sent while the connection was being opened
+        for request_id, frame in self.queued:
+            self.outgoing += frame
+        self.queued.clear()
+        self._update_events()
+
+    def _on_handshake(self, handshake: Future, resume: Future | None):
+        if handshake.exception() is not None:
+            return
+        response = handshake.result()
+        self.name = response["name"]
+        self.encoding = response["encoding"]
+
+        if resume is not None:
+            resume.add_done_callback(lambda future: self._on_resume(future, response))
+            return
+
+        self.token = response.get("token")
+        if not self.connected.done():
+            self.connected.set_result(response)
+        elif self.on_reconnect is not None:
+            self.on_reconnect(dict(response, resumed=None))
+
+    def _on_resume(self, resume: Future, response: dict):
+        if resume.exception() is None and resume.result()["status"] == "success":
+            # The previous name and token are kept
+            self.name = resume.result()["name"]
+            response = dict(response, name=self.name, token=self.token, resumed=resume.result()["game"])
+        else:
+            self.token = response.get("token")
+            response = dict(response, resumed=None)
+
+        if self.on_reconnect is not None:
+            self.on_reconnect(response)
+
+    def _send(self, requests: list[tuple[int, bytes, Future, str | None]]):
+        for request_id, frame, future, encoding in requests:
+            if self.state == CLOSED:
+                future.set_exception(ConnectionError("The connection is closed"))
+                continue
+
+            self.pending[request_id] = future, encoding
+            if self.state == CONNECTED:
+                self.outgoing += frame
+            else:
+                self.queued.append((request_id, frame))
+
+        self._update_events()
+
+    def _update_events(self):
+        if self.state != CONNECTED:
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if self.outgoing else 0)
+        self.worker.selector.modify(self.socket, events, self)
+
+    def handle_events(self, mask: int):
+        """
+        Read and write the socket when it is ready. Called by the worker.
+        :param mask: selectors events ready
+        :return: None
+        """
+        if self.state == CONNECTING:
+            error = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self._lost(OSError(error, "Cannot connect to the server"))
+            else:
+                self._on_connected()
+            return
+
+        try:
+            if mask & selectors.EVENT_READ:
+                self._read()
+            if mask & selectors.EVENT_WRITE and self.state == CONNECTED:
+                self._write()
+        except OSError as error:
+            self._lost(error)
+
+    def _read(self):
+        while True:
+            try:
+                chunk = self.socket.recv(READ_SIZE)
+            except BlockingIOError:
+                break
+            if not chunk:
+                raise ConnectionError("Connection closed by the server")
+            self.incoming += chunk
+
+        # Parse every complete message
+        offset = 0
+        while len(self.incoming) - offset >= HEADER.size:
+            length, request_id = unpack_header(self.incoming[offset:offset + HEADER.size])
+            end = offset + HEADER.size + length
+            if len(self.incoming) < end:
+                break
+            self._on_message(request_id, bytes(self.incoming[offset + HEADER.size:end]))
+            offset = end
+        del self.incoming[:offset]
+
+    def _write(self):
+        sent = self.socket.send(self.outgoing)
+        del self.outgoing[:sent]
+        self._update_events()
+
+    def _on_message(self, request_id: int, payload: bytes):
+        if request_id == PUSH_ID:
+            try:
+                response = decode(payload, self.encoding)
+
+                # The server closes the connections that stay silent after a ping, the answer is not waited for
+                if response.get("event") == "ping":
+                    self._send([self._new_request(ClientAPI.PING, None)])
+                    return
+
+                # The server subscribes the players of a quick match to their game
+                if response.get("event") == "match":
+                    self.subscriptions.add(response["name"])
+                if self.on_push is not None:
+                    self.on_push(response)
+            except Exception:
+                logging.exception("Error in the handler of a pushed message")
+            return
+
+        expected = self.pending.pop(request_id, None)
+        if expected is None:
+            return
+        future, encoding = expected
+        try:
+            future.set_result(decode(payload, encoding or self.encoding))
+        except (ValueError, KeyError, IndexError) as error:
+            future.set_exception(ProtocolError(f"Cannot decode the response: {error}"))
+
+    def _fail_pending(self, error: Exception):
+        pending, self.pending = self.pending, dict()
+        for future, _ in pending.values():
+            future.set_exception(error)
+
+    def _release_socket(self):
+        if self.socket is None:
+            return
+        try:
+            self.worker.selector.unregister(self.socket)
+        except (KeyError, ValueError):
+            pass
+        self.socket.close()
+        self.socket = None
+        self.incoming.clear()
+        self.outgoing.clear()
+
+    def _lost(self, error: Exception):
+        self._release_socket()
+        self.queued.clear()
+        self._fail_pending(ConnectionError(f"Connection lost: {error}"))
+
+        self.attempts += 1
+        if self.state == CLOSED or not self.reconnect or self.attempts > self.max_attempts:
+            self._closed_for_good(error)
+            return
+
+        # Open the connection again later
+        self.state = DISCONNECTED
+        delay = RECONNECT_DELAYS[min(self.attempts, len(RECONNECT_DELAYS)) - 1]
+        self.worker.call_later(delay, self._open)
+
+    def _close(self):
+        if self.state == CLOSED:
+            return
+        if self.state == CONNECTED:
+            # Tell the server, without waiting for the socket to be writable
+            _, frame, _, _ = self._new_request(ClientAPI.QUIT, None)
+            try:
+                self.socket.send(self.outgoing + frame)
+            except OSError:
+                pass
+        self._release_socket()
+        self._closed_for_good(ConnectionError("The connection is closed"))
+
+    def _closed_for_good(self, error: Exception):
+        self.state = CLOSED
+        self.queued.clear()
+        self._fail_pending(ConnectionError(str(error)))
+        if not self.connected.done():
+            self.connected.set_exception(ConnectionError(str(error)))
+        if self.on_close is not None:
+            self.on_close()
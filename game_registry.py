@@ -0,0 +1,444 @@
+import threading
+from collections import deque
+from typing import Callable
+
+from game import WIN_LENGTH, Game
+from player import Player
+
+# Number of removed games remembered to answer the requests for changes
+REMOVED_HISTORY = 1024
+
+# Removed games kept in the slots of an index before it is compacted, beyond the number of its games
+COMPACT_SLACK = 64
+
+class GameIndex:
+    """
+    Define games kept in their order of insertion, read by position.
+    A removed game leaves an empty slot, and a Fenwick tree counts the games of the slots, so the slot of the n-th
+    game is found in O(log n): adding and removing a game cost O(log n), and a page of k games O(k + log n), or
+    O(k log n) at most when removed games are among them, whatever its offset. The empty slots are compacted once
+    they outnumber the games, which adds an amortized O(1) per removal.
+    """
+
+    def __init__(self):
+        # Games in their order of insertion, None for a removed game
+        self.slots: list[Game | None] = list()
+
+        # Fenwick tree of the number of games of the slots, indexed from 1
+        self.tree: list[int] = [0]
+
+        # Slot of each game, by name
+        self.slot_of: dict[str, int] = dict()
+
+    def __len__(self) -> int:
+        return len(self.slot_of)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.slot_of
+
+    def _count_before(self, slot: int) -> int:
+        # Games of the slots before a slot
+        count = 0
+        while slot:
+            count += self.tree[slot]
+            slot &= slot - 1
+        return count
+
+    def _find(self, rank: int) -> int:
+        # Slot of the game with this rank (from 0), by descending the tree
+        slot = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if slot + step < len(self.tree) and self.tree[slot + step] <= rank:
+                slot += step
+                rank -= self.tree[slot]
+            step >>= 1
+        return slot
+
+    def add(self, game: Game):
+        """
+        Add a game at the end of the index
+        :param game: A Game object, not in the index
+        :return: None
+        """
+        slot = self.slot_of[game.name] = len(self.slots)
+        self.slots.append(game)
+
+        # The new node counts the slots it covers, itself included
+        node = slot + 1
+        self.tree.append(1 + self._count_before(slot) - self._count_before(node - (node & -node)))
+
+    def remove(self, name: str) -> Game | None:
+        """
+        Remove a game from the index
+        :param name: Name of the game
+        :return: the Game object removed, or None if the game was not in the index
+        """
+        slot = self.slot_of.pop(name, None)
+        if slot is None:
+            return None
+        game, self.slots[slot] = self.slots[slot], None
+
+        node = slot + 1
+        while node < len(self.tree):
+            self.tree[node] -= 1
+            node += node & -node
+
+        if len(self.slots) > 2 * len(self.slot_of) + COMPACT_SLACK:
+            self._compact()
+        return game
+
+    def _compact(self):
+        self.slots = [game for game in self.slots if game is not None]
+        self.slot_of = {game.name: slot for slot, game in enumerate(self.slots)}
+
+        # Each node adds its count to its parent, in O(n)
+        self.tree = [0] + [1] * len(self.slots)
+        for node in range(1, len(self.tree)):
+            parent = node + (node & -node)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[node]
+
+    def page(self, start: int, stop: int | None) -> list[Game]:
+        """
+        Get the games between two positions
+        :param start: Position of the first game
+        :param stop: Position after the last game, None for the end of the index
+        :return: list of Game objects
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        games = list()
+        while start + len(games) < stop:
+            # The slots from the next game on are sliced, and the games after the empty ones found in the tree again
+            slot = self._find(start + len(games))
+            games += [game for game in self.slots[slot:slot + stop - start - len(games)] if game is not None]
+        return games
+
+class GameRegistry:
+    """
+    Define the set of games hosted by the server.
+    Games are indexed by name, by state (open or started) and by player, so every lookup is done in constant time.
+    Every change of the list of games (creation, removal, join, exit, start) increases the version of the registry,
+    which lets a client ask only for the changes since the last version it has seen.
+    Every operation is atomic: a change of a game holds the lock of the game, and the indexes are changed while
+    holding the lock of the registry, always taken after the lock of the game. The game is changed (and its
+    observers called) before the registry lock is taken, so a slow observer never blocks the other games.
+    Every change is also given to on_change (the journal of the server) while the lock of the game is held, so
+    the changes of a game are recorded in the order they are made.
+    """
+
+    def __init__(self):
+        # All the games, by name
+        self.games: dict[str, Game] = dict()
+
+        # Games waiting for players, in their order of creation
+        self.open_games = GameIndex()
+
+        # Games that have started, in their order of start
+        self.started_games = GameIndex()
+
+        # Game of each player inside a game
+        self.games_by_player: dict[Player, Game] = dict()
+
+        # Version of the list of games, increased by every change
+        self.version: int = 0
+
+        # Version of the last change of each game, ordered from the oldest change to the newest
+        self.changes: dict[str, int] = dict()
+
+        # Version of the creation of each game
+        self.created: dict[str, int] = dict()
+
+        # (version, name) of the last removed games
+        self.removed: deque[tuple[int, str]] = deque(maxlen=REMOVED_HISTORY)
+
+        # Version of the newest removal forgotten from the history
+        self.forgotten_version: int = 0
+
+        # Lock of the indexes and the versions, held for short operations only
+        self.lock = threading.RLock()
+
+        # Function called with (operation, game, player, *arguments) after every change of a game, while the lock of
+        # the game is held. The operations are the events of the games, and "create".
+        self.on_change: Callable[..., None] | None = None
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.games
+
+    def _touch(self, game: Game):
+        """
+        Record a change of a game
+        :param game: A Game object of the registry
+        :return: None
+        """
+        self.version += 1
+
+        # Move the game at the end of the changes
+        self.changes.pop(game.name, None)
+        self.changes[game.name] = self.version
+
+    def get(self, name: str) -> Game | None:
+        """
+        Get a game by name
+        :param name: Name of the game
+        :return: the Game object, or None if there is no game with this name
+        """
+        return self.games.get(name)
+
+    def game_of(self, player: Player) -> Game | None:
+        """
+        Get the game of a player
+        :param player: A Player object
+        :return: the Game object, or None if the player is not inside a game
+        """
+        return self.games_by_player.get(player)
+
+    def create(self, name: str, player: Player | None = None,
+               observers: list[Callable[[Game, str], None]] = (), size: int | None = None,
+               win_length: int = WIN_LENGTH) -> Game | None:
+        """
+        Create a new game, unless the name is already used or the player is already inside a game
+        :param name: Name of the game
+        :param player: First player of the game, None to create an empty game
+        :param observers: Functions called after every change of the game
+        :param size: Number of rows and columns of the board, None for one more than the players at the start
+        :param win_length: Number of aligned symbols needed to win
+        :return: the new Game object, or None if there is already a game with this name or the player is inside a game
+        """
+        with self.lock:
+            if name in self.games or player in self.games_by_player:
+                return None
+
+            # The game is not visible to the other threads yet, so its lock can be taken after the registry one
+            game = Game(name, size, win_length)
+            game.observers.extend(observers)
+            if player is not None:
+                game.add_player(player)
+                self.games_by_player[player] = game
+
+            # Recorded before the game is visible, so before any other change of the game
+            if self.on_change is not None:
+                self.on_change("create", game, player)
+
+            self.games[name] = game
+            self.open_games.add(game)
+
+            self._touch(game)
+            self.created[name] = self.version
+            return game
+
+    def add_player(self, game: Game, player: Player) -> bool:
+        """
+        Add a player to a game waiting for players
+        :param game: A Game object of the registry
+        :param player: A Player object
+        :return: False if the game has started, is full or has been removed, or if the player is already inside a game
+        """
+        with game.lock:
+            # A game is removed while holding its lock, so it cannot be removed during the change
+            if game.has_started or game.is_full() or self.games.get(game.name) is not game:
+                return False
+
+            # The game of the player is set first, so he can never join two games at the same time
+            with self.lock:
+                if player in self.games_by_player:
+                    return False
+                self.games_by_player[player] = game
+
+            game.add_player(player)
+            if self.on_change is not None:
+                self.on_change("join", game, player)
+
+            with self.lock:
+                self._touch(game)
+            return True
+
+    def remove_player(self, player: Player) -> Game | None:
+        """
+        Remove a player from his game. The game is deleted if there is no player left in it.
+        :param player: A Player object
+        :return: the Game object the player left, or None if the player was not inside a game
+        """
+        game = self.games_by_player.get(player)
+        if game is None:
+            return None
+
+        with game.lock:
+            # The player is removed only once
+            with self.lock:
+                if self.games_by_player.get(player) is not game:
+                    return None
+                del self.games_by_player[player]
+
+            game.remove_player(player)
+
+            # Recorded before the game is removed, so before the creation of another game with the same name
+            if self.on_change is not None:
+                self.on_change("exit", game, player)
+
+            # If there is no player in the game
+            if len(game.players) == 0:
+                self.delete(game)
+            else:
+                with self.lock:
+                    self._touch(game)
+
+        return game
+
+    def start(self, game: Game) -> bool:
+        """
+        Start a game
+        :param game: A Game object of the registry
+        :return: False if the game has already started or has been removed
+        """
+        with game.lock:
+            if game.has_started or self.games.get(game.name) is not game:
+                return False
+
+            game.start()
+            if self.on_change is not None:
+                self.on_change("start", game)
+
+            with self.lock:
+                self.open_games.remove(game.name)
+                self.started_games.add(game)
+                self._touch(game)
+            return True
+
+    def make_move(self, game: Game, player: Player, x: int, y: int) -> bool:
+        """
+        Make the move of a player in a game
+        :param game: A Game object of the registry
+        :param player: A Player object
+        :param x: The x-position of the move
+        :param y: The y-position of the move
+        :return: True if the move was made, False otherwise
+        """
+        with game.lock:
+            if not game.make_move(player, x, y):
+                return False
+            if self.on_change is not None:
+                self.on_change("move", game, player, x, y)
+            return True
+
+    def replace_player(self, previous: Player, player: Player) -> Game | None:
+        """
+        Give the place of a player in his game to another Player object with the same name
+        :param previous: A Player object inside a game
+        :param player: The Player object taking his place, inside no game
+        :return: the Game object, or None if the previous player is not inside a game anymore
+        """
+        game = self.games_by_player.get(previous)
+        if game is None:
+            return None
+
+        with game.lock:
+            with self.lock:
+                if self.games_by_player.get(previous) is not game:
+                    return None
+                del self.games_by_player[previous]
+                self.games_by_player[player] = game
+
+            game.replace_player(previous, player)
+        return game
+
+    def restore(self, game: Game, observers: list[Callable[[Game, str], None]] = ()) -> bool:
+        """
+        Add a game rebuilt after a restart of the server
+        :param game: A Game object, with its players
+        :param observers: Functions called after every change of the game
+        :return: False if there is already a game with this name
+        """
+        with self.lock:
+            if game.name in self.games:
+                return False
+
+            game.observers.extend(observers)
+            self.games[game.name] = game
+            if game.has_started:
+                self.started_games.add(game)
+            else:
+                self.open_games.add(game)
+            for player in game.players:
+                self.games_by_player[player] = game
+
+            self._touch(game)
+            self.created[game.name] = self.version
+            return True
+
+    def delete(self, game: Game):
+        """
+        Remove a game from the registry
+        :param game: A Game object of the registry
+        :return: None
+        """
+        with game.lock, self.lock:
+            if self.games.get(game.name) is not game:
+                return
+
+            del self.games[game.name]
+            self.open_games.remove(game.name)
+            self.started_games.remove(game.name)
+
+            for player in game.players:
+                self.games_by_player.pop(player, None)
+
+            self.changes.pop(game.name, None)
+            self.created.pop(game.name, None)
+
+            self.version += 1
+            if len(self.removed) == self.removed.maxlen:
+                self.forgotten_version = self.removed[0][0]
+            self.removed.append((self.version, game.name))
+
+    def list_games(self, offset: int = 0, limit: int | None = None) -> list[Game]:
+        """
+        List the games, the games waiting for players first. A page is sliced from the indexes of the states, so its
+        cost does not grow with the offset.
+        :param offset: Number of games to skip
+        :param limit: Maximum number of games to list, None to list all of them
+        :return: list of Game objects
+        """
+        with self.lock:
+            games = self.open_games.page(offset, None if limit is None else offset + limit)
+
+            if limit is None or len(games) < limit:
+                started_offset = max(0, offset - len(self.open_games))
+                started_limit = None if limit is None else started_offset + limit - len(games)
+                games += self.started_games.page(started_offset, started_limit)
+
+        return games
+
+    def changes_since(self, version: int) -> tuple[list[Game], list[Game], list[str]] | None:
+        """
+        Get the changes of the list of games since a version
+        :param version: Version of the list known by the client
+        :return: (added games, updated games, names of the removed games), or None if the changes are not known
+                 anymore and the whole list must be loaded again
+        """
+        with self.lock:
+            if version < self.forgotten_version or version > self.version:
+                return None
+
+            added, updated = list(), list()
+
+            # The newest changes are at the end
+            for name in reversed(self.changes):
+                if self.changes[name] <= version:
+                    break
+                game = self.games[name]
+                if self.created[name] > version:
+                    added.append(game)
+                else:
+                    updated.append(game)
+
+            removed = list()
+            for removed_version, name in reversed(self.removed):
+                if removed_version <= version:
+                    break
+                removed.append(name)
+
+            return added, updated, removed
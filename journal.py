@@ -0,0 +1,442 @@
+"""
+Write-ahead journal of the games, to rebuild them after a restart of the server.
+
+Every change of a game (create, join, exit, start, move) is appended to the journal as one line, while the lock of
+the game is held, so the lines of a game are in the order of its changes. A background thread writes the lines and
+syncs them to the disk every sync interval, with one write and one fsync for all the changes of the interval: the
+requests never wait for the disk, and a crash loses at most the changes of the last interval.
+
+The journal is split in segments. When a segment is full, the next one is started, and the compaction thread replays
+the closed segments onto the last snapshot, writes the new snapshot and deletes the files it replaces. On startup, the
+games are rebuilt from the last snapshot and the segments written after it, so the recovery time depends on the games
+alive and the changes since the last snapshot, not on the whole history.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Callable, Iterator
+
+from bitboard import BitBoard
+from bot import Bot
+from game import WIN_LENGTH, Game
+from game_registry import GameRegistry
+from player import Player
+
+# Seconds between two syncs of the journal to the disk
+SYNC_INTERVAL = 0.01
+
+# Number of changes written in a segment before the next one is started
+SEGMENT_RECORDS = 100_000
+
+# Address of the players rebuilt from the journal, until their client takes back his place
+DETACHED = ("journal", 0)
+
+# Names of the files of the journal, numbered by segment
+SEGMENT_NAME = "journal-{:08d}.log"
+SNAPSHOT_NAME = "snapshot-{:08d}.json"
+FILE_PATTERN = re.compile(r"(journal|snapshot)-(\d{8})\.(log|json)")
+
+def encode_record(record: dict) -> bytes:
+    """
+    Encode a change as a line of the journal, starting with its CRC-32 to detect a line torn by a crash
+    :param record: dict describing the change
+    :return: the line
+    """
+    payload = json.dumps(record, separators=(",", ":")).encode()
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+def read_records(path: str) -> Iterator[dict]:
+    """
+    Read the changes of a segment, until the end of the file or the first line torn or corrupted
+    :param path: Path of the segment
+    :return: an iterator of the dicts describing the changes
+    """
+    with open(path, "rb") as file:
+        for number, line in enumerate(file, 1):
+            crc, _, payload = line.rstrip(b"\n").partition(b" ")
+            try:
+                valid = line.endswith(b"\n") and int(crc, 16) == zlib.crc32(payload)
+            except ValueError:
+                valid = False
+
+            if not valid:
+                logging.warning(f"The journal {path} is cut at line {number}")
+                return
+            yield json.loads(payload)
+
+def make_player(name: str, token: str | None, bot: bool = False) -> Player:
+    """
+    Build a player rebuilt from the journal, without connection
+    :param name: Name of the player
+    :param token: Secret of the client of the player
+    :param bot: True for a computer player
+    :return: a Player object, or a Bot object
+    """
+    player = Bot(DETACHED, name) if bot else Player(DETACHED, name)
+    player.token = token
+    return player
+
+def apply_record(registry: GameRegistry, players: dict[str, Player], record: dict,
+                 observers: list[Callable[[Game, str], None]] = ()):
+    """
+    Replay a change of the journal on a registry
+    :param registry: GameRegistry object
+    :param players: Players inside the games of the registry, by name, updated with the change
+    :param record: dict describing the change
+    :param observers: Functions called after every change of the games created
+    :return: None
+    """
+    operation = record["op"]
+    if operation == "create":
+        player = None
+        if record["player"] is not None:
+            player = players[record["player"]] = make_player(record["player"], record.get("token"))
+        registry.create(record["game"], player, observers, record.get("size"), record.get("win_length", WIN_LENGTH))
+        return
+
+    game = registry.get(record["game"])
+    player = players.get(record.get("player"))
+    if game is None or (operation in ("exit", "move") and player is None):
+        logging.warning(f"The change {record} of the journal does not match the games rebuilt")
+        return
+
+    if operation == "join":
+        player = players[record["player"]] = make_player(record["player"], record.get("token"), record.get("bot"))
+        registry.add_player(game, player)
+    elif operation == "exit":
+        del players[player.name]
+        registry.remove_player(player)
+    elif operation == "start":
+        registry.start(game)
+    elif operation == "move":
+        registry.make_move(game, player, record["x"], record["y"])
+
+def dump_game(game: Game) -> dict:
+    """
+    Describe the whole state of a game for a snapshot. The lock of the game must be held.
+    The players are listed once with their symbol, including the players who left, and referred to by index.
+    :param game: Game object
+    :return: dict describing the game
+    """
+    everyone = list(game.symbols)
+    index = {player: position for position, player in enumerate(everyone)}
+    board = game.bitboard
+
+    return {"name": game.name,
+            "symbols": [[player.name, symbol, player.token, isinstance(player, Bot)]
+                        for player, symbol in game.symbols.items()],
+            "by_symbol": [[symbol, index[player]] for symbol, player in game.players_by_symbol.items()],
+            "players": [index[player] for player in game.players],
+            "current": index.get(game.current_player),
+            "started": game.has_started,
+            "size": board.size if board is not None else None,
+            "board_size": game.size,
+            "win_length": game.win_length,
+            "masks": board.masks if board is not None else None,
+            "winner": game.winner,
+            "seq": game.seq,
+            "started_at": game.started_at,
+            "history": game.history.hex()}
+
+def load_game(data: dict, players: dict[str, Player]) -> Game:
+    """
+    Rebuild a game described by dump_game
+    :param data: dict describing the game
+    :param players: Players inside the games, by name, updated with the players of the game
+    :return: Game object
+    """
+    game = Game(data["name"], data.get("board_size"), data.get("win_length", WIN_LENGTH))
+
+    everyone = [make_player(name, token, bot) for name, _, token, bot in data["symbols"]]
+    for player, (_, symbol, _, _) in zip(everyone, data["symbols"]):
+        game.symbols[player] = symbol
+    game.players_by_symbol = {symbol: everyone[position] for symbol, position in data["by_symbol"]}
+
+    game.players = [everyone[position] for position in data["players"]]
+    for player in game.players:
+        player.join_game(game.name)
+        players[player.name] = player
+
+    game.current_player = everyone[data["current"]] if data["current"] is not None else None
+    game.has_started = data["started"]
+
+    if data["size"] is not None:
+        game.bitboard = BitBoard(data["size"])
+        game.bitboard.masks = data["masks"]
+        for mask in data["masks"]:
+            game.bitboard.occupied |= mask
+
+    winner, cells = data["winner"]
+    game.winner = winner, [tuple(cell) for cell in cells]
+    game.seq = data["seq"]
+    game.started_at = data["started_at"]
+    game.history = bytearray.fromhex(data["history"])
+    game.last_move_at = time.monotonic()
+    return game
+
+class Journal:
+    """
+    Append-only journal of the changes of the games, synced to the disk in batches and compacted into snapshots.
+    """
+
+    def __init__(self, directory: str, sync_interval: float = SYNC_INTERVAL, segment_records: int = SEGMENT_RECORDS):
+        """
+        :param directory: Directory of the segments and the snapshots, created if needed
+        :param sync_interval: Seconds between two syncs to the disk
+        :param segment_records: Number of changes written in a segment before the next one is started
+        """
+        self.directory: str = directory
+        self.sync_interval: float = sync_interval
+        self.segment_records: int = segment_records
+        os.makedirs(directory, exist_ok=True)
+
+        # Lines appended and not written yet, swapped by the sync thread
+        self.pending: list[bytes] = list()
+        self.lock = threading.Lock()
+        self.closed: bool = False
+
+        # Segment written, its file and its number of lines. Only changed while holding write_lock.
+        self.segment: int = 0
+        self.file = None
+        self.segment_lines: int = 0
+        self.write_lock = threading.Lock()
+
+        # Changes written, syncs done and time spent writing and syncing
+        self.records: int = 0
+        self.syncs: int = 0
+        self.sync_time: float = 0.0
+
+        self.stopped = threading.Event()
+        self.compaction_needed = threading.Event()
+
+        # Held during a compaction, so the files are only replaced by one compaction at a time
+        self.compaction_lock = threading.Lock()
+
+    def path(self, name: str, segment: int) -> str:
+        """
+        Build the path of a file of the journal
+        :param name: SEGMENT_NAME or SNAPSHOT_NAME
+        :param segment: Number of the segment
+        :return: the path
+        """
+        return os.path.join(self.directory, name.format(segment))
+
+    def files(self) -> tuple[list[int], list[int]]:
+        """
+        List the files of the journal
+        :return: (numbers of the segments, numbers of the snapshots), in increasing order
+        """
+        segments, snapshots = list(), list()
+        for file_name in os.listdir(self.directory):
+            match = FILE_PATTERN.fullmatch(file_name)
+            if match is not None:
+                (segments if match.group(1) == "journal" else snapshots).append(int(match.group(2)))
+        return sorted(segments), sorted(snapshots)
+
+    def load(self, registry: GameRegistry, players: dict[str, Player],
+             observers: list[Callable[[Game, str], None]] = (), last_segment: int | None = None) -> dict:
+        """
+        Rebuild the games from the last snapshot and the segments written after it
+        :param registry: GameRegistry object receiving the games, without on_change
+        :param players: dict receiving the players inside the games, by name
+        :param observers: Functions called after every change of the games rebuilt
+        :param last_segment: Number of the last segment replayed, None to replay all of them
+        :return: dict of the snapshot loaded, and the segments and the changes replayed
+        """
+        segments, snapshots = self.files()
+        snapshot = snapshots[-1] if snapshots else 0
+
+        if snapshot:
+            with open(self.path(SNAPSHOT_NAME, snapshot)) as file:
+                for data in json.load(file)["games"]:
+                    registry.restore(load_game(data, players), observers)
+
+        replayed = [segment for segment in segments
+                    if segment > snapshot and (last_segment is None or segment <= last_segment)]
+        records = 0
+        for segment in replayed:
+            for record in read_records(self.path(SEGMENT_NAME, segment)):
+                apply_record(registry, players, record, observers)
+                records += 1
+
+        return {"snapshot": snapshot, "segments": replayed, "records": records}
+
+    def recover(self, registry: GameRegistry, players: dict[str, Player],
+                observers: list[Callable[[Game, str], None]] = ()) -> dict:
+        """
+        Rebuild the games of the server on startup, before start
+        :param registry: GameRegistry object of the server, without on_change
+        :param players: dict receiving the players inside the games, by name
+        :param observers: Functions called after every change of the games rebuilt
+        :return: dict of the snapshot loaded, the segments and the changes replayed, the games and the seconds taken
+        """
+        start = time.perf_counter()
+        result = self.load(registry, players, observers)
+
+        # The next segment is a new file: the last one may end with a torn line
+        segments, snapshots = self.files()
+        self.segment = max(segments + snapshots, default=0)
+
+        result.update({"games": len(registry), "seconds": time.perf_counter() - start})
+        return result
+
+    def start(self):
+        """
+        Open a new segment and start the threads syncing and compacting the journal
+        :return: None
+        """
+        with self.write_lock:
+            self._open_segment(self.segment + 1)
+
+        threading.Thread(target=self._sync_loop, name="journal-sync", daemon=True).start()
+        threading.Thread(target=self._compaction_loop, name="journal-compaction", daemon=True).start()
+
+        # The segments replayed on startup are compacted at once
+        segments, snapshots = self.files()
+        if any(segment < self.segment and segment > max(snapshots, default=0) for segment in segments):
+            self.compaction_needed.set()
+
+    def record(self, operation: str, game: Game, player: Player | None = None, *arguments):
+        """
+        Append a change of a game. Called by the registry while the lock of the game is held.
+        :param operation: "create", "join", "exit", "start" or "move"
+        :param game: Game object changed
+        :param player: Player object making the change, if any
+        :param arguments: x and y of a move
+        :return: None
+        """
+        record = {"op": operation, "game": game.name}
+        if operation != "start":
+            record["player"] = player.name if player is not None else None
+        if operation == "create" and (game.size is not None or game.win_length != WIN_LENGTH):
+            record["size"], record["win_length"] = game.size, game.win_length
+        if operation in ("create", "join") and player is not None:
+            record["token"] = player.token
+            if isinstance(player, Bot):
+                record["bot"] = True
+        if operation == "move":
+            record["x"], record["y"] = arguments
+
+        line = encode_record(record)
+        with self.lock:
+            if not self.closed:
+                self.pending.append(line)
+
+    def flush(self):
+        """
+        Write the changes appended since the last call and sync them to the disk
+        :return: None
+        """
+        with self.write_lock:
+            with self.lock:
+                lines, self.pending = self.pending, list()
+            if not lines or self.file is None:
+                return
+
+            start = time.perf_counter()
+            self.file.write(b"".join(lines))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.sync_time += time.perf_counter() - start
+            self.syncs += 1
+            self.records += len(lines)
+            self.segment_lines += len(lines)
+
+            if self.segment_lines >= self.segment_records:
+                self.file.close()
+                self._open_segment(self.segment + 1)
+                self.compaction_needed.set()
+
+    def compact(self) -> int | None:
+        """
+        Replay the closed segments onto the last snapshot, write the new snapshot, then delete the files it replaces
+        :return: the number of the new snapshot, None if there was no closed segment to compact
+        """
+        with self.compaction_lock:
+            return self._compact()
+
+    def _compact(self) -> int | None:
+        segments, snapshots = self.files()
+        last_snapshot = snapshots[-1] if snapshots else 0
+        closed = [segment for segment in segments if last_snapshot < segment < self.segment]
+        if not closed:
+            return None
+
+        # The games are rebuilt apart from the ones of the server, which keep changing meanwhile
+        registry, players = GameRegistry(), dict()
+        self.load(registry, players, last_segment=closed[-1])
+
+        data = {"segment": closed[-1], "games": [dump_game(game) for game in registry.games.values()]}
+        path = self.path(SNAPSHOT_NAME, closed[-1])
+        with open(path + ".tmp", "w") as file:
+            json.dump(data, file, separators=(",", ":"))
+            file.flush()
+            os.fsync(file.fileno())
+
+        # The snapshot replaces the older files only once it is complete on the disk
+        os.replace(path + ".tmp", path)
+        self._sync_directory()
+        for segment in segments:
+            if segment <= closed[-1]:
+                os.remove(self.path(SEGMENT_NAME, segment))
+        for snapshot in snapshots:
+            os.remove(self.path(SNAPSHOT_NAME, snapshot))
+
+        logging.info(f"Journal compacted into {path}: {len(data['games'])} games")
+        return closed[-1]
+
+    def close(self):
+        """
+        Write the last changes and stop the threads. The changes made after are not recorded.
+        :return: None
+        """
+        with self.lock:
+            self.closed = True
+        self.stopped.set()
+        self.compaction_needed.set()
+
+        self.flush()
+        with self.write_lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def _open_segment(self, segment: int):
+        self.segment = segment
+        self.file = open(self.path(SEGMENT_NAME, segment), "ab")
+        self.segment_lines = 0
+        self._sync_directory()
+
+    def _sync_directory(self):
+        # The new files are kept after a crash only once their directory is synced. A directory cannot be opened on
+        # Windows, where the file system records the new files without it.
+        if os.name == "nt":
+            return
+        descriptor = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def _sync_loop(self):
+        while not self.stopped.wait(self.sync_interval):
+            try:
+                self.flush()
+            except OSError:
+                logging.exception("Cannot write the journal")
+
+    def _compaction_loop(self):
+        while True:
+            self.compaction_needed.wait()
+            if self.stopped.is_set():
+                return
+            self.compaction_needed.clear()
+            try:
+                self.compact()
+            except (OSError, ValueError):
+                logging.exception("Cannot compact the journal")
@@ -0,0 +1,181 @@
+"""
+Matchmaking queue of QUICK_MATCH: players asking for a game of a given number of players, matched in their order of
+arrival.
+
+There is one queue per number of players, an insertion-ordered dict by player: queuing a player, taking him out of
+the queue (cancel, disconnection, NEW_SERVER or JOIN_SERVER) and taking the first players of a full queue cost O(1)
+per player, whatever the number of players waiting. The players matched are taken out of the queue while the lock of
+the matchmaker is held, and their game is made once it is released: until finish is called for the match, leave and
+join wait for it, so a player taken out of the queue is never put in a game afterwards.
+A player already inside a game when the game of his match is made is dropped from the match, and the other players
+are put back at the head of their queue.
+"""
+
+import threading
+import time
+from collections import deque
+from itertools import islice
+from metrics import Histogram
+from player import Player
+from protocol import FramedConnection
+
+# Numbers of players of a match
+MIN_PLAYERS = 2
+MAX_PLAYERS = 16
+
+# Upper bounds in seconds of the buckets of the histogram of the waiting times: 1ms to about 17 minutes
+WAIT_BUCKETS = tuple(1e-3 * 2 ** i for i in range(21))
+
+# Seconds of the window of the recent matches
+RATE_WINDOW = 60.0
+
+class Ticket:
+    """
+    A player waiting in the queue.
+    """
+
+    __slots__ = ("player", "connection", "players", "queued_at")
+
+    def __init__(self, player: Player, connection: FramedConnection, players: int):
+        """
+        :param player: Player object
+        :param connection: connection to the client, notified of the match
+        :param players: Number of players of the game wanted
+        """
+        self.player: Player = player
+        self.connection: FramedConnection = connection
+        self.players: int = players
+        self.queued_at: float = time.monotonic()
+
+class Matchmaker:
+    """
+    Queues of the players waiting for a match, by number of players.
+    """
+
+    def __init__(self):
+        # Players waiting, in their order of arrival, by number of players wanted
+        self.queues: dict[int, dict[Player, Ticket]] = {players: dict()
+                                                        for players in range(MIN_PLAYERS, MAX_PLAYERS + 1)}
+
+        # Ticket of each player waiting
+        self.tickets: dict[Player, Ticket] = dict()
+        self.lock = threading.Lock()
+
+        # Players matched whose game is not made yet, and the condition notified when it is
+        self.matching: set[Player] = set()
+        self.matched = threading.Condition(self.lock)
+
+        # Counters of the metrics: matches made, seconds waited by the players matched, times of the recent matches
+        self.matches: int = 0
+        self.wait = Histogram(WAIT_BUCKETS)
+        self.recent: deque[float] = deque()
+
+    def __len__(self) -> int:
+        return len(self.tickets)
+
+    def join(self, player: Player, connection: FramedConnection, players: int) -> tuple[int | None, list[Ticket]]:
+        """
+        Put a player in the queue of a number of players, instead of the queue he was in, and make a match if the
+        queue is full. The caller makes the game of the players matched, then calls finish, until finish makes no
+        other match.
+        :param player: Player object
+        :param connection: connection to the client
+        :param players: Number of players of the game wanted, between MIN_PLAYERS and MAX_PLAYERS
+        :return: the number of players still waiting in the queue (None if the player is inside a game), and the
+        tickets of the players matched in their order of arrival (empty if the queue is not full)
+        """
+        with self.lock:
+            # A player matched meanwhile is inside a game once it is made
+            self._wait_match(player)
+            if player.game is not None:
+                return None, []
+
+            self._remove(player)
+            queue = self.queues[players]
+            queue[player] = self.tickets[player] = Ticket(player, connection, players)
+            matched = self._match(players)
+            return len(queue), matched
+
+    def _match(self, players: int) -> list[Ticket]:
+        # The players who waited the longest are matched, if the queue is full
+        queue = self.queues[players]
+        if len(queue) < players:
+            return []
+        matched = [queue.pop(waiting) for waiting in list(islice(queue, players))]
+        for ticket in matched:
+            del self.tickets[ticket.player]
+            self.matching.add(ticket.player)
+        return matched
+
+    def finish(self, tickets: list[Ticket], requeue: list[Ticket] = ()) -> list[Ticket]:
+        """
+        Release the players of a match once their game is made, or could not be made
+        :param tickets: Tickets returned by join or finish
+        :param requeue: Tickets of the match put back at the head of their queue, when the game could not be made with
+        every player: the other players of the match are dropped
+        :return: the tickets of a new match made with the players put back, empty if there is none
+        """
+        with self.lock:
+            self.matching.difference_update(ticket.player for ticket in tickets)
+            self.matched.notify_all()
+
+            if not requeue:
+                # Only the matches played count in the metrics
+                now = time.monotonic()
+                for ticket in tickets:
+                    self.wait.observe(now - ticket.queued_at)
+                self.matches += 1
+                self.recent.append(now)
+                self._forget_matches(now)
+                return []
+
+            # The players put back keep their place, before the ones who arrived after them
+            players = requeue[0].players
+            queue = {ticket.player: ticket for ticket in requeue}
+            queue.update(self.queues[players])
+            self.queues[players] = queue
+            for ticket in requeue:
+                self.tickets[ticket.player] = ticket
+            return self._match(players)
+
+    def leave(self, player: Player) -> bool:
+        """
+        Take a player out of the queue. If the player was just matched, waits until his game is made.
+        :param player: Player object
+        :return: False if the player was not waiting
+        """
+        with self.lock:
+            self._wait_match(player)
+            return self._remove(player)
+
+    def _wait_match(self, player: Player):
+        while player in self.matching:
+            self.matched.wait()
+
+    def _remove(self, player: Player) -> bool:
+        ticket = self.tickets.pop(player, None)
+        if ticket is None:
+            return False
+        del self.queues[ticket.players][player]
+        return True
+
+    def depth(self, players: int) -> int:
+        """
+        Count the players waiting for a number of players
+        :param players: Number of players of the game
+        :return: the number of players in the queue
+        """
+        return len(self.queues[players])
+
+    def recent_matches(self) -> int:
+        """
+        Count the matches made during the last RATE_WINDOW seconds
+        :return: the number of matches
+        """
+        with self.lock:
+            self._forget_matches(time.monotonic())
+            return len(self.recent)
+
+    def _forget_matches(self, now: float):
+        while self.recent and self.recent[0] < now - RATE_WINDOW:
+            self.recent.popleft()
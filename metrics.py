@@ -0,0 +1,227 @@
+"""
+Metrics of the server: counters, gauges and latency histograms.
+
+Recording a request costs two clock reads, a lock and a few integer additions. Everything else (percentiles,
+gauges computed from the state of the server, text export) is done only when the metrics are read.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+# Upper bounds in seconds of the buckets of the latency histograms: 10us to about 10s, doubling at each bucket
+LATENCY_BUCKETS = tuple(1e-5 * 2 ** i for i in range(21))
+
+# Percentiles given in the snapshots
+PERCENTILES = (50, 95, 99)
+
+# Prefix of the names of the exported metrics
+PREFIX = "tictactoe"
+
+class Histogram:
+    """
+    Define a histogram with fixed buckets. Percentiles are estimated with the upper bound of their bucket.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        :param buckets: Upper bounds of the buckets, sorted
+        """
+        self.buckets: tuple[float, ...] = buckets
+
+        # Number of values in each bucket, the last one counts the values above every bound
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float):
+        """
+        Add a value to the histogram
+        :param value: The value to add
+        :return: None
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, percentile: float) -> float:
+        """
+        Estimate a percentile of the values
+        :param percentile: Percentile between 0 and 100
+        :return: the upper bound of the bucket holding the percentile (the biggest bound if it is above every
+                 bound), 0 if there is no value
+        """
+        if self.count == 0:
+            return 0.0
+
+        rank = max(1, round(percentile / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+class OperationMetrics:
+    """
+    Define the metrics of a single operation of the API.
+    """
+
+    def __init__(self):
+        # Number of requests handled
+        self.count: int = 0
+
+        # Number of requests whose handler raised an exception
+        self.errors: int = 0
+
+        # Number of requests being handled
+        self.in_flight: int = 0
+
+        # Time spent handling the requests, in seconds
+        self.latency = Histogram()
+
+        # The requests of the threaded engine are recorded by several threads
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> dict:
+        """
+        Describe the metrics of the operation
+        :return: a dict with the counters, the mean latency and the percentiles, in microseconds
+        """
+        with self.lock:
+            response = {"count": self.count,
+                        "errors": self.errors,
+                        "in_flight": self.in_flight,
+                        "mean_us": round(self.latency.sum / self.latency.count * 1e6) if self.latency.count else 0}
+            for percentile in PERCENTILES:
+                response[f"p{percentile}_us"] = round(self.latency.percentile(percentile) * 1e6)
+        return response
+
+class Metrics:
+    """
+    Define every metric of the server.
+    The requests are recorded by operation of the API, and the gauges are functions called when the metrics are
+    read, so they cost nothing while the server is running.
+    """
+
+    def __init__(self, operations: list[str]):
+        """
+        :param operations: Names of the operations of the API, any other request is recorded as "unknown"
+        """
+        self.started: float = time.time()
+
+        # Metrics of each operation
+        self.operations: dict[str, OperationMetrics] = {operation: OperationMetrics()
+                                                        for operation in list(operations) + ["unknown"]}
+
+        # Functions giving the current value of each gauge, by name
+        self.gauges: dict[str, Callable[[], int]] = dict()
+
+    def add_gauge(self, name: str, read: Callable[[], int]):
+        """
+        Register a gauge
+        :param name: Name of the gauge
+        :param read: Function returning the current value of the gauge
+        :return: None
+        """
+        self.gauges[name] = read
+
+    def start_request(self, operation: str) -> tuple[OperationMetrics, float]:
+        """
+        Record the beginning of a request
+        :param operation: Name of the operation of the API
+        :return: a token to give to end_request
+        """
+        metrics = self.operations.get(operation)
+        if metrics is None:
+            metrics = self.operations["unknown"]
+        with metrics.lock:
+            metrics.in_flight += 1
+        return metrics, time.perf_counter()
+
+    def end_request(self, token: tuple[OperationMetrics, float], error: bool = False):
+        """
+        Record the end of a request
+        :param token: the value returned by start_request
+        :param error: True if the request raised an exception
+        :return: None
+        """
+        metrics, start = token
+        latency = time.perf_counter() - start
+        with metrics.lock:
+            metrics.in_flight -= 1
+            metrics.count += 1
+            if error:
+                metrics.errors += 1
+            metrics.latency.observe(latency)
+
+    def snapshot(self) -> dict:
+        """
+        Describe every metric
+        :return: a dict with the uptime, the gauges and the metrics of the operations that were requested
+        """
+        response = {"uptime": round(time.time() - self.started)}
+        for name, read in self.gauges.items():
+            response[name] = read()
+        response["requests"] = {operation: metrics.snapshot()
+                                for operation, metrics in self.operations.items() if metrics.count or metrics.in_flight}
+        return response
+
+    def export_text(self) -> str:
+        """
+        Export every metric in the Prometheus text format
+        :return: the text of the metrics
+        """
+        lines = [f"{PREFIX}_uptime_seconds {time.time() - self.started:.0f}"]
+        for name, read in self.gauges.items():
+            lines.append(f"{PREFIX}_{name} {read()}")
+
+        for operation, metrics in self.operations.items():
+            with metrics.lock:
+                count, errors, in_flight = metrics.count, metrics.errors, metrics.in_flight
+                buckets, total = list(metrics.latency.counts), metrics.latency.sum
+
+            label = f'operation="{operation}"'
+            lines.append(f"{PREFIX}_requests_total{{{label}}} {count}")
+            lines.append(f"{PREFIX}_request_errors_total{{{label}}} {errors}")
+            lines.append(f"{PREFIX}_requests_in_flight{{{label}}} {in_flight}")
+
+            cumulative = 0
+            for bound, bucket in zip(metrics.latency.buckets, buckets):
+                cumulative += bucket
+                lines.append(f'{PREFIX}_request_seconds_bucket{{{label},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{PREFIX}_request_seconds_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{PREFIX}_request_seconds_sum{{{label}}} {total:.6f}")
+            lines.append(f"{PREFIX}_request_seconds_count{{{label}}} {count}")
+
+        return "\n".join(lines) + "\n"
+
+def serve_metrics(metrics: Metrics, host: str, port: int) -> ThreadingHTTPServer:
+    """
+    Serve the metrics as plain text over HTTP, on a background thread
+    :param metrics: Metrics object to export
+    :param host: Address to listen on
+    :param port: Port to listen on
+    :return: the HTTP server
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.export_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # The scrapes are not logged
+            pass
+
+    http_server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    return http_server
@@ -0,0 +1,114 @@
+import random
+import threading
+
+class NameAllocationError(ValueError):
+    """
+    Raised when every name allowed has been given.
+    """
+
+class NameAllocator:
+    """
+    Give unique names to the players, in constant time.
+    The name of index n is the base name n % len(base_names), followed by n // len(base_names) + 1 from the second
+    round of base names on: Dragon, Unicorn, ..., Kraken, Dragon2, Unicorn2, ...
+    The free pool starts with the base names, and the names released go back to it. A name of the pool is chosen at
+    random before any new name is built, so the memory used is bounded by the highest number of players connected
+    at the same time.
+    Several allocators can share the indexes without giving the same name twice: the allocator with offset o and
+    stride s only uses the indexes o, o + s, o + 2s, ...
+    """
+
+    def __init__(self, base_names: list[str], offset: int = 0, stride: int = 1, limit: int | None = None,
+                 rng: random.Random | None = None):
+        """
+        :param base_names: Names given first, then with a numeric suffix
+        :param offset: First index used by this allocator
+        :param stride: Step between two indexes used by this allocator
+        :param limit: Maximum number of names given at the same time, None for no limit
+        :param rng: Random generator choosing the name given from the free pool
+        """
+        self.base_names: list[str] = list(base_names)
+        self.offset: int = offset
+        self.stride: int = stride
+        self.limit: int | None = limit
+        self.rng: random.Random = rng or random.Random()
+
+        # Names of the pool: the base names of this allocator, then the names released and not given again yet
+        self.free: list[str] = [self.name_of(index) for index in range(offset, len(self.base_names), stride)]
+
+        # Index of the next name never given, after the base names
+        self.next_index: int = offset + len(self.free) * stride
+
+        # Names given and not released yet
+        self.allocated: set[str] = set()
+
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.allocated)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.allocated
+
+    def name_of(self, index: int) -> str:
+        """
+        Build the name of an index
+        :param index: Index of the name
+        :return: the name
+        """
+        base, round_number = index % len(self.base_names), index // len(self.base_names)
+        if round_number == 0:
+            return self.base_names[base]
+        return f"{self.base_names[base]}{round_number + 1}"
+
+    def allocate(self) -> str:
+        """
+        Give a name that is not used by another player
+        :return: the name
+        """
+        with self.lock:
+            if self.limit is not None and len(self.allocated) >= self.limit:
+                raise NameAllocationError("All the names have already been given!")
+
+            if self.free:
+                # Take a random name of the pool: swap it with the last one, then pop it
+                index = self.rng.randrange(len(self.free))
+                self.free[index], self.free[-1] = self.free[-1], self.free[index]
+                name = self.free.pop()
+            else:
+                # The new names reserved for players restored after a restart are skipped
+                name = self.name_of(self.next_index)
+                self.next_index += self.stride
+                while name in self.allocated:
+                    name = self.name_of(self.next_index)
+                    self.next_index += self.stride
+
+            self.allocated.add(name)
+            return name
+
+    def reserve(self, name: str):
+        """
+        Mark a name as given without choosing it, for a player restored after a restart of the server
+        :param name: A name built by this allocator
+        :return: None
+        """
+        with self.lock:
+            if name in self.allocated:
+                return
+            self.allocated.add(name)
+
+            # Only done at startup: the pool is searched
+            if name in self.free:
+                self.free.remove(name)
+
+    def release(self, name: str):
+        """
+        Give back a name, so it can be given to another player
+        :param name: A name given by allocate
+        :return: None
+        """
+        with self.lock:
+            if name not in self.allocated:
+                return
+            self.allocated.remove(name)
+            self.free.append(name)
@@ -13,6 +13,9 @@ class Player:
         self.name: str = name
         self.game: str | None = None
 
+        # Secret given to the client to take back his place after a restart of the server, None without journal
+        self.token: str | None = None
+
     def join_game(self, game: str):
         """
         Add the name game to the game field
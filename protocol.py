@@ -0,0 +1,406 @@
+"""
+Framing of the messages exchanged between the clients and the server.
+
+Every message is preceded by a header of 8 bytes: the length of the payload and the id of the request,
+both as unsigned 32-bit big-endian integers. The server answers each request with a message carrying the
+same id, so a client can send several requests before reading the responses (pipelining), and a message
+is always read completely whatever its size.
+"""
+
+import asyncio
+import select
+import socket
+import struct
+import threading
+import time
+
+# Header of a message: (payload length, request id)
+HEADER = struct.Struct(">II")
+
+# Biggest payload accepted, to protect the server from corrupted headers
+MAX_PAYLOAD_SIZE = 16 * 1024 * 1024
+
+# Ids are encoded on 32 bits
+MAX_REQUEST_ID = 2 ** 32 - 1
+
+# Id of the messages pushed by the server without any request
+PUSH_ID = 0
+
+# Bytes pushed to a client and not sent yet above which push_nowait stops writing to it
+WRITE_BUFFER_LIMIT = 64 * 1024
+
+# Flag of a send that never blocks, None where the platform does not have it (Windows): the socket is then only
+# written when select finds it writable, SELECT_SEND_SIZE bytes at a time, less than the free space it then has
+SEND_NOWAIT = getattr(socket, "MSG_DONTWAIT", None)
+SELECT_SEND_SIZE = 4096
+
+class ProtocolError(ConnectionError):
+    """
+    Raised when a message does not respect the framing.
+    """
+
+def pack_frame(request_id: int, payload: bytes) -> bytes:
+    """
+    Build a complete message from a payload
+    :param request_id: id of the request
+    :param payload: content of the message
+    :return: bytes of the header followed by the payload
+    """
+    return HEADER.pack(len(payload), request_id) + payload
+
+def unpack_header(header: bytes) -> tuple[int, int]:
+    """
+    Read a message header
+    :param header: the first bytes of a message
+    :return: (payload length, request id)
+    """
+    length, request_id = HEADER.unpack(header)
+    if length > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"Message of {length} bytes exceeds the maximum size")
+    return length, request_id
+
+def recv_exactly(connection: socket.socket, size: int) -> bytes:
+    """
+    Receive exactly size bytes from a socket
+    :param connection: socket to read from
+    :param size: number of bytes to read
+    :return: the bytes read
+    """
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = connection.recv(size - len(buffer))
+        if not chunk:
+            raise ConnectionError("Connection closed by the peer")
+        buffer += chunk
+    return bytes(buffer)
+
+def recv_frame(connection: socket.socket) -> tuple[int, bytes]:
+    """
+    Receive a complete message from a socket (blocking call)
+    :param connection: socket to read from
+    :return: (request id, payload)
+    """
+    length, request_id = unpack_header(recv_exactly(connection, HEADER.size))
+    return request_id, recv_exactly(connection, length)
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    """
+    Read a complete message from an asyncio stream
+    :param reader: stream to read from
+    :return: (request id, payload)
+    """
+    try:
+        length, request_id = unpack_header(await reader.readexactly(HEADER.size))
+        return request_id, await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Connection closed by the peer")
+
+class FramedConnection:
+    """
+    Connection of the server to a client.
+    The process functions send their response with send(), which frames it with the id of the request being handled.
+    """
+
+    def __init__(self, write):
+        """
+        :param write: function writing bytes to the client (socket.sendall or StreamWriter.write)
+        """
+        self.write = write
+
+        # Id of the request being handled
+        self.request_id: int = 0
+
+        # Encoding of the responses, chosen by the client (see serialization.py)
+        self.encoding: str = "json"
+
+        # Names of the games whose events are pushed to this connection
+        self.subscriptions: set[str] = set()
+
+        # Names of the games watched by this connection as a spectator
+        self.watching: set[str] = set()
+
+        # time.monotonic of the last message received from the client, set by the handler of the connection
+        self.last_received: float = time.monotonic()
+
+        # Responses and pushed messages can be written by different threads
+        self.lock = threading.Lock()
+
+    def send(self, data: bytes) -> int:
+        """
+        Send the response to the request being handled
+        :param data: payload of the response
+        :return: the number of bytes of the payload
+        """
+        frame = pack_frame(self.request_id, data)
+        with self.lock:
+            self.write(frame)
+        return len(data)
+
+    def push(self, frame: bytes):
+        """
+        Write a message built once for every receiver with pack_frame(PUSH_ID, payload)
+        :param frame: complete message
+        :return: None
+        """
+        with self.lock:
+            self.write(frame)
+
+    def push_nowait(self, frame: bytes) -> bool:
+        """
+        Write pushed messages without waiting for the client to read them
+        :param frame: complete messages
+        :return: False if nothing was written because the client does not read fast enough
+        """
+        self.push(frame)
+        return True
+
+    def drain_nowait(self) -> bool:
+        """
+        Write the end of the messages of push_nowait kept for later, without waiting for the client to read them
+        :return: True if every message is written
+        """
+        return True
+
+    def abort(self):
+        """
+        Close the connection at once, from any thread: its handler stops reading and writing, and releases the player
+        :return: None
+        """
+
+class SocketConnection(FramedConnection):
+    """
+    Connection of the threaded server to a client, over a blocking socket.
+    push_nowait never blocks: the end of a message the socket cannot take at once is kept, and written before the
+    next message.
+    """
+
+    def __init__(self, connection: socket.socket):
+        """
+        :param connection: socket connected to the client
+        """
+        super().__init__(self._write)
+        self.socket: socket.socket = connection
+
+        # End of the messages of push_nowait not sent yet
+        self.outbox = bytearray()
+
+    def _write(self, data: bytes):
+        if self.outbox:
+            self.socket.sendall(self.outbox)
+            self.outbox.clear()
+        self.socket.sendall(data)
+
+    def _send_outbox(self) -> bool:
+        if SEND_NOWAIT is None:
+            return self._send_outbox_select()
+        try:
+            sent = self.socket.send(self.outbox, SEND_NOWAIT)
+        except (BlockingIOError, InterruptedError):
+            return False
+        del self.outbox[:sent]
+        return not self.outbox
+
+    def _send_outbox_select(self) -> bool:
+        while self.outbox:
+            _, writable, _ = select.select((), (self.socket,), (), 0)
+            if not writable:
+                return False
+            try:
+                sent = self.socket.send(self.outbox[:SELECT_SEND_SIZE])
+            except (BlockingIOError, InterruptedError):
+                return False
+            del self.outbox[:sent]
+        return True
+
+    def push_nowait(self, frame: bytes) -> bool:
+        # A response being written is not waited for either
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            if self.outbox and not self._send_outbox():
+                return False
+            self.outbox += frame
+            self._send_outbox()
+            return True
+        finally:
+            self.lock.release()
+
+    def drain_nowait(self) -> bool:
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            return not self.outbox or self._send_outbox()
+        finally:
+            self.lock.release()
+
+    def abort(self):
+        # The blocked recv and sendall of the handler fail at once, even when the client does not answer anymore
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+class StreamConnection(FramedConnection):
+    """
+    Connection of the asyncio server to a client.
+    push_nowait can be called from any thread: the messages are written by the event loop, and not scheduled while
+    the client has more than WRITE_BUFFER_LIMIT bytes to read.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, loop: asyncio.AbstractEventLoop):
+        """
+        :param writer: stream writing to the client
+        :param loop: event loop of the stream
+        """
+        super().__init__(writer.write)
+        self.transport: asyncio.WriteTransport = writer.transport
+        self.loop: asyncio.AbstractEventLoop = loop
+
+        # Bytes of the messages scheduled on the event loop and not written yet
+        self.scheduled: int = 0
+
+    def _write_scheduled(self, frame: bytes):
+        with self.lock:
+            self.scheduled -= len(frame)
+            self.write(frame)
+
+    def push_nowait(self, frame: bytes) -> bool:
+        if self.transport.is_closing():
+            raise ConnectionError("Connection closed by the client")
+        if not self.drain_nowait():
+            return False
+        with self.lock:
+            self.scheduled += len(frame)
+        self.loop.call_soon_threadsafe(self._write_scheduled, frame)
+        return True
+
+    def drain_nowait(self) -> bool:
+        return self.transport.get_write_buffer_size() + self.scheduled < WRITE_BUFFER_LIMIT
+
+    def abort(self):
+        # The data not written yet is dropped, so the client does not have to read it
+        self.loop.call_soon_threadsafe(self.transport.abort)
+
+class BufferedConnection(FramedConnection):
+    """
+    Connection keeping the responses in memory instead of writing them to a socket.
+    The server uses it to run a request forwarded by another of its workers, and to send the response back.
+    """
+
+    def __init__(self, encoding: str):
+        """
+        :param encoding: Encoding of the responses, chosen by the client
+        """
+        super().__init__(None)
+        self.encoding = encoding
+
+        # Payloads of the responses, in order
+        self.responses: list[bytes] = list()
+
+    def send(self, data: bytes) -> int:
+        self.responses.append(data)
+        return len(data)
+
+class FramedClient:
+    """
+    Blocking connection to the server, used by the workers of the server to talk to each other (the clients use
+    game_client.GameClient).
+    Each request gets a new id, and the responses are matched to their request by id.
+    A background thread reads every message, and the messages pushed by the server are given to on_push.
+    """
+
+    def __init__(self, connection: socket.socket, on_push=None):
+        """
+        :param connection: socket connected to the server
+        :param on_push: function called with the payload of every pushed message, from the reading thread
+        """
+        self.socket: socket.socket = connection
+        self.on_push = on_push
+
+        # Maximum time to wait for a response, taken from the socket
+        self.timeout: float | None = connection.gettimeout()
+
+        # The reading thread waits for messages without timeout
+        connection.settimeout(None)
+
+        # Id of the last request sent
+        self.last_id: int = 0
+
+        # Responses received and not yet collected
+        self.responses: dict[int, bytes] = dict()
+
+        # Set when the connection is closed
+        self.closed: bool = False
+
+        self.send_lock = threading.Lock()
+        self.received = threading.Condition()
+
+        self.reader = threading.Thread(target=self._read_messages, daemon=True)
+        self.reader.start()
+
+    def _next_id(self) -> int:
+        self.last_id = self.last_id % MAX_REQUEST_ID + 1
+        return self.last_id
+
+    def _read_messages(self):
+        try:
+            while True:
+                request_id, payload = recv_frame(self.socket)
+
+                if request_id == PUSH_ID:
+                    if self.on_push is not None:
+                        self.on_push(payload)
+                    continue
+
+                with self.received:
+                    self.responses[request_id] = payload
+                    self.received.notify_all()
+
+        except OSError:
+            pass
+
+        with self.received:
+            self.closed = True
+            self.received.notify_all()
+
+    def _wait_response(self, request_id: int) -> bytes:
+        with self.received:
+            if not self.received.wait_for(lambda: request_id in self.responses or self.closed, self.timeout):
+                raise TimeoutError(f"No response to the request {request_id}")
+            if request_id not in self.responses:
+                raise ConnectionError("Connection closed by the server")
+            return self.responses.pop(request_id)
+
+    def request(self, msg: str, encoding: str = 'utf-8') -> bytes:
+        """
+        Send a request and wait for its response
+        :param msg: request to send
+        :param encoding: encoding of the request
+        :return: payload of the response
+        """
+        return self.pipeline([msg], encoding)[0]
+
+    def pipeline(self, messages: list[str], encoding: str = 'utf-8') -> list[bytes]:
+        """
+        Send several requests at once, then wait for all the responses
+        :param messages: requests to send
+        :param encoding: encoding of the requests
+        :return: payloads of the responses, in the order of the requests
+        """
+        with self.send_lock:
+            ids = [self._next_id() for _ in messages]
+            self.socket.sendall(b"".join(pack_frame(request_id, msg.encode(encoding))
+                                         for request_id, msg in zip(ids, messages)))
+        return [self._wait_response(request_id) for request_id in ids]
+
+    def close(self):
+        """
+        Close the connection to the server
+        :return: None
+        """
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+
@@ -0,0 +1,127 @@
+"""
+Pushes of the changes of the games to their subscribers.
+
+The observers of the games run while the lock of the game is held, so they never write to a socket: they only copy
+the message and the list of its receivers into a queue. A publisher thread builds each message once per encoding,
+then writes it to every receiver without blocking (FramedConnection.push_nowait): a client that stops reading never
+stalls the players of its games.
+The messages a receiver cannot take at once wait in its own queue, in order, and are written as soon as it reads
+again. A receiver with more than QUEUE_SIZE messages waiting is dropped: its messages are discarded and on_drop is
+called to unsubscribe it.
+"""
+
+import logging
+import queue
+import threading
+from typing import Callable
+
+from protocol import PUSH_ID, FramedConnection, pack_frame
+from serialization import encode
+
+# Messages waiting for a receiver before it is dropped
+QUEUE_SIZE = 256
+
+# Seconds between two attempts to write to the receivers that do not read fast enough
+RETRY_INTERVAL = 0.05
+
+class Publisher:
+    """
+    Queue of the messages pushed to the clients, and the thread writing them.
+    """
+
+    def __init__(self, on_drop: Callable[[FramedConnection], None], queue_size: int = QUEUE_SIZE):
+        """
+        :param on_drop: Function called from the publisher thread with a connection that does not read its messages
+        :param queue_size: Messages waiting for a receiver before it is dropped
+        """
+        self.on_drop = on_drop
+        self.queue_size: int = queue_size
+
+        # Messages to push, with their receivers
+        self.messages: queue.SimpleQueue = queue.SimpleQueue()
+
+        # Owned by the publisher thread: messages not written yet, by connection
+        self.waiting: dict[FramedConnection, list[bytes]] = dict()
+
+        # Counters of the metrics
+        self.pushed: int = 0
+        self.dropped: int = 0
+
+        threading.Thread(target=self._publish_loop, name="publisher", daemon=True).start()
+
+    def __len__(self) -> int:
+        return len(self.waiting)
+
+    def publish(self, connections: list[FramedConnection], response: dict):
+        """
+        Queue a message for several connections, without waiting for it to be written. The response must not be
+        changed afterwards.
+        :param connections: connections to push the message to
+        :param response: dict describing the message
+        :return: None
+        """
+        if connections:
+            self.messages.put((connections, response))
+
+    # The following methods run on the publisher thread
+
+    def _publish_loop(self):
+        while True:
+            try:
+                message = self.messages.get(timeout=RETRY_INTERVAL if self.waiting else None)
+                while True:
+                    self._push(*message)
+                    message = self.messages.get_nowait()
+            except queue.Empty:
+                pass
+            except Exception:
+                logging.exception("Cannot push a message")
+
+            try:
+                self._write_waiting()
+            except Exception:
+                logging.exception("Cannot push the messages waiting")
+
+    def _push(self, connections: list[FramedConnection], response: dict):
+        # Message of each encoding, built for the first receiver using it
+        frames: dict[str, bytes] = dict()
+
+        for connection in connections:
+            frame = frames.get(connection.encoding)
+            if frame is None:
+                frame = frames[connection.encoding] = pack_frame(PUSH_ID, encode(response, connection.encoding))
+
+            # The messages of a connection are written in order
+            waiting = self.waiting.get(connection)
+            if waiting is not None:
+                waiting.append(frame)
+                if len(waiting) > self.queue_size:
+                    self._drop(connection)
+                continue
+
+            try:
+                if connection.push_nowait(frame):
+                    self.pushed += 1
+                else:
+                    self.waiting[connection] = [frame]
+            except OSError:
+                # The connection is closed, it is released by its own handler
+                pass
+
+    def _write_waiting(self):
+        for connection, frames in list(self.waiting.items()):
+            try:
+                if not connection.push_nowait(b"".join(frames)):
+                    continue
+                self.pushed += len(frames)
+            except OSError:
+                pass
+            del self.waiting[connection]
+
+    def _drop(self, connection: FramedConnection):
+        del self.waiting[connection]
+        self.dropped += 1
+        try:
+            self.on_drop(connection)
+        except Exception:
+            logging.exception("Cannot drop a connection")
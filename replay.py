@@ -0,0 +1,141 @@
+"""
+Offline tool to list, export and replay the games of an archive written by the server with --archive-dir.
+
+The archive is read one game and a few hundred moves at a time, so it works on archives of any size:
+    python replay.py archive list --last 20
+    python replay.py archive export 42 > game42.jsonl
+    python replay.py archive export --all > games.jsonl
+    python replay.py archive replay 42 --speed 4
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from collections import deque
+
+from archive import ARCHIVE_NAME, iter_games, iter_moves, read_moves
+
+def find_game(path: str, game_id: int) -> dict | None:
+    """
+    Read the description of a game, reading the headers of the games before it
+    :param path: Path of the archive file
+    :param game_id: Number of the game
+    :return: the description of the game, or None if there is no such game
+    """
+    for number, _, header in iter_games(path):
+        if number == game_id:
+            header["id"] = number
+            return header
+    return None
+
+def describe(header: dict) -> str:
+    """
+    Describe a game on one line
+    :param header: Description of the game
+    :return: the line
+    """
+    started = datetime.datetime.fromtimestamp(header["started_at"]).strftime("%Y-%m-%d %H:%M:%S")
+    winner = header["players"][header["winner"] - 1] if header["winner"] else "nobody"
+    return (f"{header['id']:>8}  {started}  {header['name']:<16} {header['size']}x{header['size']:<3} "
+            f"{header['moves']:>4} moves  winner: {winner:<12} players: {', '.join(header['players'])}")
+
+def export_game(file, header: dict, output):
+    """
+    Write a game as JSON lines: its description, then one line per move
+    :param file: archive file opened in binary mode
+    :param header: Description of the game
+    :param output: text file written
+    :return: None
+    """
+    description = {key: header[key] for key in ("name", "players", "size", "win_length", "winner", "moves",
+                                                 "started_at")}
+    output.write(json.dumps(dict(description, id=header["id"])) + "\n")
+    for symbol, x, y, elapsed in read_moves(file, header):
+        output.write(json.dumps({"symbol": symbol, "x": x, "y": y, "ms": elapsed}) + "\n")
+
+def replay_game(path: str, header: dict, speed: float):
+    """
+    Print the board after each move of a game, waiting the time taken by the player divided by the speed
+    :param path: Path of the archive file
+    :param header: Description of the game
+    :param speed: Speed of the replay, 0 to print every move at once
+    :return: None
+    """
+    size = header["size"]
+    board = [[0] * size for _ in range(size)]
+    print(describe(header))
+
+    for number, (symbol, x, y, elapsed) in enumerate(iter_moves(path, header), 1):
+        if speed > 0:
+            time.sleep(elapsed / 1000 / speed)
+        board[x][y] = symbol
+        print(f"\nMove {number}: {header['players'][symbol - 1]} ({symbol}) plays ({x}, {y}) after {elapsed}ms")
+        for row in board:
+            print(" ".join(str(cell) if cell else "." for cell in row))
+
+def main():
+    parser = argparse.ArgumentParser(description="List, export and replay the games of an archive")
+    parser.add_argument("directory", help="directory given to the server with --archive-dir")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="describe the games, one per line")
+    list_parser.add_argument("--last", type=int, help="only describe the last games")
+
+    export_parser = commands.add_parser("export", help="write games as JSON lines")
+    export_parser.add_argument("game", type=int, nargs="?", help="number of the game")
+    export_parser.add_argument("--all", action="store_true", help="export every game")
+
+    replay_parser = commands.add_parser("replay", help="print the board after each move of a game")
+    replay_parser.add_argument("game", type=int, help="number of the game")
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="speed of the replay (2 is twice as fast), 0 to print every move at once")
+
+    commands.add_parser("stats", help="count the games and the moves")
+    args = parser.parse_args()
+
+    path = os.path.join(args.directory, ARCHIVE_NAME)
+    if not os.path.exists(path):
+        parser.error(f"There is no archive in {args.directory}")
+
+    if args.command == "list":
+        # Only the last descriptions are kept in memory
+        headers = deque(maxlen=args.last)
+        for number, _, header in iter_games(path):
+            header["id"] = number
+            if args.last is None:
+                print(describe(header))
+            else:
+                headers.append(header)
+        for header in headers:
+            print(describe(header))
+
+    elif args.command == "export":
+        with open(path, "rb") as file:
+            if args.all:
+                for number, _, header in iter_games(path):
+                    header["id"] = number
+                    export_game(file, header, sys.stdout)
+            else:
+                header = find_game(path, args.game) if args.game is not None else None
+                if header is None:
+                    parser.error("Give the number of a game of the archive, or --all")
+                export_game(file, header, sys.stdout)
+
+    elif args.command == "replay":
+        header = find_game(path, args.game)
+        if header is None:
+            parser.error(f"There is no game {args.game} in the archive")
+        replay_game(path, header, args.speed)
+
+    elif args.command == "stats":
+        games = moves = 0
+        for _, _, header in iter_games(path):
+            games += 1
+            moves += header["moves"]
+        size = os.path.getsize(path)
+        print(f"{games} games, {moves} moves, {size} bytes ({size / max(games, 1):.1f} bytes per game)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Cache of the encoded responses describing a state, by version of the state.
+
+Many clients poll the same state between two changes: GET_SERVER between two moves of a game, GET_SERVERS_LIST between
+two changes of the list of games. The response is built and encoded once per version of the state, arguments of the
+request and encoding, then the same bytes are sent to every client asking for it, so the serialization work follows
+the rate of the changes instead of the rate of the requests.
+
+The version of a state only increases (Game.seq, GameRegistry.version): storing a response of a newer version drops
+the responses of the older one, and a response of an older version is never stored.
+"""
+
+import threading
+
+# Responses kept for a single version, the arguments of the requests are chosen by the clients
+MAX_ENTRIES = 256
+
+class ResponseCache:
+    """
+    Encoded responses of the latest version of a state.
+    get can be called from any thread without lock, put takes the lock of the cache.
+    """
+
+    __slots__ = ("version", "entries", "max_entries", "lock")
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        """
+        :param max_entries: Responses kept for a single version
+        """
+        # Version of the responses cached, None before the first one
+        self.version: int | None = None
+
+        # Payloads of the responses, by (version, key)
+        self.entries: dict[tuple, bytes] = dict()
+
+        self.max_entries: int = max_entries
+        self.lock = threading.Lock()
+
+    def get(self, version: int, key: tuple) -> bytes | None:
+        """
+        Get a response
+        :param version: Version of the state
+        :param key: Arguments of the request and encoding of the response
+        :return: the payload, None if it is not cached
+        """
+        return self.entries.get((version, key))
+
+    def put(self, version: int, key: tuple, payload: bytes):
+        """
+        Store a response
+        :param version: Version of the state described by the response
+        :param key: Arguments of the request and encoding of the response
+        :param payload: Encoded response
+        :return: None
+        """
+        with self.lock:
+            if version != self.version:
+                # The state described is not the latest one anymore
+                if self.version is not None and version < self.version:
+                    return
+                self.entries = dict()
+                self.version = version
+
+            if len(self.entries) < self.max_entries:
+                self.entries[(version, key)] = payload
+
+class CacheStats:
+    """
+    Hits and misses of a kind of cached responses, for the metrics.
+    """
+
+    def __init__(self):
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lock = threading.Lock()
+
+    def record(self, hit: bool):
+        """
+        Count a response sent
+        :param hit: True if the response came from the cache
+        :return: None
+        """
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
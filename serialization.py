@@ -0,0 +1,247 @@
+"""
+Encoding of the responses of the server.
+
+Two encodings are available, chosen by the client with GET_MY_NAME:
+- "json": the response dict as JSON text.
+- "binary": a struct-packed header (magic byte and status code) followed by the other fields as tagged values.
+  Known keys take a single byte, and a board (a matrix of small ints) is packed as one byte per cell.
+"""
+
+import json
+import struct
+
+JSON = "json"
+BINARY = "binary"
+
+# Encodings supported by the server, the preferred one first
+ENCODINGS = (BINARY, JSON)
+
+FORMAT = 'utf-8'
+
+# First byte of a binary message
+MAGIC = 0xB7
+
+# Header of a binary message: (magic byte, status code)
+HEADER = struct.Struct(">BB")
+
+# Codes of the statuses, the last code is used when there is no status
+STATUSES = ("success", "failed", "error", "reset")
+NO_STATUS = 255
+
+# Keys of the responses encoded on a single byte. New keys must be added at the end.
+KEYS = ("name", "board", "has_started", "current_player", "players", "winner", "message", "msg", "event",
+        "version", "page", "limit", "total", "games", "since", "added", "updated", "removed", "encoding",
+        "encodings", "size", "win_length", "update", "seq", "moves", "token", "game", "bot", "waiting", "id",
+        "started_at", "first", "history", "uptime", "requests", "count", "errors", "in_flight", "mean_us", "p50_us",
+        "p95_us", "p99_us")
+KEY_CODES = {key: code for code, key in enumerate(KEYS, start=1)}
+
+# Tags of the values
+NONE, TRUE, FALSE, SMALL_INT, INT, BIG_INT, STR, LIST, DICT, BOARD = b"NTFuiqsldb"
+
+INT_32 = struct.Struct(">i")
+INT_64 = struct.Struct(">q")
+UINT_32 = struct.Struct(">I")
+
+# Number of rows and columns of a packed board
+BOARD_SIZE = struct.Struct(">BB")
+
+# A length under this value takes one byte, else it is this byte followed by the length on 4 bytes
+LONG_LENGTH = 255
+
+class EncodingError(ValueError):
+    """
+    Raised when a message cannot be encoded or decoded.
+    """
+
+def encode(response: dict, encoding: str) -> bytes:
+    """
+    Encode a response
+    :param response: dict describing the response
+    :param encoding: JSON or BINARY
+    :return: the payload of the message
+    """
+    if encoding == JSON:
+        return json.dumps(response).encode(FORMAT)
+    if encoding == BINARY:
+        return encode_binary(response)
+    raise EncodingError(f"Unknown encoding {encoding}")
+
+def decode(payload: bytes, encoding: str) -> dict:
+    """
+    Decode a response
+    :param payload: the payload of the message
+    :param encoding: JSON or BINARY
+    :return: dict describing the response
+    """
+    if encoding == JSON:
+        return json.loads(payload.decode(FORMAT))
+    if encoding == BINARY:
+        return decode_binary(payload)
+    raise EncodingError(f"Unknown encoding {encoding}")
+
+def encode_binary(response: dict) -> bytes:
+    """
+    Encode a response with the binary encoding
+    :param response: dict describing the response
+    :return: the payload of the message
+    """
+    status = response.get("status")
+    if status in STATUSES:
+        status_code = STATUSES.index(status)
+        fields = {key: value for key, value in response.items() if key != "status"}
+    else:
+        status_code = NO_STATUS
+        fields = response
+
+    buffer = bytearray(HEADER.pack(MAGIC, status_code))
+    _encode_value(fields, buffer)
+    return bytes(buffer)
+
+def decode_binary(payload: bytes) -> dict:
+    """
+    Decode a response encoded with the binary encoding
+    :param payload: the payload of the message
+    :return: dict describing the response
+    """
+    magic, status_code = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise EncodingError("Not a binary message")
+
+    fields, offset = _decode_value(payload, HEADER.size)
+
+    if status_code == NO_STATUS:
+        return fields
+    response = {"status": STATUSES[status_code]}
+    response.update(fields)
+    return response
+
+def _encode_length(length: int, buffer: bytearray):
+    if length < LONG_LENGTH:
+        buffer.append(length)
+    else:
+        buffer.append(LONG_LENGTH)
+        buffer += UINT_32.pack(length)
+
+def _encode_str(value: str, buffer: bytearray):
+    data = value.encode(FORMAT)
+    _encode_length(len(data), buffer)
+    buffer += data
+
+def _encode_board(value: list, buffer: bytearray) -> bool:
+    """
+    Pack a matrix of ints between 0 and 255 as one byte per cell
+    :return: False if the value is not such a matrix
+    """
+    if not value or not isinstance(value[0], list):
+        return False
+
+    columns = len(value[0])
+    if len(value) > 255 or columns > 255 or any(not isinstance(row, list) or len(row) != columns for row in value):
+        return False
+
+    try:
+        cells = bytes(cell for row in value for cell in row)
+    except (TypeError, ValueError):
+        return False
+
+    buffer.append(BOARD)
+    buffer += BOARD_SIZE.pack(len(value), columns)
+    buffer += cells
+    return True
+
+def _encode_value(value, buffer: bytearray):
+    if value is None:
+        buffer.append(NONE)
+    elif value is True:
+        buffer.append(TRUE)
+    elif value is False:
+        buffer.append(FALSE)
+    elif isinstance(value, int):
+        if 0 <= value < 256:
+            buffer.append(SMALL_INT)
+            buffer.append(value)
+        elif -2 ** 31 <= value < 2 ** 31:
+            buffer.append(INT)
+            buffer += INT_32.pack(value)
+        else:
+            buffer.append(BIG_INT)
+            buffer += INT_64.pack(value)
+    elif isinstance(value, str):
+        buffer.append(STR)
+        _encode_str(value, buffer)
+    elif isinstance(value, (list, tuple)):
+        if isinstance(value, list) and _encode_board(value, buffer):
+            return
+        buffer.append(LIST)
+        _encode_length(len(value), buffer)
+        for item in value:
+            _encode_value(item, buffer)
+    elif isinstance(value, dict):
+        buffer.append(DICT)
+        _encode_length(len(value), buffer)
+        for key, item in value.items():
+            code = KEY_CODES.get(key)
+            if code is None:
+                buffer.append(0)
+                _encode_str(key, buffer)
+            else:
+                buffer.append(code)
+            _encode_value(item, buffer)
+    else:
+        raise EncodingError(f"Cannot encode {type(value).__name__}")
+
+def _decode_length(payload: bytes, offset: int) -> tuple[int, int]:
+    length = payload[offset]
+    if length < LONG_LENGTH:
+        return length, offset + 1
+    return UINT_32.unpack_from(payload, offset + 1)[0], offset + 1 + UINT_32.size
+
+def _decode_str(payload: bytes, offset: int) -> tuple[str, int]:
+    length, offset = _decode_length(payload, offset)
+    return payload[offset:offset + length].decode(FORMAT), offset + length
+
+def _decode_value(payload: bytes, offset: int):
+    tag = payload[offset]
+    offset += 1
+
+    if tag == NONE:
+        return None, offset
+    if tag == TRUE:
+        return True, offset
+    if tag == FALSE:
+        return False, offset
+    if tag == SMALL_INT:
+        return payload[offset], offset + 1
+    if tag == INT:
+        return INT_32.unpack_from(payload, offset)[0], offset + INT_32.size
+    if tag == BIG_INT:
+        return INT_64.unpack_from(payload, offset)[0], offset + INT_64.size
+    if tag == STR:
+        return _decode_str(payload, offset)
+    if tag == BOARD:
+        rows, columns = BOARD_SIZE.unpack_from(payload, offset)
+        offset += BOARD_SIZE.size
+        board = [list(payload[offset + row * columns:offset + (row + 1) * columns]) for row in range(rows)]
+        return board, offset + rows * columns
+    if tag == LIST:
+        length, offset = _decode_length(payload, offset)
+        items = list()
+        for _ in range(length):
+            item, offset = _decode_value(payload, offset)
+            items.append(item)
+        return items, offset
+    if tag == DICT:
+        length, offset = _decode_length(payload, offset)
+        fields = dict()
+        for _ in range(length):
+            code = payload[offset]
+            offset += 1
+            if code == 0:
+                key, offset = _decode_str(payload, offset)
+            else:
+                key = KEYS[code - 1]
+            fields[key], offset = _decode_value(payload, offset)
+        return fields, offset
+
+    raise EncodingError(f"Unknown tag {tag}")
@@ -1,12 +1,35 @@
+import argparse
+import asyncio
+import hmac
+import itertools
+import multiprocessing
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+import signal
 import socket
+import sys
 import threading
-import json
-import random
+import time
 import logging
 
-from game import Game, get_game_object
+from bot import Bot, BotManager
+from game import MAX_BOARD_SIZE, MAX_SYMBOLS, MIN_BOARD_SIZE, MIN_WIN_LENGTH, MOVE_LOG_SIZE, WIN_LENGTH, Game
+from game_registry import GameRegistry
+from journal import SEGMENT_RECORDS, SYNC_INTERVAL, Journal
 from player import Player
+from response_cache import CacheStats, ResponseCache
 from api_client import ClientAPI
+from archive import Archive
+from connection_manager import HEARTBEAT_INTERVAL, IDLE_TIMEOUT, ConnectionManager
+from matchmaking import MAX_PLAYERS, MIN_PLAYERS, Matchmaker, Ticket
+from metrics import Metrics, serve_metrics
+from name_allocator import NameAllocationError, NameAllocator
+from protocol import BufferedConnection, FramedConnection, SocketConnection, StreamConnection, recv_frame, read_frame
+from publisher import QUEUE_SIZE as SUBSCRIBER_QUEUE_SIZE, Publisher
+from serialization import ENCODINGS, JSON, decode, encode
+from shard import CHANGES, FORWARD, HELLO, LIST, VERSION_SEPARATOR, Shard
+from spectators import DROP_TIMEOUT, QUEUE_SIZE, Spectators
 
 logging.basicConfig(
     level=logging.INFO,  # Set the minimum logging level
@@ -20,7 +43,33 @@ PORT = 5000
 FORMAT = 'utf-8'
 ADDR = (HOST, PORT)
 
-games_list = list()
+# Available implementations of the connection handling
+ENGINES = ("threaded", "asyncio")
+
+# Number of servers in a page of the list of servers, by default and at most
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Number of moves of an archived game sent at most in a response
+MAX_REPLAY_MOVES = 1000
+
+# Requests about the game named by their first argument, run by the worker owning the game
+GAME_REQUESTS = (ClientAPI.NEW_SERVER, ClientAPI.GET_SERVER, ClientAPI.JOIN_SERVER, ClientAPI.MAKE_MOVE,
+                 ClientAPI.START_GAME, ClientAPI.ADD_BOT)
+
+# Games hosted by the server
+games = GameRegistry()
+
+# Connections receiving the events of each game, by name of the game
+subscribers: dict[str, set[FramedConnection]] = dict()
+subscribers_lock = threading.Lock()
+
+# Place of this process among the workers of the server, None when the server runs in a single process
+shard: Shard | None = None
+
+# Players connected to another worker and inside the games of this worker, by name
+remote_players: dict[str, Player] = dict()
+remote_players_lock = threading.Lock()
 
 # When a user connects to the server, a name from this list is assigned to him (he cannot choose his name)
 animal_names = [
@@ -29,23 +78,61 @@ animal_names = [
     "Vampire", "Demon", "Angel", "Kraken"
 ]
 
-# Set to track picked names
-picked_names = set()
+# Names given to the connected players: the animal names, then the animal names followed by a number
+names = NameAllocator(animal_names)
 
-def get_random_animal() -> str:
-    """
-    Selects a random animal name that hasn't been picked yet
-    :return: String of a random animal
-    """
-    global picked_names
-    if len(picked_names) >= len(animal_names):
-        raise ValueError("All animal names have already been picked!")
+# Computer players added to the games, named like the players
+bots = BotManager(games, names)
+
+# Journal of the changes of the games, None when the games are not kept after a restart
+journal: Journal | None = None
+
+# Archive of the games played, None when the games are not archived
+archive: Archive | None = None
+
+# Spectators of the games and their broadcaster, started by main
+spectators: Spectators | None = None
+
+# Thread pushing the changes of the games to their subscribers without blocking, started by main
+publisher: Publisher | None = None
 
-    # Get a random name that hasn't been picked yet
-    remaining_names = set(animal_names) - picked_names
-    chosen_name: str = random.choice(list(remaining_names))
-    picked_names.add(chosen_name)
-    return chosen_name
+# Players waiting for a QUICK_MATCH, started by main
+matchmaker: Matchmaker | None = None
+
+# Numbers of the names of the games made by the matchmaker
+match_numbers = itertools.count(1)
+
+# Heartbeats and idle timeouts of the client connections, None when --idle-timeout is 0
+connection_manager: ConnectionManager | None = None
+
+# Encoded responses are reused until the state they describe changes, unless --no-response-cache is given
+cache_responses: bool = True
+game_cache_stats = CacheStats()
+list_cache_stats = CacheStats()
+
+# Encoded pages of the list of games and changes of the list, by version of the registry
+servers_list_cache = ResponseCache()
+
+# Players rebuilt from the journal whose client has not taken back his place yet, by name
+detached: dict[str, Player] = dict()
+detached_lock = threading.Lock()
+
+# Seconds after the startup before the players rebuilt from the journal who did not come back leave their games
+RESUME_TIMEOUT = 60.0
+
+# Counters, gauges and latency histograms of the requests, by operation of the API
+metrics = Metrics([value for key, value in vars(ClientAPI).items() if key.isupper()])
+metrics.add_gauge("connections", lambda: len(names) - len(bots) - len(detached))
+metrics.add_gauge("bots", lambda: len(bots))
+metrics.add_gauge("threads", threading.active_count)
+metrics.add_gauge("games", lambda: len(games))
+metrics.add_gauge("started_games", lambda: len(games.started_games))
+metrics.add_gauge("players", lambda: len(games.games_by_player))
+metrics.add_gauge("subscriptions", lambda: sum(len(connections) for connections in list(subscribers.values())))
+metrics.add_gauge("game_cache_hits", lambda: game_cache_stats.hits)
+metrics.add_gauge("game_cache_misses", lambda: game_cache_stats.misses)
+metrics.add_gauge("list_cache_hits", lambda: list_cache_stats.hits)
+metrics.add_gauge("list_cache_misses", lambda: list_cache_stats.misses)
 
 def handle_client(connection: socket.socket, address: tuple[str, int]):
     """
@@ -57,271 +144,1343 @@ def handle_client(connection: socket.socket, address: tuple[str, int]):
 
     # Set up the new player
     try:
-        player = Player(address, get_random_animal())
-    except ValueError as error:
+        player = Player(address, names.allocate())
+    except NameAllocationError as error:
         logging.error(error)
+        connection.close()
         return
 
     logging.info(f'New connection: {player.name}')
 
-    while True:
+    framed_connection = SocketConnection(connection)
+    if connection_manager is not None:
+        connection_manager.register(framed_connection)
+
+    # The player is released whatever stops the connection, even an error of a handler
+    try:
+        while True:
+
+            try:
+                # Get a request from the client
+                framed_connection.request_id, msg = recv_frame(connection)
+            except (ConnectionRefusedError, TimeoutError, OSError):
+                break
+            framed_connection.last_received = time.monotonic()
+
+            try:
+                keep_connection = dispatch_request(framed_connection, player, msg.decode(FORMAT))
+            except OSError:
+                # The response cannot be written, the connection was closed or aborted
+                break
+
+            if not keep_connection:
+                break
+    finally:
+        if connection_manager is not None:
+            connection_manager.unregister(framed_connection)
+        connection.close()
+        release_player(player, framed_connection)
+
+async def handle_client_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Handles a single client connection on the asyncio event loop.
+    :param reader: stream reading the requests of the client
+    :param writer: stream writing the responses to the client
+    :return: None
+    """
+    address = writer.get_extra_info('peername')
 
+    # Set up the new player
+    try:
+        player = Player(address, names.allocate())
+    except NameAllocationError as error:
+        logging.error(error)
+        writer.close()
+        return
+
+    logging.info(f'New connection: {player.name}')
+
+    connection = StreamConnection(writer, asyncio.get_running_loop())
+    if connection_manager is not None:
+        connection_manager.register(connection)
+
+    # The player is released whatever stops the connection, even an error of a handler
+    try:
+        while True:
+
+            try:
+                # Get a request from the client
+                connection.request_id, msg = await read_frame(reader)
+            except (ConnectionRefusedError, TimeoutError, OSError):
+                break
+            connection.last_received = time.monotonic()
+
+            keep_connection = dispatch_request(connection, player, msg.decode(FORMAT))
+
+            try:
+                # Wait until the response is flushed to the socket
+                await writer.drain()
+            except OSError:
+                break
+
+            if not keep_connection:
+                break
+    finally:
+        if connection_manager is not None:
+            connection_manager.unregister(connection)
+        writer.close()
+        release_player(player, connection)
+
+def release_player(player: Player, connection: FramedConnection):
+    """
+    Frees everything held by a disconnected player
+    :param player: Player object
+    :param connection: connection to the client
+    :return: None
+    """
+    # Each step runs even if the previous one failed, so nothing is left behind
+    try:
         try:
-            # Get a request from the client
-            msg = connection.recv(1024).decode(FORMAT)
-        except (ConnectionRefusedError, TimeoutError, OSError):
-            break
+            # Waits for a match being made with the player, so its game is left below
+            matchmaker.leave(player)
+
+            # Stop pushing events to the closed connection
+            for server_name in list(connection.subscriptions):
+                unsubscribe(connection, server_name)
+            for server_name in list(connection.watching):
+                spectators.remove(connection, server_name)
+        finally:
+            # If the player is inside a game, exclude him from it (the game is removed if it is left empty)
+            if shard is not None and player.game is not None and not shard.is_local(player.game):
+                try:
+                    shard.forward(shard.owner(player.game), player.name, JSON, ClientAPI.EXIT_SERVER)
+                except OSError:
+                    pass
+            games.remove_player(player)
+    finally:
+        # Free the name of the player
+        names.release(player.name)
+
+def dispatch_request(connection: FramedConnection, player: Player, msg: str) -> bool:
+    """
+    Calls the handler corresponding to a single request of the client.
+    :param connection: connection to the client, used to send the response
+    :param player: Player object
+    :param msg: request received from the client
+    :return: False if the client must be disconnected, True otherwise
+    """
+
+    # Split the string according to the separator '/'
+    msg = msg.split('/')
 
-        # Split the string according to the separator '/'
-        msg = msg.split('/')
+    logging.info(f'Received {msg[0]} from {player.name} ')
 
-        logging.info(f'Received {msg[0]} from {player.name} ')
+    token = metrics.start_request(msg[0])
+    try:
+        keep_connection = route_request(connection, player, msg)
+    except Exception:
+        metrics.end_request(token, error=True)
+        raise
+    metrics.end_request(token)
 
-        if msg[0] == ClientAPI.GET_MY_NAME:
-            process_get_my_name(connection, player=player)
+    return keep_connection
 
-        elif msg[0] == ClientAPI.NEW_SERVER:
-            process_new_server(connection, server_name=msg[1], player=player)
+def route_request(connection: FramedConnection, player: Player, msg: list[str]) -> bool:
+    """
+    Calls the handler of a request
+    :param connection: connection to the client, used to send the response
+    :param player: Player object
+    :param msg: request received from the client, split on '/'
+    :return: False if the client must be disconnected, True otherwise
+    """
+    # The requests about the games of another worker are forwarded to it
+    if shard is not None and route_to_shard(connection, player, msg):
+        return True
 
-        elif msg[0] == ClientAPI.GET_SERVERS_LIST:
-            process_get_servers_list(connection)
+    if msg[0] == ClientAPI.GET_MY_NAME:
+        process_get_my_name(connection, player=player, encodings=msg[1:])
 
-        elif msg[0] == ClientAPI.GET_SERVER:
-            process_get_server(connection, server_name=msg[1])
+    elif msg[0] == ClientAPI.NEW_SERVER:
+        process_new_server(connection, server_name=msg[1], player=player, args=msg[2:])
 
-        elif msg[0] == ClientAPI.JOIN_SERVER:
-            process_join_server(connection, server_name=msg[1], player=player)
+    elif msg[0] == ClientAPI.GET_SERVERS_LIST:
+        process_get_servers_list(connection, msg[1:])
 
-        elif msg[0] == ClientAPI.MAKE_MOVE:
-            process_make_move(connection, player=player, server_name=msg[1], x=msg[2], y=msg[3])
+    elif msg[0] == ClientAPI.GET_SERVER:
+        process_get_server(connection, server_name=msg[1], last_seq=msg[2:])
 
-        elif msg[0] == ClientAPI.START_GAME:
-            process_start_game(connection,  player, msg[1])
+    elif msg[0] == ClientAPI.JOIN_SERVER:
+        process_join_server(connection, server_name=msg[1], player=player)
 
-        elif msg[0] == ClientAPI.EXIT_SERVER:
-            process_exit_server(connection, player)
-        else:
-            # If the player is inside a game, exclude him from it
-            if player.game is not None:
-                current_server = get_game_object(games_list, player.game)
-                current_server.remove_player(player)
+    elif msg[0] == ClientAPI.MAKE_MOVE:
+        process_make_move(connection, player=player, server_name=msg[1], x=msg[2], y=msg[3], last_seq=msg[4:])
 
-                # If there is no player in the server
-                if len(current_server.players) == 0:
+    elif msg[0] == ClientAPI.ADD_BOT:
+        process_add_bot(connection, player, server_name=msg[1])
 
-                    # Remove the server from the list of servers
-                    games_list.remove(current_server)
-            break
+    elif msg[0] == ClientAPI.RESUME:
+        process_resume(connection, player, name=msg[1], token=msg[2])
 
-    # Free the name player from the picked names
-    picked_names.remove(player.name)
+    elif msg[0] == ClientAPI.START_GAME:
+        process_start_game(connection,  player, msg[1])
 
-def process_get_my_name(connection: socket.socket, player):
+    elif msg[0] == ClientAPI.EXIT_SERVER:
+        process_exit_server(connection, player)
+
+    elif msg[0] == ClientAPI.SUBSCRIBE:
+        process_subscribe(connection, server_name=msg[1])
+
+    elif msg[0] == ClientAPI.UNSUBSCRIBE:
+        process_unsubscribe(connection, server_name=msg[1])
+
+    elif msg[0] == ClientAPI.WATCH:
+        process_watch(connection, server_name=msg[1])
+
+    elif msg[0] == ClientAPI.UNWATCH:
+        process_unwatch(connection, server_name=msg[1])
+
+    elif msg[0] == ClientAPI.LIST_REPLAYS:
+        process_list_replays(connection, msg[1:])
+
+    elif msg[0] == ClientAPI.GET_REPLAY:
+        process_get_replay(connection, msg[1:])
+
+    elif msg[0] == ClientAPI.GET_STATS:
+        process_get_stats(connection)
+
+    elif msg[0] == ClientAPI.QUICK_MATCH:
+        process_quick_match(connection, player, msg[1:])
+
+    elif msg[0] == ClientAPI.CANCEL_MATCH:
+        process_cancel_match(connection, player)
+
+    elif msg[0] == ClientAPI.PING:
+        send_response(connection, {"status": "success", "event": "pong"})
+    else:
+        # Unknown request or QUIT: the connection is closed
+        return False
+
+    return True
+
+def route_to_shard(connection: FramedConnection, player: Player, msg: list[str]) -> bool:
     """
-    Sends the player's assigned name back to the client.
-    :param connection: socket representing the connection
+    Handles the requests that involve other workers of the server
+    :param connection: connection to the client, used to send the response
+    :param player: Player object
+    :param msg: request received from the client, split on '/'
+    :return: False if the request must be handled by this worker alone
+    """
+    if msg[0] == ClientAPI.GET_SERVERS_LIST:
+        process_get_servers_list_sharded(connection, msg[1:])
+        return True
+
+    # The games of another worker are watched through the subscription of this worker to their owner
+    if msg[0] in (ClientAPI.SUBSCRIBE, ClientAPI.WATCH) and len(msg) > 1 and not shard.is_local(msg[1]):
+        process_subscribe_remote(connection, msg[1])
+        return True
+    if msg[0] == ClientAPI.UNWATCH and len(msg) > 1 and not shard.is_local(msg[1]):
+        process_unsubscribe(connection, msg[1])
+        return True
+
+    if msg[0] in GAME_REQUESTS and len(msg) > 1:
+        server_name = msg[1]
+    elif msg[0] == ClientAPI.EXIT_SERVER:
+        server_name = player.game
+    else:
+        return False
+
+    if server_name is None or shard.is_local(server_name):
+        return False
+
+    # A player creating or joining a game of another worker stops waiting for a match too, and must leave his game
+    # first
+    if msg[0] in (ClientAPI.NEW_SERVER, ClientAPI.JOIN_SERVER):
+        matchmaker.leave(player)
+        if player.game is not None:
+            send_response(connection, {"status": "failed", "message": "You are already inside a server"})
+            return True
+
+    owner = shard.owner(server_name)
+    game, response = shard.forward(owner, player.name, connection.encoding, '/'.join(msg))
+
+    # Remember the game of the player to route his exit, the owner only knows about its own games
+    if game is not None:
+        player.join_game(game)
+    elif player.game is not None and shard.owner(player.game) == owner:
+        player.quit_game()
+
+    connection.send(response)
+    return True
+
+def game_observers() -> list:
+    """
+    Functions called after every change of a game of the server
+    :return: list of observers
+    """
+    if archive is None:
+        return [publish_game_event, spectators.on_game_event]
+    return [publish_game_event, spectators.on_game_event, archive.on_game_event]
+
+def game_state(game: Game) -> dict:
+    """
+    Describe the current state of a game
+    :param game: Game object
+    :return: a dict describing the game
+    """
+    return {"name": game.name,
+            "board": game.board,
+            "has_started": game.has_started,
+            "current_player": game.current_player.name if game.current_player is not None else None,
+            "players": [player.name for player in game.players],
+            "winner": game.winner,
+            "win_length": game.win_length,
+            "seq": game.seq}
+
+def game_update(game: Game, last_seq: int | None) -> dict:
+    """
+    Describe the changes of a game since the state known by a client
+    :param game: Game object, with its lock held
+    :param last_seq: Sequence number of the state known by the client, None to get the whole state
+    :return: a dict with "update": "not_modified" (nothing changed), "delta" (the (x, y, symbol) of the moves since
+    last_seq, the current player and the winner) or "snapshot" (the whole state)
+    """
+    moves = game.moves_since(last_seq) if last_seq is not None else None
+
+    if moves is None:
+        response = {"update": "snapshot"}
+        response.update(game_state(game))
+    elif not moves:
+        response = {"update": "not_modified", "name": game.name, "seq": game.seq}
+    else:
+        response = {"update": "delta",
+                    "name": game.name,
+                    "seq": game.seq,
+                    "moves": moves,
+                    "current_player": game.current_player.name if game.current_player is not None else None,
+                    "winner": game.winner}
+    return response
+
+def encoded_game_update(game: Game, last_seq: int | None, encoding: str) -> bytes:
+    """
+    Encode the reply to GET_SERVER, reusing the one encoded for the same state, sequence number and encoding
+    :param game: Game object
+    :param last_seq: Sequence number of the state known by the client, None to get the whole state
+    :param encoding: Encoding of the reply
+    :return: the payload of the reply
+    """
+    # Every sequence number too old for the move log gets the same snapshot
+    def cache_key(version: int) -> tuple:
+        if last_seq is None or not 0 <= version - last_seq <= MOVE_LOG_SIZE:
+            return None, encoding
+        return last_seq, encoding
+
+    # The cache is read without the lock of the game, so the pollers never wait for the players
+    if cache_responses:
+        version = game.seq
+        payload = game.responses.get(version, cache_key(version))
+        game_cache_stats.record(payload is not None)
+        if payload is not None:
+            return payload
+
+    with game.lock:
+        version = game.seq
+        response = {"status": "success"}
+        response.update(game_update(game, last_seq))
+
+    payload = encode(response, encoding)
+    if cache_responses:
+        game.responses.put(version, cache_key(version), payload)
+    return payload
+
+def parse_seq(args: list[str]) -> int | None:
+    """
+    Read the optional sequence number at the end of a request
+    :param args: arguments of the request after the ones it needs
+    :return: the sequence number, None if it is missing
+    """
+    return int(args[0]) if args else None
+
+def publish_game_event(game: Game, event: str):
+    """
+    Push the new state of a game to all its subscribers. Called with the lock of the game held: the state and the
+    subscribers are copied, and the publisher thread writes the message after the lock is released.
+    :param game: Game object that changed
+    :param event: Name of the change
+    :return: None
+    """
+    with subscribers_lock:
+        connections = list(subscribers.get(game.name, ()))
+    if not connections:
+        return
+
+    response = {"status": "success", "event": event}
+    response.update(game_state(game))
+    publisher.publish(connections, response)
+
+def publish_remote_event(payload: bytes):
+    """
+    Push a change of a game owned by another worker to the subscribers of this worker
+    :param payload: state of the game pushed by the other worker, in JSON
+    :return: None
+    """
+    response = decode(payload, JSON)
+
+    with subscribers_lock:
+        connections = list(subscribers.get(response["name"], ()))
+    publisher.publish(connections, response)
+
+def drop_subscriber(connection: FramedConnection):
+    """
+    Stop pushing the events of every game to a connection that does not read them, called by the publisher
+    :param connection: connection to the client
+    :return: None
+    """
+    logging.info(f'Unsubscribing a client that does not read the events of {", ".join(connection.subscriptions)}')
+    for server_name in list(connection.subscriptions):
+        unsubscribe(connection, server_name)
+
+def unsubscribe(connection: FramedConnection, server_name: str):
+    """
+    Stop pushing the events of a game to a connection
+    :param connection: connection to the client
+    :param server_name: Name of the game
+    :return: None
+    """
+    connection.subscriptions.discard(server_name)
+
+    with subscribers_lock:
+        connections = subscribers.get(server_name)
+        if connections is None:
+            return
+        connections.discard(connection)
+        if connections:
+            return
+        del subscribers[server_name]
+
+    # The last subscriber of this worker left a game of another worker
+    if shard is not None and not shard.is_local(server_name):
+        owner = shard.owner(server_name)
+        try:
+            shard.request(owner, f"{ClientAPI.UNSUBSCRIBE}/{server_name}")
+
+            # Another client subscribed meanwhile
+            with subscribers_lock:
+                subscribed_again = server_name in subscribers
+            if subscribed_again:
+                shard.request(owner, f"{ClientAPI.SUBSCRIBE}/{server_name}")
+        except OSError:
+            pass
+
+def send_response(connection: FramedConnection, response: dict):
+    """
+    Sends a response to the client, in the encoding chosen by the client
+    :param connection: connection to the client
+    :param response: dict describing the response
+    :return: None
+    """
+    connection.send(encode(response, connection.encoding))
+
+def process_get_my_name(connection: FramedConnection, player, encodings: list[str]):
+    """
+    Sends the player's assigned name back to the client, and chooses the encoding of the next responses.
+    :param connection: connection to the client
     :param player: Player object
+    :param encodings: Encodings supported by the client, the preferred one first
     :return: None
     """
-    connection.send(player.name.encode(FORMAT))
 
-def process_new_server(connection: socket.socket, server_name, player):
+    # The preferred encoding of the client supported by the server, JSON by default
+    encoding = next((encoding for encoding in encodings if encoding in ENCODINGS), JSON)
+
+    response = {"status": "success",
+                "name": player.name,
+                "encoding": encoding,
+                "encodings": list(ENCODINGS)}
+
+    # The token lets the client take back the place of the player after a restart of the server
+    if journal is not None:
+        player.token = secrets.token_hex(16)
+        response["token"] = player.token
+
+    # The response to the handshake is always in JSON
+    connection.send(encode(response, JSON))
+    connection.encoding = encoding
+
+def process_resume(connection: FramedConnection, player: Player, name: str, token: str):
+    """
+    Gives to the client the place of a player rebuilt from the journal, if the token is his
+    :param connection: connection to the client
+    :param player: Player object
+    :param name: Name of the player rebuilt from the journal
+    :param token: Token given to the client of the player before the restart
+    :return: None
+    """
+    # A player waiting for a match stops waiting, and a match being made with him is waited for
+    matchmaker.leave(player)
+
+    with detached_lock:
+        previous = detached.get(name)
+        if previous is not None and player.game is None and hmac.compare_digest((previous.token or "").encode(), token.encode()):
+            del detached[name]
+        else:
+            previous = None
+
+    if previous is None:
+        send_response(connection, {"status": "failed", "message": "There is no place to take back"})
+        return
+
+    # The name of the previous player is already given, the one of the connection is released
+    names.release(player.name)
+    player.name, player.token = previous.name, previous.token
+    current_server = games.replace_player(previous, player)
+
+    logging.info(f'{player.name} took back his place in {current_server.name if current_server else None}')
+    response = {"status": "success",
+                "name": player.name,
+                "game": current_server.name if current_server else None}
+    send_response(connection, response)
+
+def process_new_server(connection: FramedConnection, server_name, player, args: list[str] = ()):
     """
     Handles the creation of a new game server.
-    :param connection: socket representing the connection
+    :param connection: connection to the client
     :param server_name: Name of the new server
     :param player: Player object
+    :param args: [size of the board, win length], both optional: by default the board has one more row than the
+    players at the start, and 3 aligned symbols win
     :return: None
     """
 
-    # Check if the name of the new server is available
-    if get_game_object(games_list, server_name) is not None:
-        server_data = {"status": "failed",
-                       "msg": "Name already exists"}
-        servers_json = json.dumps(server_data)
-        connection.send(servers_json.encode(FORMAT))
-
     # Check if the name has special characters
-    elif not server_name.isalnum():
+    if not server_name.isalnum():
         server_data = {"status": "failed",
                        "msg": "Please use only alpha character"}
-        servers_json = json.dumps(server_data)
-        connection.send(servers_json.encode(FORMAT))
+        send_response(connection, server_data)
+        return
+
+    # Check the size of the board and the win length
+    try:
+        size = int(args[0]) if len(args) > 0 and args[0] else None
+        win_length = int(args[1]) if len(args) > 1 and args[1] else WIN_LENGTH
+    except ValueError:
+        size, win_length = 0, 0
+    if (size is not None and not MIN_BOARD_SIZE <= size <= MAX_BOARD_SIZE
+            or not MIN_WIN_LENGTH <= win_length <= (size or MAX_BOARD_SIZE)):
+        server_data = {"status": "failed",
+                       "msg": f"The board has {MIN_BOARD_SIZE} to {MAX_BOARD_SIZE} rows and the win length is "
+                              f"{MIN_WIN_LENGTH} to the size of the board"}
+        send_response(connection, server_data)
+        return
 
-    # If the name is correct
+    # A player creating a game stops waiting for a match
+    matchmaker.leave(player)
+
+    # A player inside a game must leave it first
+    if player.game is not None:
+        send_response(connection, {"status": "failed", "msg": "You are already inside a server"})
+        return
+
+    # Create the game with its first player, unless the name is already used (checked atomically)
+    new_server = games.create(server_name, player, observers=game_observers(), size=size, win_length=win_length)
+
+    if new_server is None:
+        server_data = {"status": "failed",
+                       "msg": "Name already exists"}
     else:
         logging.info(f'{player.name} created server {server_name}')
 
-        new_server = Game(server_name)
-        new_server.add_player(player)
-        games_list.append(new_server)
+        with new_server.lock:
+            server_data = {"status": "success",
+                           "name": new_server.name,
+                           "players": [player.name for player in new_server.players],
+                           "size": new_server.size,
+                           "win_length": new_server.win_length}
+    send_response(connection, server_data)
 
-        server_data = {"status": "success",
-                       "name": new_server.name,
-                       "players": [player.name for player in new_server.players]}
-        servers_json = json.dumps(server_data)
-        connection.send(servers_json.encode(FORMAT))
+def lobby_summary(game: Game) -> dict:
+    """
+    Describe a game in the list of servers
+    :param game: Game object
+    :return: a dict with the name, the players, the state of the game, the size of its board (None for one more
+    than the players) and its win length
+    """
+    return {"name": game.name,
+            "players": [player.name for player in game.players],
+            "has_started": game.has_started,
+            "size": game.size,
+            "win_length": game.win_length}
 
-def process_get_servers_list(connection: socket.socket):
+def servers_page(offset: int, limit: int) -> dict:
     """
-    Sends the list of all active game servers to the client.
-    :param connection: socket representing the connection
+    Describe a part of the list of the games of this worker
+    :param offset: Number of games to skip
+    :param limit: Maximum number of games to describe
+    :return: a dict with the version and the size of the list, and the summaries of the games
+    """
+    # The version and the games are read at once
+    with games.lock:
+        return {"version": games.version,
+                "total": len(games),
+                "games": [lobby_summary(game) for game in games.list_games(offset, limit)]}
+
+def servers_changes(version: int) -> dict:
+    """
+    Describe the changes of the list of the games of this worker since a version
+    :param version: Version of the list known by the client
+    :return: a dict with the status ("reset" if the changes are too old), the version of the list and the summaries
+             of the games added and updated, and the names of the games removed
+    """
+    # The version and the changes are read at once
+    with games.lock:
+        changes = games.changes_since(version)
+
+        # The changes are too old, the client has to load the list again
+        if changes is None:
+            return {"status": "reset", "version": games.version}
+
+        added, updated, removed = changes
+        return {"status": "success",
+                "version": games.version,
+                "added": [lobby_summary(game) for game in added],
+                "updated": [lobby_summary(game) for game in updated],
+                "removed": removed}
+
+def parse_page(args: list[str]) -> tuple[int, int]:
+    """
+    Read the page asked by a GET_SERVERS_LIST request
+    :param args: [page, limit], both optional
+    :return: (page, limit)
+    """
+    page = int(args[0]) if len(args) > 0 and args[0] else 0
+    limit = int(args[1]) if len(args) > 1 and args[1] else DEFAULT_PAGE_SIZE
+    return max(0, page), max(1, min(limit, MAX_PAGE_SIZE))
+
+def process_get_servers_list(connection: FramedConnection, args: list[str]):
+    """
+    Sends a page of the list of the game servers, or the changes of the list since a version, to the client.
+    The response is reused for the same request until the list changes.
+    :param connection: connection to the client
+    :param args: [page, limit] to get a page (both optional), or ["since", version] to get the changes
     :return: None
     """
+    key = (*args[:2], connection.encoding)
+    version = games.version
+    if cache_responses:
+        payload = servers_list_cache.get(version, key)
+        list_cache_stats.record(payload is not None)
+        if payload is not None:
+            connection.send(payload)
+            return
 
-    # Create a list of dictionaries with the names and players
-    games_data = [{"name": game.name,
-                   "players": [player.name for player in game.players],
-                   "has_started": game.has_started} for game in games_list]
+    try:
+        if args and args[0] == "since":
+            changes = servers_changes(int(args[1]))
+            response = {"status": changes.pop("status"), "version": changes.pop("version")}
+            if response["status"] == "success":
+                response["since"] = int(args[1])
+                response.update(changes)
+            version = response["version"]
+        else:
+            page, limit = parse_page(args)
+
+            # Create a list of dictionaries with the names and players
+            listing = servers_page(page * limit, limit)
+            response = {"status": "success",
+                        "version": listing["version"],
+                        "page": page,
+                        "limit": limit,
+                        "total": listing["total"],
+                        "games": listing["games"]}
+            version = listing["version"]
+
+    except (ValueError, IndexError):
+        response = {"status": "failed", "message": "Use page/limit or since/version"}
+
+    # Send the response in the encoding of the client, and keep it for the next requests of the same version
+    payload = encode(response, connection.encoding)
+    if cache_responses:
+        servers_list_cache.put(version, key, payload)
+    connection.send(payload)
+
+def shard_servers_page(index: int, offset: int, limit: int) -> dict:
+    """
+    Describe a part of the list of the games of a worker
+    :param index: Index of the worker
+    :param offset: Number of games to skip
+    :param limit: Maximum number of games to describe
+    :return: the result of servers_page on the worker
+    """
+    if index == shard.index:
+        return servers_page(offset, limit)
+    return decode(shard.request(index, f"{LIST}/{offset}/{limit}"), JSON)
 
-    # Convert the list to JSON
-    servers_json = json.dumps(games_data)
+def shard_servers_changes(index: int, version: int) -> dict:
+    """
+    Describe the changes of the list of the games of a worker
+    :param index: Index of the worker
+    :param version: Version of the list of the worker known by the client
+    :return: the result of servers_changes on the worker
+    """
+    if index == shard.index:
+        return servers_changes(version)
+    return decode(shard.request(index, f"{CHANGES}/{version}"), JSON)
 
-    # Sends the list of servers as JSON
-    connection.send(servers_json.encode(FORMAT))
+def process_get_servers_list_sharded(connection: FramedConnection, args: list[str]):
+    """
+    Sends a page of the list of the game servers of every worker, or the changes of this list since a version.
+    The list is the concatenation of the lists of the workers, and its version is made of the versions of the
+    lists of the workers, joined by VERSION_SEPARATOR.
+    :param connection: connection to the client
+    :param args: [page, limit] to get a page (both optional), or ["since", version] to get the changes
+    :return: None
+    """
 
-def process_get_server(connection: socket.socket, server_name: str):
+    try:
+        if args and args[0] == "since":
+            versions = [int(version) for version in args[1].split(VERSION_SEPARATOR)]
+            if len(versions) != shard.count:
+                raise ValueError("The version does not match the number of workers")
+
+            parts = [shard_servers_changes(index, version) for index, version in enumerate(versions)]
+            version = VERSION_SEPARATOR.join(str(part["version"]) for part in parts)
+
+            # The changes of a worker are too old, the client has to load the whole list again
+            if any(part["status"] == "reset" for part in parts):
+                response = {"status": "reset", "version": version}
+            else:
+                response = {"status": "success",
+                            "version": version,
+                            "since": args[1],
+                            "added": [game for part in parts for game in part["added"]],
+                            "updated": [game for part in parts for game in part["updated"]],
+                            "removed": [name for part in parts for name in part["removed"]]}
+        else:
+            page, limit = parse_page(args)
+
+            # The sizes of the lists of the workers give the workers holding the page
+            sizes = [shard_servers_page(index, 0, 0) for index in range(shard.count)]
+
+            offset = page * limit
+            page_games = list()
+            for index, size in enumerate(sizes):
+                if len(page_games) >= limit:
+                    break
+                if offset >= size["total"]:
+                    offset -= size["total"]
+                    continue
+                page_games += shard_servers_page(index, offset, limit - len(page_games))["games"]
+                offset = 0
+
+            # The versions read before the page, so no change made meanwhile is missed by the next request
+            response = {"status": "success",
+                        "version": VERSION_SEPARATOR.join(str(size["version"]) for size in sizes),
+                        "page": page,
+                        "limit": limit,
+                        "total": sum(size["total"] for size in sizes),
+                        "games": page_games}
+
+    except (ValueError, IndexError):
+        response = {"status": "failed", "message": "Use page/limit or since/version"}
+
+    # Send the response in the encoding of the client
+    send_response(connection, response)
+
+def process_get_server(connection: FramedConnection, server_name: str, last_seq: list[str]):
     """
     Sends details about a specific game server to the client.
-    :param connection: socket representing the connection
+    :param connection: connection to the client
     :param server_name: Name of the server to retrieve
+    :param last_seq: [sequence number of the state known by the client], or [] to get the whole state
     :return: None
     """
 
     # Get the server corresponding to the index server 'msg'
-    current_server = get_game_object(games_list, server_name)
+    current_server = games.get(server_name)
 
-    # Create a list of dictionaries with the names and players
-    response = {"status": "success",
-                "name": current_server.name,
-                "board": current_server.board,
-                "has_started": current_server.has_started,
-                "current_player": current_server.current_player.name,
-                "players": [player.name for player in current_server.players],
-                "winner": current_server.winner}
+    try:
+        seq = parse_seq(last_seq)
+    except ValueError:
+        send_response(connection, {"status": "failed", "message": "The sequence number must be an integer"})
+        return
+
+    if current_server is None:
+        send_response(connection, {"status": "failed", "message": "The game is not existing anymore"})
+        return
 
-    # Convert the list to JSON
-    server_json = json.dumps(response)
+    # Describe the server, or its changes since the state known by the client, in the encoding of the client
+    connection.send(encoded_game_update(current_server, seq, connection.encoding))
 
-    # Sends the list of servers as JSON
-    connection.send(server_json.encode(FORMAT))
+def process_add_bot(connection: FramedConnection, player: Player, server_name: str):
+    """
+    Adds a computer player to the lobby of the player.
+    :param connection: connection to the client
+    :param player: Player object
+    :param server_name: Name of the server
+    :return: None
+    """
+    current_server = games.get(server_name)
 
-def process_join_server(connection: socket.socket, server_name: str, player: Player):
+    if current_server is None:
+        response = {"status": "failed", "message": "The game is not existing anymore"}
+    else:
+        with current_server.lock:
+            if player not in current_server.players:
+                response = {"status": "failed", "message": "You are not inside this server"}
+            elif current_server.has_started:
+                response = {"status": "failed", "message": "The game has already started"}
+            else:
+                bot = bots.add_bot(current_server)
+                if bot is None:
+                    response = {"status": "failed", "message": "No bot can join the server"}
+                else:
+                    logging.info(f'{player.name} added the bot {bot.name} to server {current_server.name}')
+                    response = {"status": "success",
+                                "name": current_server.name,
+                                "players": [player.name for player in current_server.players],
+                                "bot": bot.name}
+
+    send_response(connection, response)
+
+def process_join_server(connection: FramedConnection, server_name: str, player: Player):
     """
     Handles a player's request to join an existing game server.
-    :param connection: socket representing the connection
+    :param connection: connection to the client
     :param server_name: Name of the server to join
     :param player: Player object
     :return
     """
 
+    # A player joining a game stops waiting for a match
+    matchmaker.leave(player)
+
     # Get the server corresponding to the index server 'msg'
-    current_server = get_game_object(games_list, server_name)
+    current_server = games.get(server_name)
 
-    if current_server is None:
+    if player.game is not None:
         response_data = {"status": "failed",
-                         "message": "The game is not existing anymore"}
-
-    elif current_server.has_started:
+                         "message": "You are already inside a server"}
+    elif current_server is None:
         response_data = {"status": "failed",
-                         "message": "The game has already started"}
+                         "message": "The game is not existing anymore"}
     else:
-
-        # Add the player to the list of players of the server
-        current_server.add_player(player)
-        logging.info(f'{player.name} joined server {current_server.name}')
-        response_data = {"status": "success",
-                         "name": current_server.name,
-                         "players": [player.name for player in current_server.players]}
-
-    # Convert the list to JSON
-    response = json.dumps(response_data)
-
-    connection.send(response.encode(FORMAT))
-
-def process_make_move(connection: socket.socket, player: Player, server_name: str, x: str, y: str):
+        with current_server.lock:
+            if current_server.has_started:
+                response_data = {"status": "failed",
+                                 "message": "The game has already started"}
+            elif current_server.is_full():
+                response_data = {"status": "failed",
+                                 "message": f"The game already had {MAX_SYMBOLS} players"}
+
+            # Add the player to the list of players of the server, unless the game was removed meanwhile
+            elif not games.add_player(current_server, player):
+                response_data = {"status": "failed",
+                                 "message": "The game is not existing anymore"}
+            else:
+                logging.info(f'{player.name} joined server {current_server.name}')
+                response_data = {"status": "success",
+                                 "name": current_server.name,
+                                 "players": [player.name for player in current_server.players]}
+
+    # Send the response in the encoding of the client
+    send_response(connection, response_data)
+
+def process_make_move(connection: FramedConnection, player: Player, server_name: str, x: str, y: str,
+                      last_seq: list[str]):
     """
     Handles a player's move in the game.
-    :param connection: socket representing the connection
+    :param connection: connection to the client
     :param player: Player object
     :param server_name: Name of the server
     :param x: X-coordinate of the move
     :param y: Y-coordinate of the move
+    :param last_seq: [sequence number of the state known by the client], or [] to get the whole state
     :return: None
     """
 
     # Get Game object
-    current_server = get_game_object(games_list, server_name)
+    current_server = games.get(server_name)
 
-    # Try to make the move
-    moved_done = current_server.make_move(player, x=int(x), y=int(y))
+    if current_server is None:
+        send_response(connection, {"status": "failed", "message": "The game is not existing anymore"})
+        return
 
-    # If the moved cannot be done
-    if not moved_done:
-        status = "failed"
-    else:
-        status = "success"
+    try:
+        seq = parse_seq(last_seq)
+    except ValueError:
+        send_response(connection, {"status": "failed", "message": "The sequence number must be an integer"})
+        return
+
+    # The move and the state sent back are done at once
+    with current_server.lock:
+        # Try to make the move
+        moved_done = games.make_move(current_server, player, x=int(x), y=int(y))
 
-    response = {"status": status,
-                "name": current_server.name,
-                "board": current_server.board,
-                "has_started": current_server.has_started,
-                "current_player": current_server.current_player.name,
-                "players": [player.name for player in current_server.players],
-                "winner": current_server.winner}
+        # If the moved cannot be done
+        if not moved_done:
+            status = "failed"
+        else:
+            status = "success"
 
-    # Convert the list to JSON
-    response_json = json.dumps(response)
+        response = {"status": status}
+        response.update(game_update(current_server, seq))
 
-    # Sends the list of servers as JSON
-    connection.send(response_json.encode(FORMAT))
+    # Send the response in the encoding of the client
+    send_response(connection, response)
 
-def process_start_game(connection: socket.socket, player: Player, server_name: str):
+def process_start_game(connection: FramedConnection, player: Player, server_name: str):
     """
     Starts a game on the specified server.
-    :param connection: socket representing the connection
+    :param connection: connection to the client
     :param player: Player object
     :param server_name: Server name
     :return: None
     """
 
-    current_server = get_game_object(games_list, server_name)
-    if len(current_server.players) <= 1:
-        response = {"status": "error", "message": "You need more people in your server"}
-        response_json = json.dumps(response)
-        connection.send(response_json.encode(FORMAT))
-    else:
-        current_server.start()
-        logging.info(f'{player.name} started game {current_server.name}')
+    current_server = games.get(server_name)
+    if current_server is None:
+        send_response(connection, {"status": "failed", "message": "The game is not existing anymore"})
+        return
 
-        response = {"status": "success", "message": f"You started the server {current_server.name}"}
-        response_json = json.dumps(response)
-        connection.send(response_json.encode(FORMAT))
+    with current_server.lock:
+        if len(current_server.players) <= 1:
+            response = {"status": "error", "message": "You need more people in your server"}
+
+        # Only the first start request of a game is done
+        elif not games.start(current_server):
+            response = {"status": "failed", "message": "The game has already started"}
+        else:
+            logging.info(f'{player.name} started game {current_server.name}')
+            response = {"status": "success", "message": f"You started the server {current_server.name}"}
 
-def process_exit_server(connection: socket.socket, player: Player):
+    send_response(connection, response)
+
+def process_exit_server(connection: FramedConnection, player: Player):
     """
     Handles a player's request to leave a server.
-    :param connection: socket representing the connection
+    :param connection: connection to the client
     :param player: Player object
     :return: None
     """
 
-    current_server = get_game_object(games_list, player.game)
-    current_server.remove_player(player)
+    # Remove the player from his server, the server is removed if there is no player left in it
+    current_server = games.remove_player(player)
 
-    # If there is no player in the server
-    if len(current_server.players) == 0:
-        # Remove the server from the list of servers
-        games_list.remove(current_server)
+    if current_server is None:
+        response = {"status": "failed", "message": "You are not inside a server"}
+    else:
+        response = {"status": "success", "message": f"You quit the server {current_server.name}"}
+    send_response(connection, response)
+
+def process_quick_match(connection: FramedConnection, player: Player, args: list[str]):
+    """
+    Puts the player in the queue of the games of a number of players. The game is created and started as soon as
+    enough players wait, and its state is pushed to them with the event "match".
+    :param connection: connection to the client
+    :param player: Player object
+    :param args: [number of players], 2 by default
+    :return: None
+    """
+    try:
+        players = int(args[0]) if args and args[0] else MIN_PLAYERS
+    except ValueError:
+        players = 0
+
+    if not MIN_PLAYERS <= players <= MAX_PLAYERS:
+        response = {"status": "failed", "message": f"A match has {MIN_PLAYERS} to {MAX_PLAYERS} players"}
+    elif player.game is not None:
+        response = {"status": "failed", "message": "You are already inside a server"}
+    else:
+        waiting, matched = matchmaker.join(player, connection, players)
+        if waiting is None:
+            response = {"status": "failed", "message": "You are already inside a server"}
+        else:
+            response = {"status": "success",
+                        "message": f"You are waiting for a game of {players} players",
+                        "players": players,
+                        "waiting": waiting}
+
+        # The game is made once the lock of the matchmaker is released, again if players were put back in the queue
+        while matched:
+            requeue = []
+            try:
+                requeue = start_match(matched)
+            finally:
+                matched = matchmaker.finish(matched, requeue)
+
+        # A player put back in the queue is still waiting
+        if waiting is not None and player.game is None:
+            response["waiting"] = matchmaker.depth(players)
+    send_response(connection, response)
+
+def process_cancel_match(connection: FramedConnection, player: Player):
+    """
+    Takes the player out of the matchmaking queue
+    :param connection: connection to the client
+    :param player: Player object
+    :return: None
+    """
+    if matchmaker.leave(player):
+        response = {"status": "success", "message": "You stopped waiting for a game"}
+    else:
+        response = {"status": "failed", "message": "You are not waiting for a game"}
+    send_response(connection, response)
 
-    response = {"status": "success", "message": f"You quit the server {current_server.name}"}
-    response_json = json.dumps(response)
-    connection.send(response_json.encode(FORMAT))
+def create_match_game(player: Player) -> Game | None:
+    """
+    Creates a game for a match with its first player, under a name not used yet and owned by this worker
+    :param player: Player object
+    :return: the Game object, or None if the player is already inside a game
+    """
+    while True:
+        name = f"Match{next(match_numbers)}"
+        if shard is not None and not shard.is_local(name):
+            continue
 
-def main():
+        game = games.create(name, player, observers=game_observers())
+        # Only a name already used is tried again
+        if game is not None or games.game_of(player) is not None:
+            return game
+
+def start_match(tickets: list[Ticket]) -> list[Ticket]:
+    """
+    Creates and starts the game of the players matched, subscribes them to it and pushes its state to them.
+    Called before Matchmaker.finish, so none of the players can leave the queue or join another game meanwhile. A
+    player who took back a game of the journal (RESUME) before being matched is already inside a game: the match is
+    then cancelled without him.
+    :param tickets: Tickets of the players matched, in their order of arrival
+    :return: the tickets of the players to put back in the queue, empty if the game has started
+    """
+    game = None
+    joined = list()
+    for ticket in tickets:
+        if game is None:
+            game = create_match_game(ticket.player)
+            added = game is not None
+        else:
+            added = games.add_player(game, ticket.player)
+        if added:
+            joined.append(ticket)
+
+    if len(joined) < len(tickets):
+        logging.info(f'Match cancelled, {len(tickets) - len(joined)} of the players are inside a game already')
+        for ticket in joined:
+            games.remove_player(ticket.player)
+        return joined
+
+    games.start(game)
+    logging.info(f'Matched {", ".join(ticket.player.name for ticket in tickets)} in {game.name}')
+
+    # The state is queued before any move of the game, and pushed by the publisher without blocking
+    with game.lock:
+        connections = [ticket.connection for ticket in tickets]
+        with subscribers_lock:
+            subscribers.setdefault(game.name, set()).update(connections)
+        for connection in connections:
+            connection.subscriptions.add(game.name)
+
+        response = {"status": "success", "event": "match", "update": "snapshot"}
+        response.update(game_state(game))
+        publisher.publish(connections, response)
+    return []
+
+def process_subscribe(connection: FramedConnection, server_name: str):
+    """
+    Push every change of a game to the client, and send the current state of the game
+    :param connection: connection to the client
+    :param server_name: Name of the server
+    :return: None
+    """
+    current_server = games.get(server_name)
+
+    if current_server is None:
+        response = {"status": "failed", "message": "The game is not existing anymore"}
+        send_response(connection, response)
+        return
+
+    # The state is sent before any change of the game can be pushed to the client
+    with current_server.lock:
+        with subscribers_lock:
+            subscribers.setdefault(server_name, set()).add(connection)
+        connection.subscriptions.add(server_name)
+
+        response = {"status": "success"}
+        response.update(game_state(current_server))
+        send_response(connection, response)
+
+def process_subscribe_remote(connection: FramedConnection, server_name: str):
+    """
+    Push every change of a game owned by another worker to the client, and send the current state of the game.
+    The worker subscribes once to the owner of the game, and pushes the changes it receives to its own subscribers.
+    :param connection: connection to the client
+    :param server_name: Name of the server
+    :return: None
+    """
+    with subscribers_lock:
+        subscribers.setdefault(server_name, set()).add(connection)
+    connection.subscriptions.add(server_name)
+
+    response = decode(shard.request(shard.owner(server_name), f"{ClientAPI.SUBSCRIBE}/{server_name}"), JSON)
+    if response["status"] != "success":
+        unsubscribe(connection, server_name)
+
+    send_response(connection, response)
+
+def process_unsubscribe(connection: FramedConnection, server_name: str):
+    """
+    Stop pushing the changes of a game to the client
+    :param connection: connection to the client
+    :param server_name: Name of the server
+    :return: None
+    """
+    unsubscribe(connection, server_name)
+
+    response = {"status": "success", "message": f"You unsubscribed from the server {server_name}"}
+    send_response(connection, response)
+
+def process_watch(connection: FramedConnection, server_name: str):
+    """
+    Watch a game as a spectator: every change of the game is pushed to the client, and the current state of the
+    game is sent
+    :param connection: connection to the client
+    :param server_name: Name of the server
+    :return: None
+    """
+    current_server = games.get(server_name)
+
+    if current_server is None:
+        response = {"status": "failed", "message": "The game is not existing anymore"}
+        send_response(connection, response)
+        return
+
+    # The state is sent before any change of the game can be pushed to the client
+    with current_server.lock:
+        if games.get(server_name) is not current_server:
+            send_response(connection, {"status": "failed", "message": "The game is not existing anymore"})
+            return
+
+        response = {"status": "success", "update": "snapshot"}
+        response.update(spectators.add(connection, current_server))
+        send_response(connection, response)
+
+def process_unwatch(connection: FramedConnection, server_name: str):
+    """
+    Stop watching a game
+    :param connection: connection to the client
+    :param server_name: Name of the server
+    :return: None
+    """
+    spectators.remove(connection, server_name)
+
+    response = {"status": "success", "message": f"You stopped watching the server {server_name}"}
+    send_response(connection, response)
+
+def replay_description(header: dict) -> dict:
+    """
+    Describe a game of the archive
+    :param header: Description read from the archive
+    :return: a dict describing the game
+    """
+    return {"id": header["id"],
+            "name": header["name"],
+            "players": header["players"],
+            "size": header["size"],
+            "win_length": header["win_length"],
+            "winner": header["winner"],
+            "moves": header["moves"],
+            # The binary encoding has no floats, whole seconds are enough to show the date
+            "started_at": int(header["started_at"])}
+
+def process_list_replays(connection: FramedConnection, args: list[str]):
+    """
+    Sends a page of the list of the games archived, the newest first
+    :param connection: connection to the client
+    :param args: [page, limit], both optional
+    :return: None
+    """
+    if archive is None:
+        send_response(connection, {"status": "failed", "message": "The games are not archived"})
+        return
+
+    try:
+        page, limit = parse_page(args)
+    except ValueError:
+        send_response(connection, {"status": "failed", "message": "Use page/limit"})
+        return
+
+    response = {"status": "success",
+                "page": page,
+                "limit": limit,
+                "total": len(archive),
+                "games": [replay_description(header) for header in archive.list_games(page * limit, limit)]}
+    send_response(connection, response)
+
+def process_get_replay(connection: FramedConnection, args: list[str]):
+    """
+    Sends a game of the archive with a part of its moves, as (symbol, x, y, milliseconds since the previous move)
+    :param connection: connection to the client
+    :param args: [game id, first move, number of moves], the last two optional
+    :return: None
+    """
+    if archive is None:
+        send_response(connection, {"status": "failed", "message": "The games are not archived"})
+        return
+
+    try:
+        game_id = int(args[0])
+        first = max(0, int(args[1])) if len(args) > 1 else 0
+        count = max(0, min(int(args[2]), MAX_REPLAY_MOVES)) if len(args) > 2 else MAX_REPLAY_MOVES
+    except (ValueError, IndexError):
+        send_response(connection, {"status": "failed", "message": "Use game id/first move/number of moves"})
+        return
+
+    header = archive.header(game_id)
+    if header is None:
+        send_response(connection, {"status": "failed", "message": "There is no such game in the archive"})
+        return
+
+    # Only the moves asked for are read from the archive
+    response = {"status": "success", "first": first}
+    response.update(replay_description(header))
+    response["history"] = [list(move) for move in archive.moves(header, first, count)]
+    send_response(connection, response)
+
+def process_get_stats(connection: FramedConnection):
+    """
+    Sends the metrics of the server: the gauges, and the counters and latencies of every operation
+    :param connection: connection to the client
+    :return: None
+    """
+    response = {"status": "success"}
+    response.update(metrics.snapshot())
+    send_response(connection, response)
+
+def handle_peer(connection: socket.socket, address: tuple[str, int]):
+    """
+    Handles the link opened by another worker of the server, to run the requests about the games of this worker.
+    :param connection: socket representing the connection
+    :param address: tuple (hostaddr, port)
+    :return: None
+    """
+    framed_connection = FramedConnection(connection.sendall)
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    # The worker on the other side, subscribing to games like a client
+    peer = Player(address, "Worker")
+    origin = None
+
+    while True:
+        try:
+            framed_connection.request_id, msg = recv_frame(connection)
+        except OSError:
+            break
+
+        msg = msg.decode(FORMAT)
+        args = msg.split('/')
+
+        if args[0] == HELLO:
+            origin = int(args[1])
+            peer.name = f"Worker{origin}"
+            send_response(framed_connection, {"status": "success"})
+
+        elif args[0] == FORWARD:
+            process_forwarded_request(framed_connection, origin, player_name=args[1], encoding=args[2],
+                                      msg='/'.join(args[3:]))
+
+        elif args[0] == LIST:
+            send_response(framed_connection, servers_page(int(args[1]), int(args[2])))
+
+        elif args[0] == CHANGES:
+            send_response(framed_connection, servers_changes(int(args[1])))
+
+        elif not dispatch_request(framed_connection, peer, msg):
+            break
+
+    connection.close()
+
+    # Stop pushing to the worker, and remove its players from the games
+    for server_name in list(framed_connection.subscriptions):
+        unsubscribe(framed_connection, server_name)
+
+    with remote_players_lock:
+        players = [player for player in remote_players.values() if player.address == ("worker", origin)]
+        for player in players:
+            del remote_players[player.name]
+    for player in players:
+        games.remove_player(player)
+
+def process_forwarded_request(connection: FramedConnection, origin: int, player_name: str, encoding: str, msg: str):
+    """
+    Runs the request of a client of another worker, about a game of this worker
+    :param connection: link to the other worker
+    :param origin: Index of the other worker
+    :param player_name: Name of the player sending the request
+    :param encoding: Encoding of the responses of the client
+    :param msg: request of the client
+    :return: None
+    """
+    with remote_players_lock:
+        player = remote_players.get(player_name)
+        if player is None:
+            player = remote_players[player_name] = Player(("worker", origin), player_name)
+
+    buffer = BufferedConnection(encoding)
+    dispatch_request(buffer, player, msg)
+
+    # The player is forgotten once he is in no game of this worker
+    if player.game is None:
+        with remote_players_lock:
+            remote_players.pop(player_name, None)
+
+    # The response starts with the game of the player, so the other worker can route his next requests
+    connection.send((player.game or "").encode(FORMAT) + b"\n" + b"".join(buffer.responses))
+
+def expire_detached_players():
+    """
+    Removes from their games the players rebuilt from the journal whose client did not come back
+    :return: None
+    """
+    with detached_lock:
+        expired = list(detached.values())
+        detached.clear()
+
+    for player in expired:
+        games.remove_player(player)
+        names.release(player.name)
+
+    if expired:
+        logging.info(f'{len(expired)} players did not come back after the restart')
+
+def serve_peers(port: int):
+    """
+    Accepts the links of the other workers of the server, on the loopback interface
+    :param port: internal port of this worker
+    :return: None
+    """
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind(("127.0.0.1", port))
+    server_socket.listen()
+
+    while True:
+        connection, address = server_socket.accept()
+        threading.Thread(target=handle_peer, args=(connection, address), daemon=True).start()
+
+def serve_threaded(reuse_port: bool = False):
+    """
+    Runs the server with one thread per connected client
+    :param reuse_port: True to share the port with the other workers of the server
+    :return: None
+    """
     # Initialize socket object
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
+    # The kernel spreads the new connections between the workers listening on the port
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+    # A restarted server can listen again at once, while the connections of the previous one are closing
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
     # Bind the socket to address
     server_socket.bind(ADDR)
 
@@ -330,17 +1489,293 @@ def main():
     # Listen to new clients
     server_socket.listen()
 
+    if detached:
+        threading.Timer(RESUME_TIMEOUT, expire_detached_players).start()
+
     while True:
         connection, address = server_socket.accept()  # Waiting for client to connect to server (blocking call)
 
+        # Send the small responses at once instead of waiting for the acknowledgement of the previous message
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
         thread = threading.Thread(target=handle_client, args=(connection, address))
         thread.start()
 
-if __name__ == '__main__':
-    main()
+async def serve_asyncio():
+    """
+    Runs the server with every client handled on a single event loop
+    :return: None
+    """
+    server = await asyncio.start_server(handle_client_async, HOST, PORT)
+
+    # The games are only changed on the event loop, the moves of the bots too
+    loop = asyncio.get_running_loop()
+    bots.dispatch = lambda function: loop.call_soon_threadsafe(function)
 
+    if detached:
+        loop.call_later(RESUME_TIMEOUT, expire_detached_players)
 
+    logging.info(f'Server started')
+
+    async with server:
+        await server.serve_forever()
+
+def parse_arguments():
+    """
+    Parse the command line arguments of the server
+    :return: the parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Tic-Tac-Toe online server")
+    parser.add_argument("--engine", choices=ENGINES, default="threaded",
+                        help="'threaded' runs one thread per client, 'asyncio' runs every client on one event loop")
+    parser.add_argument("--host", default=HOST, help="address to bind the server to")
+    parser.add_argument("--port", type=int, default=PORT, help="port to listen on")
+    parser.add_argument("--log-level", default="INFO", help="minimum logging level (DEBUG, INFO, WARNING...)")
+    parser.add_argument("--max-players", type=int, help="maximum number of players connected at once (no limit by default)")
+    parser.add_argument("--metrics-port", type=int, help="serve the metrics as plain text over HTTP on this port")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="address of the metrics endpoint")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes sharing the port, each one owning a part of the games")
+    parser.add_argument("--shard-port", type=int,
+                        help="first internal port of the workers, on 127.0.0.1 (default: port + 100)")
+    parser.add_argument("--bot-time", type=float, default=0.5, help="maximum thinking time of a bot move in seconds")
+    parser.add_argument("--bot-nodes", type=int, default=200_000, help="maximum positions searched for a bot move")
+    parser.add_argument("--bot-threads", type=int, default=1, help="threads playing the moves of the bots")
+    parser.add_argument("--bot-processes", type=int, default=0,
+                        help="processes running the searches of the bots, 0 to search on the bot threads")
+    parser.add_argument("--journal-dir", help="keep the games in a journal in this directory, to rebuild them after "
+                                              "a restart (not kept by default)")
+    parser.add_argument("--journal-interval", type=float, default=SYNC_INTERVAL,
+                        help="seconds between two syncs of the journal to the disk")
+    parser.add_argument("--journal-segment", type=int, default=SEGMENT_RECORDS,
+                        help="changes written in a segment of the journal before it is compacted into a snapshot")
+    parser.add_argument("--archive-dir", help="archive the games played in this directory (not archived by default)")
+    parser.add_argument("--subscriber-queue", type=int, default=SUBSCRIBER_QUEUE_SIZE,
+                        help="events waiting for a subscriber reading too slowly before it is unsubscribed")
+    parser.add_argument("--spectator-queue", type=int, default=QUEUE_SIZE,
+                        help="messages queued for a spectator reading too slowly before they are replaced by a snapshot")
+    parser.add_argument("--spectator-timeout", type=float, default=DROP_TIMEOUT,
+                        help="seconds after which a spectator that does not read anything stops watching")
+    parser.add_argument("--no-response-cache", action="store_true",
+                        help="encode every reply to get_server and get_server_list again, to measure the cache")
+    parser.add_argument("--heartbeat-interval", type=float, default=HEARTBEAT_INTERVAL,
+                        help="seconds without any message from a client before it is pushed a ping")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="seconds without any message from a client before its connection is closed, 0 to keep "
+                             "the silent connections")
+    parser.add_argument("--resume-timeout", type=float, default=RESUME_TIMEOUT,
+                        help="seconds given to the players of the games rebuilt from the journal to come back")
+    args = parser.parse_args()
+
+    if args.workers > 1 and args.engine != "threaded":
+        parser.error("--workers needs the threaded engine")
+    if args.workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        parser.error("--workers needs SO_REUSEPORT, which is not available on this system")
+    if args.workers > 1 and args.bot_processes > 0:
+        parser.error("--bot-processes cannot be used with --workers")
+    if args.workers > 1 and args.journal_dir is not None:
+        parser.error("--journal-dir cannot be used with --workers")
+    if args.workers > 1 and args.archive_dir is not None:
+        parser.error("--archive-dir cannot be used with --workers")
+    return args
+
+def setup_bots(args) -> BotManager:
+    """
+    Create the manager of the bots from the command line arguments
+    :param args: parsed arguments
+    :return: BotManager object
+    """
+    search_executor = ProcessPoolExecutor(args.bot_processes) if args.bot_processes > 0 else None
+    return BotManager(games, names, time_budget=args.bot_time, node_limit=args.bot_nodes, threads=args.bot_threads,
+                      search_executor=search_executor)
+
+def setup_publisher(args) -> Publisher:
+    """
+    Start the publisher of the events of the games and its metrics
+    :param args: parsed arguments
+    :return: Publisher object
+    """
+    events = Publisher(drop_subscriber, queue_size=args.subscriber_queue)
+    metrics.add_gauge("subscriber_pushes", lambda: events.pushed)
+    metrics.add_gauge("subscribers_waiting", lambda: len(events))
+    metrics.add_gauge("subscribers_dropped", lambda: events.dropped)
+    return events
+
+def setup_spectators(args) -> Spectators:
+    """
+    Start the broadcaster of the spectators and its metrics
+    :param args: parsed arguments
+    :return: Spectators object
+    """
+    watchers = Spectators(game_state, queue_size=args.spectator_queue, drop_timeout=args.spectator_timeout)
+    metrics.add_gauge("spectators", lambda: len(watchers))
+    metrics.add_gauge("spectator_messages", lambda: watchers.messages)
+    metrics.add_gauge("spectator_encodings", lambda: watchers.encoded)
+    metrics.add_gauge("spectator_resyncs", lambda: watchers.resyncs)
+    metrics.add_gauge("spectators_dropped", lambda: watchers.dropped)
+    return watchers
+
+def setup_matchmaker() -> Matchmaker:
+    """
+    Create the matchmaking queue of QUICK_MATCH and its metrics
+    :return: Matchmaker object
+    """
+    queue = Matchmaker()
+    metrics.add_gauge("quick_match_waiting", lambda: len(queue))
+    metrics.add_gauge("quick_matches", lambda: queue.matches)
+    metrics.add_gauge("quick_matches_last_minute", queue.recent_matches)
+    for percentile in (50, 95, 99):
+        metrics.add_gauge(f"quick_match_wait_p{percentile}_ms",
+                          lambda percentile=percentile: round(queue.wait.percentile(percentile) * 1000))
+    return queue
+
+def setup_connections(args) -> ConnectionManager | None:
+    """
+    Start the heartbeats and the idle timeouts of the client connections, and their metrics
+    :param args: parsed arguments
+    :return: ConnectionManager object, None if --idle-timeout is 0
+    """
+    if args.idle_timeout <= 0:
+        return None
+
+    manager = ConnectionManager(args.heartbeat_interval, args.idle_timeout)
+    metrics.add_gauge("tracked_connections", lambda: len(manager))
+    metrics.add_gauge("heartbeats", lambda: manager.heartbeats)
+    metrics.add_gauge("idle_timeouts", lambda: manager.timeouts)
+    return manager
+
+def setup_journal(args):
+    """
+    Rebuild the games from the journal, then record their changes
+    :param args: parsed arguments
+    :return: None
+    """
+    global journal, RESUME_TIMEOUT
+
+    journal = Journal(args.journal_dir, args.journal_interval, args.journal_segment)
+    RESUME_TIMEOUT = args.resume_timeout
+
+    players: dict[str, Player] = dict()
+    recovery = journal.recover(games, players, observers=[publish_game_event, spectators.on_game_event])
+    logging.info(f'{recovery["games"]} games rebuilt from the snapshot {recovery["snapshot"]} and '
+                 f'{recovery["records"]} changes in {recovery["seconds"] * 1000:.0f}ms')
+
+    games.on_change = journal.record
+    journal.start()
 
+    # The games removed before the crash were archived then, the ones rebuilt are archived when they are removed
+    if archive is not None:
+        for game in games.games.values():
+            game.observers.append(archive.on_game_event)
 
+    # The names of the players rebuilt are not given to the new clients, the bots play again at once
+    for player in players.values():
+        names.reserve(player.name)
+        if isinstance(player, Bot):
+            bots.restore(games.game_of(player), player)
+        else:
+            detached[player.name] = player
+
+    metrics.add_gauge("journal_records", lambda: journal.records)
+    metrics.add_gauge("journal_syncs", lambda: journal.syncs)
+    metrics.add_gauge("detached_players", lambda: len(detached))
+
+    # Stopping the server keeps the players connected in their games, so they can take back their place
+    signal.signal(signal.SIGINT, stop_server)
+    signal.signal(signal.SIGTERM, stop_server)
+
+def stop_server(signum, frame):
+    """
+    Stops the server at once after writing the last changes to the journal, before the connections are closed
+    :param signum: number of the signal received
+    :param frame: current stack frame
+    :return: None
+    """
+    journal.close()
+    if archive is not None:
+        archive.flush()
+    logging.info('Server stopped')
+    os._exit(0)
+
+def run_worker(index: int, args):
+    """
+    Runs a worker of the server, owning a part of the games
+    :param index: Index of the worker
+    :param args: parsed arguments
+    :return: None
+    """
+    global HOST, PORT, ADDR, shard, names, bots, publisher, spectators, cache_responses, connection_manager, matchmaker
+
+    HOST, PORT = args.host, args.port
+    ADDR = (HOST, PORT)
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    shard_port = args.shard_port or args.port + 100
+    shard = Shard(index, args.workers, "127.0.0.1", [shard_port + i for i in range(args.workers)],
+                  on_push=publish_remote_event)
 
+    # Each worker gives its own part of the names, so the names stay unique
+    names = NameAllocator(animal_names, offset=index, stride=args.workers, limit=args.max_players)
+    bots = setup_bots(args)
+    publisher = setup_publisher(args)
+    spectators = setup_spectators(args)
+    cache_responses = not args.no_response_cache
+    connection_manager = setup_connections(args)
+    matchmaker = setup_matchmaker()
 
+    threading.Thread(target=serve_peers, args=(shard.ports[index],), daemon=True).start()
+
+    if args.metrics_port is not None:
+        serve_metrics(metrics, args.metrics_host, args.metrics_port + index)
+
+    logging.info(f'Worker {index} of {args.workers} started')
+    serve_threaded(reuse_port=True)
+
+def main():
+    global HOST, PORT, ADDR, bots, archive, publisher, spectators, cache_responses, connection_manager, matchmaker
+
+    args = parse_arguments()
+
+    HOST, PORT = args.host, args.port
+    ADDR = (HOST, PORT)
+    logging.getLogger().setLevel(args.log_level.upper())
+    names.limit = args.max_players
+    bots = setup_bots(args)
+    publisher = setup_publisher(args)
+    spectators = setup_spectators(args)
+    cache_responses = not args.no_response_cache
+
+    if args.archive_dir is not None:
+        archive = Archive(args.archive_dir)
+        metrics.add_gauge("archived_games", lambda: len(archive))
+    if args.journal_dir is not None:
+        setup_journal(args)
+
+    logging.info(f'Using the {args.engine} engine')
+
+    if args.workers > 1:
+        workers = [multiprocessing.Process(target=run_worker, args=(index, args), name=f"Worker{index}", daemon=True)
+                   for index in range(args.workers)]
+        for worker in workers:
+            worker.start()
+
+        # Stopping the main process stops the workers
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        for worker in workers:
+            worker.join()
+        return
+
+    connection_manager = setup_connections(args)
+    matchmaker = setup_matchmaker()
+
+    if args.metrics_port is not None:
+        serve_metrics(metrics, args.metrics_host, args.metrics_port)
+        logging.info(f'Metrics served on http://{args.metrics_host}:{args.metrics_port}/metrics')
+
+    if args.engine == "asyncio":
+        asyncio.run(serve_asyncio())
+    else:
+        serve_threaded()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Sharding of the games between several worker processes of the server.
+
+Every worker listens on the public port (SO_REUSEPORT), so the kernel spreads the clients between the workers.
+Each game is owned by a single worker, chosen from its name, and only this worker holds its state. A worker
+forwards the requests of its clients for the games of another worker over an internal link: a framed connection
+to the internal port of the other worker, on the loopback interface. The changes of the games are pushed back on
+the same link, then pushed by the worker to its own subscribed clients.
+"""
+
+import socket
+import threading
+import time
+import zlib
+
+from protocol import FramedClient
+
+# Requests exchanged between the workers on the internal links
+HELLO = "shard_hello"  # + index of the worker opening the link
+FORWARD = "shard_forward"  # + player_name/encoding/request of the client
+LIST = "shard_list"  # + offset/limit
+CHANGES = "shard_changes"  # + version
+
+# Separator of the versions of the shards in the version of the list of servers
+VERSION_SEPARATOR = "."
+
+# Time to wait for another worker to start listening
+CONNECT_TIMEOUT = 10.0
+
+def owner_of(name: str, shards: int) -> int:
+    """
+    Get the worker owning a game
+    :param name: Name of the game
+    :param shards: Number of workers
+    :return: the index of the worker
+    """
+    return zlib.crc32(name.encode('utf-8')) % shards
+
+class Shard:
+    """
+    Define the place of a worker among the workers of the server, and its links to the other workers.
+    """
+
+    def __init__(self, index: int, count: int, host: str, ports: list[int], on_push=None):
+        """
+        :param index: Index of this worker
+        :param count: Number of workers
+        :param host: Address of the internal ports
+        :param ports: Internal port of every worker, by index
+        :param on_push: function called with the payload of every change pushed by another worker
+        """
+        self.index: int = index
+        self.count: int = count
+        self.host: str = host
+        self.ports: list[int] = ports
+        self.on_push = on_push
+
+        # Links to the other workers, opened on first use
+        self.links: dict[int, FramedClient] = dict()
+        self.lock = threading.Lock()
+
+    def owner(self, name: str) -> int:
+        """
+        Get the worker owning a game
+        :param name: Name of the game
+        :return: the index of the worker
+        """
+        return owner_of(name, self.count)
+
+    def is_local(self, name: str) -> bool:
+        """
+        Check if a game is owned by this worker
+        :param name: Name of the game
+        :return: True if the game is owned by this worker
+        """
+        return self.owner(name) == self.index
+
+    def peers(self) -> list[int]:
+        """
+        :return: the indexes of the other workers
+        """
+        return [index for index in range(self.count) if index != self.index]
+
+    def link(self, index: int) -> FramedClient:
+        """
+        Get the link to another worker, and open it if needed
+        :param index: Index of the worker
+        :return: the FramedClient connected to the worker
+        """
+        with self.lock:
+            link = self.links.get(index)
+            if link is not None and not link.closed:
+                return link
+
+            # The other worker may still be starting
+            deadline = time.monotonic() + CONNECT_TIMEOUT
+            while True:
+                try:
+                    connection = socket.create_connection((self.host, self.ports[index]), timeout=CONNECT_TIMEOUT)
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.1)
+
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            link = FramedClient(connection, self.on_push)
+            link.request(f"{HELLO}/{self.index}")
+            self.links[index] = link
+            return link
+
+    def request(self, index: int, msg: str) -> bytes:
+        """
+        Send a request to another worker and wait for its response
+        :param index: Index of the worker
+        :param msg: request to send
+        :return: payload of the response
+        """
+        return self.link(index).request(msg)
+
+    def forward(self, index: int, player_name: str, encoding: str, msg: str) -> tuple[str | None, bytes]:
+        """
+        Execute the request of a client on the worker owning the game
+        :param index: Index of the worker
+        :param player_name: Name of the player sending the request
+        :param encoding: Encoding of the responses of the client
+        :param msg: request of the client
+        :return: (name of the game of the player after the request or None, payload of the response)
+        """
+        payload = self.request(index, f"{FORWARD}/{player_name}/{encoding}/{msg}")
+        game, response = payload.split(b"\n", 1)
+        return game.decode('utf-8') or None, response
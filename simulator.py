@@ -0,0 +1,179 @@
+"""
+Batched simulation of many games at once, for self-play and for testing the rules.
+
+The boards of a batch are a single NumPy array, one row of bytes per game and one symbol per byte, and every game of
+the batch has the same size, win length and number of players. A step applies one move to each game of a selection
+and checks the lines going through the new cells, with a few array operations for the whole batch instead of calls
+to Game objects.
+The rules are the ones of Game.make_move and Game.check_winner_at: a move outside of the board or on a taken cell
+changes nothing, the players play in turn (symbols 1, 2... in the order they joined), the moves can go on after a
+winner, and the winner is the first line made: the row, the column, the diagonal and the anti-diagonal of the cell
+are checked in this order, and the cells of the line are the same as the ones of the Game.
+
+NumPy is needed by this module only, the server does not use it.
+"""
+
+import numpy
+
+from game import WIN_LENGTH
+
+# Step (dx, dy) between two consecutive cells of a row, a column, a diagonal and an anti-diagonal, in the order of
+# BitBoard.shifts
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+# Value of the border of the boards, never equal to a symbol
+BORDER = 255
+
+class BatchSimulator:
+    """
+    Define a batch of games played at the same time.
+    The boards are stored with a border of win_length - 1 cells on each side, so the cells next to a move are always
+    inside the array: the 8 half-lines of win_length - 1 cells around the moves of the whole batch are read with a
+    single gather from the flat array.
+    """
+
+    def __init__(self, games: int, players: int = 2, size: int | None = None, win_length: int = WIN_LENGTH):
+        """
+        :param games: Number of games of the batch
+        :param players: Number of players of each game
+        :param size: Number of rows and columns of the boards, None for one more than the players (at least the win
+        length) as Game.generate_board
+        :param win_length: Number of aligned symbols needed to win
+        """
+        self.players: int = players
+        self.size: int = size if size is not None else max(players + 1, win_length)
+        self.win_length: int = win_length
+
+        # Symbols of the cells of every board with its border, 0 for an empty cell
+        self.border: int = win_length - 1
+        self.stride: int = self.size + 2 * self.border
+        self.cells = numpy.full((games, self.stride * self.stride), BORDER, dtype=numpy.uint8)
+        self.boards[:] = 0
+
+        # Symbol of the player to move and number of moves played, by game
+        self.current = numpy.ones(games, dtype=numpy.uint8)
+        self.moves = numpy.zeros(games, dtype=numpy.int32)
+
+        # Symbol of the winner (0 if nobody won yet), first cell (x, y) and step (dx, dy) of his line, by game
+        self.winner = numpy.zeros(games, dtype=numpy.uint8)
+        self.winner_start = numpy.zeros((games, 2), dtype=numpy.int32)
+        self.winner_step = numpy.zeros((games, 2), dtype=numpy.int32)
+
+        # Offsets in the flat array of the cells 1 to win_length - 1 before a cell, by distance: the directions first,
+        # then the same ones after the cell
+        steps = numpy.array([dx * self.stride + dy for dx, dy in DIRECTIONS])
+        distances = numpy.arange(1, win_length)
+        self.offsets = numpy.concatenate((-distances[:, None] * steps, distances[:, None] * steps), axis=1)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    @property
+    def boards(self):
+        """
+        The boards without their border
+        :return: array view of shape (games, size, size), 0 for an empty cell
+        """
+        border = self.border
+        return self.cells.reshape(-1, self.stride, self.stride)[:, border:border + self.size, border:border + self.size]
+
+    def make_moves(self, x, y, games=None):
+        """
+        Make a move in each game of a selection, for the player whose turn it is
+        :param x: The x-positions of the moves, one by game selected
+        :param y: The y-positions of the moves, one by game selected
+        :param games: Indexes of the games selected, each at most once, None for every game of the batch
+        :return: bool array, True for the moves made as Game.make_move (False outside of the board or on a taken cell)
+        """
+        games = numpy.arange(len(self.cells)) if games is None else numpy.asarray(games)
+        x, y = numpy.asarray(x), numpy.asarray(y)
+
+        # The cells outside of the board are read at a clipped position, then refused
+        inside = (x >= 0) & (x < self.size) & (y >= 0) & (y < self.size)
+        flat = games * self.cells.shape[1] + (x.clip(0, self.size - 1) + self.border) * self.stride \
+            + y.clip(0, self.size - 1) + self.border
+        cells = self.cells.reshape(-1)
+        made = inside & (cells[flat] == 0)
+        games, x, y, flat = games[made], x[made], y[made], flat[made]
+
+        symbols = self.current[games]
+        cells[flat] = symbols
+        self.current[games] = symbols % self.players + 1
+        self.moves[games] += 1
+
+        # Only the lines going through the new cells can make a new winner
+        check = self.winner[games] == 0
+        self._check_winners(games[check], x[check], y[check], flat[check], symbols[check])
+        return made
+
+    def _check_winners(self, games, x, y, flat, symbols):
+        # Same symbols next to each cell, before and after it in each direction, until the first different cell
+        same = self.cells.reshape(-1)[flat[:, None, None] + self.offsets] == symbols[:, None, None]
+        run = same[:, 0].copy()
+        aligned = run.astype(numpy.int32)
+        for distance in range(1, self.win_length - 1):
+            run &= same[:, distance]
+            aligned += run
+
+        # As BitBoard.winning_line_at: the symbols before the cell first, then the ones after it that are needed
+        before = aligned[:, :len(DIRECTIONS)]
+        after = numpy.minimum(aligned[:, len(DIRECTIONS):], self.win_length - 1 - before)
+        won = before + after + 1 >= self.win_length
+
+        # The first direction of a line wins
+        winning = numpy.flatnonzero(won.any(axis=1))
+        direction = won[winning].argmax(axis=1)
+        steps = numpy.array(DIRECTIONS)[direction]
+        count = before[winning, direction]
+
+        winners = games[winning]
+        self.winner[winners] = symbols[winning]
+        self.winner_start[winners, 0] = x[winning] - count * steps[:, 0]
+        self.winner_start[winners, 1] = y[winning] - count * steps[:, 1]
+        self.winner_step[winners] = steps
+
+    def winner_cells(self, game: int) -> list[tuple[int, int]]:
+        """
+        Get the cells of the winning line of a game
+        :param game: Index of the game
+        :return: list of (x, y) as in Game.winner, empty if nobody won
+        """
+        if not self.winner[game]:
+            return []
+        (x, y), (dx, dy) = self.winner_start[game].tolist(), self.winner_step[game].tolist()
+        return [(x + k * dx, y + k * dy) for k in range(self.win_length)]
+
+    def board(self, game: int) -> list[list[int]]:
+        """
+        Get the board of a game
+        :param game: Index of the game
+        :return: list of rows of symbols (0 for an empty cell), as Game.board
+        """
+        return self.boards[game].tolist()
+
+    def finished(self):
+        """
+        Find the games with a winner or a full board
+        :return: bool array, by game
+        """
+        return (self.winner != 0) | (self.moves == self.size * self.size)
+
+    def play_random(self, rng: numpy.random.Generator) -> int:
+        """
+        Play every game of the batch with random moves until it has a winner or its board is full
+        :param rng: NumPy random generator
+        :return: the number of moves made
+        """
+        # A random order of the cells of each game, tried in turn: a cell taken before is skipped
+        cells = self.size * self.size
+        orders = rng.random((len(self.cells), cells)).argsort(axis=1)
+        tried = numpy.zeros(len(self.cells), dtype=numpy.int32)
+
+        made = 0
+        playing = numpy.flatnonzero(~self.finished())
+        while len(playing):
+            moves = orders[playing, tried[playing]]
+            tried[playing] += 1
+            made += int(self.make_moves(moves // self.size, moves % self.size, playing).sum())
+            playing = playing[~self.finished()[playing]]
+        return made
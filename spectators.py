@@ -0,0 +1,345 @@
+"""
+Spectators of the games: clients watching a game without taking a symbol or a turn.
+
+The players never wait for the spectators. The observer of a watched game only queues the change, and a broadcaster
+thread builds the message of each change once per encoding, then writes the same bytes to every spectator of the
+game without blocking (FramedConnection.push_nowait). Games without spectators cost a dictionary lookup per change.
+
+A move is sent as a delta (the move, the current player and the winner), any other change as a snapshot of the whole
+state. The broadcaster keeps its own copy of the state of each watched game, updated with the moves, so it never
+takes the lock of a game. Each spectator has a bounded queue of messages:
+- a snapshot replaces the messages queued before it;
+- when the queue is full, the messages queued are dropped and the spectator is sent a single snapshot of the latest
+  state instead, as soon as it reads again (resync);
+- a spectator that does not read anything for DROP_TIMEOUT seconds stops watching.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+
+from game import Game
+from protocol import PUSH_ID, FramedConnection, pack_frame
+from serialization import encode
+
+# Messages queued for a spectator before they are replaced by a snapshot
+QUEUE_SIZE = 32
+
+# Seconds between two attempts to write to the spectators that do not read fast enough
+RETRY_INTERVAL = 0.05
+
+# Seconds after which a spectator that does not read anything stops watching
+DROP_TIMEOUT = 10.0
+
+class Spectator:
+    """
+    A connection watching a game, with the messages not written to it yet.
+    """
+
+    __slots__ = ("connection", "frames", "resync", "blocked_since")
+
+    def __init__(self, connection: FramedConnection):
+        """
+        :param connection: connection to the client
+        """
+        self.connection: FramedConnection = connection
+
+        # Messages waiting to be written, in order
+        self.frames: list[bytes] = list()
+
+        # True if messages were dropped: a snapshot of the latest state is sent instead
+        self.resync: bool = False
+
+        # Monotonic time since which nothing could be written to the connection, None if it reads
+        self.blocked_since: float | None = None
+
+class GameView:
+    """
+    Copy of the state of a watched game kept by the broadcaster, with its spectators.
+    """
+
+    def __init__(self, state: dict):
+        """
+        :param state: State of the game, as server.game_state
+        """
+        self.state: dict = dict(state, board=[list(row) for row in state["board"]] if state["board"] else None)
+
+        # Spectators of the game, by connection
+        self.spectators: dict[FramedConnection, Spectator] = dict()
+
+        # Message of the snapshot of the current state, by encoding, built for the first spectator needing it
+        self.snapshots: dict[str, bytes] = dict()
+
+        # True when the game was removed: the spectators stop watching it once its last state is written
+        self.ended: bool = False
+
+    def snapshot(self, encoding: str, event: str) -> bytes:
+        """
+        Get the message of the snapshot of the current state
+        :param encoding: Encoding of the message
+        :param event: Name of the change sent
+        :return: the complete message
+        """
+        frame = self.snapshots.get(encoding)
+        if frame is None:
+            response = {"status": "success", "event": event, "update": "snapshot"}
+            response.update(self.state)
+            frame = self.snapshots[encoding] = pack_frame(PUSH_ID, encode(response, encoding))
+        return frame
+
+class Spectators:
+    """
+    Spectators of every game of the server, and the broadcaster thread writing the changes of the games to them.
+    """
+
+    def __init__(self, game_state: Callable[[Game], dict], queue_size: int = QUEUE_SIZE,
+                 drop_timeout: float = DROP_TIMEOUT):
+        """
+        :param game_state: Function describing the state of a game, with its lock held
+        :param queue_size: Messages queued for a spectator before they are replaced by a snapshot
+        :param drop_timeout: Seconds after which a spectator that does not read anything stops watching
+        """
+        self.game_state = game_state
+        self.queue_size: int = queue_size
+        self.drop_timeout: float = drop_timeout
+
+        # Number of spectators of each watched game, read by the observer of the games without lock
+        self.counts: dict[str, int] = dict()
+        self.lock = threading.Lock()
+
+        # Changes of the watched games and of their spectators, for the broadcaster
+        self.changes: queue.SimpleQueue = queue.SimpleQueue()
+
+        # Owned by the broadcaster: watched games by name, and spectators with messages not written yet
+        self.views: dict[str, GameView] = dict()
+        self.waiting: set[tuple[str, FramedConnection]] = set()
+
+        # Counters of the metrics
+        self.messages: int = 0
+        self.encoded: int = 0
+        self.resyncs: int = 0
+        self.dropped: int = 0
+
+        threading.Thread(target=self._broadcast_loop, name="spectators", daemon=True).start()
+
+    def __len__(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, connection: FramedConnection, game: Game) -> dict:
+        """
+        Make a connection watch a game. The lock of the game must be held, so no change is missed.
+        :param connection: connection to the client
+        :param game: Game object
+        :return: the current state of the game, as game_state
+        """
+        state = self.game_state(game)
+        with self.lock:
+            # The name of a removed game may still be in the set, until the broadcaster takes it out
+            if game.name in connection.watching and game.name in self.counts:
+                return state
+            connection.watching.add(game.name)
+            self.counts[game.name] = self.counts.get(game.name, 0) + 1
+        self.changes.put(("add", game.name, connection, state))
+        return state
+
+    def remove(self, connection: FramedConnection, game_name: str):
+        """
+        Stop a connection watching a game
+        :param connection: connection to the client
+        :param game_name: Name of the game
+        :return: None
+        """
+        with self.lock:
+            if game_name not in connection.watching:
+                return
+            connection.watching.discard(game_name)
+            self._decrease(game_name)
+        self.changes.put(("remove", game_name, connection, None))
+
+    def _decrease(self, game_name: str):
+        count = self.counts.get(game_name, 0) - 1
+        if count > 0:
+            self.counts[game_name] = count
+        else:
+            self.counts.pop(game_name, None)
+
+    def on_game_event(self, game: Game, event: str):
+        """
+        Observer of the games, queuing the changes of the watched games for the broadcaster
+        :param game: Game object that changed, with its lock held
+        :param event: Name of the change
+        :return: None
+        """
+        if game.name not in self.counts:
+            return
+
+        if event == "move":
+            current_player = game.current_player.name if game.current_player is not None else None
+            self.changes.put(("move", game.name, game.moves[-1], (current_player, game.winner)))
+            return
+
+        self.changes.put((event, game.name, None, self.game_state(game)))
+
+        # A game left by its last player is removed: its spectators stop watching it
+        if event == "exit" and not game.players:
+            with self.lock:
+                self.counts.pop(game.name, None)
+
+    # The following methods run on the broadcaster thread
+
+    def _broadcast_loop(self):
+        while True:
+            try:
+                change = self.changes.get(timeout=RETRY_INTERVAL if self.waiting else None)
+                while True:
+                    # A change that cannot be broadcast is skipped, the other games are still broadcast
+                    try:
+                        self._apply(*change)
+                    except Exception:
+                        logging.exception(f"Cannot broadcast a change of the game {change[1]}")
+                    change = self.changes.get_nowait()
+            except queue.Empty:
+                pass
+
+            try:
+                self._write_waiting()
+            except Exception:
+                logging.exception("Cannot write to the spectators")
+
+    def _apply(self, event: str, game_name: str, connection_or_move, state: dict | tuple):
+        view = self.views.get(game_name)
+
+        if event == "add":
+            connection = connection_or_move
+            if view is None or view.ended:
+                view = self.views[game_name] = GameView(state)
+            view.spectators[connection] = Spectator(connection)
+
+        elif event == "remove":
+            if view is not None:
+                view.spectators.pop(connection_or_move, None)
+                if not view.spectators:
+                    del self.views[game_name]
+
+        elif view is None:
+            return
+
+        elif event == "move":
+            seq, x, y, symbol = connection_or_move
+            current_player, winner = state
+            view.state["board"][x][y] = symbol
+            view.state.update(seq=seq, current_player=current_player, winner=winner)
+            view.snapshots.clear()
+
+            response = {"status": "success", "event": event, "update": "delta", "name": game_name, "seq": seq,
+                        "moves": [(x, y, symbol)], "current_player": current_player, "winner": winner}
+            self._offer(view, response)
+
+        else:
+            view.state = dict(state)
+            view.snapshots.clear()
+            if event == "exit" and not state["players"]:
+                view.ended = True
+                with self.lock:
+                    # Unless the spectators already watch a new game with the same name
+                    if game_name not in self.counts:
+                        for connection in view.spectators:
+                            connection.watching.discard(game_name)
+
+            # A snapshot replaces the messages queued before it
+            for spectator in view.spectators.values():
+                spectator.frames.clear()
+                spectator.resync = False
+            response = {"status": "success", "event": event, "update": "snapshot"}
+            response.update(state)
+            self._offer(view, response)
+
+    def _offer(self, view: GameView, response: dict):
+        # The message is encoded once for each encoding used by the spectators
+        frames: dict[str, bytes] = dict()
+
+        for connection, spectator in view.spectators.items():
+            if spectator.resync:
+                continue
+
+            if len(spectator.frames) >= self.queue_size:
+                spectator.frames.clear()
+                spectator.resync = True
+                self.resyncs += 1
+                continue
+
+            frame = frames.get(connection.encoding)
+            if frame is None:
+                frame = frames[connection.encoding] = pack_frame(PUSH_ID, encode(response, connection.encoding))
+                self.encoded += 1
+            spectator.frames.append(frame)
+            self.waiting.add((response["name"], connection))
+
+    def _write_waiting(self):
+        now = time.monotonic()
+        waiting, self.waiting = self.waiting, set()
+
+        for game_name, connection in waiting:
+            view = self.views.get(game_name)
+            spectator = view.spectators.get(connection) if view is not None else None
+            if spectator is None:
+                continue
+
+            try:
+                written = self._write(view, spectator)
+            except OSError:
+                # The connection is closed, it is released by its own handler
+                self._stop_watching(game_name, view, connection)
+                continue
+
+            if written:
+                if view.ended:
+                    self._stop_watching(game_name, view, connection)
+                continue
+
+            if spectator.blocked_since is None:
+                spectator.blocked_since = now
+            if now - spectator.blocked_since < self.drop_timeout:
+                self.waiting.add((game_name, connection))
+                continue
+
+            self.dropped += 1
+            with self.lock:
+                if game_name in connection.watching:
+                    connection.watching.discard(game_name)
+                    self._decrease(game_name)
+            self._stop_watching(game_name, view, connection)
+
+    def _write(self, view: GameView, spectator: Spectator) -> bool:
+        """
+        Write the messages of a spectator without blocking
+        :param view: Watched game
+        :param spectator: Spectator of the game
+        :return: True if every message is written, False if some are left to write later
+        """
+        connection = spectator.connection
+        if not connection.drain_nowait():
+            return False
+
+        if spectator.resync:
+            frames = [view.snapshot(connection.encoding, "resync")]
+        else:
+            frames = spectator.frames
+        if not frames:
+            return True
+
+        if not connection.push_nowait(b"".join(frames)):
+            return False
+
+        spectator.blocked_since = None
+        self.messages += len(frames)
+        spectator.frames = list()
+        spectator.resync = False
+        return connection.drain_nowait()
+
+    def _stop_watching(self, game_name: str, view: GameView, connection: FramedConnection):
+        del view.spectators[connection]
+        if not view.spectators and self.views.get(game_name) is view:
+            del self.views[game_name]